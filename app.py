@@ -2,11 +2,26 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 from pathlib import Path
-import joblib 
 # import matplotlib.pyplot as plt
 # import seaborn as sns
 import plotly.express as px # <--- Graficos
-from backend_tasks import processar_nova_base, treinar_novo_modelo 
+import plotly.graph_objects as go
+import json
+import time
+import uuid
+from backend_tasks import (pontuar_lote, caminho_do_codificador, caminho_do_relatorio_selecao, ORCAMENTO_SELECAO_S,
+                           MOTORES_CLASSIFICADOR, MOTOR_PADRAO,
+                           codificar_linha, MEDIDA_CONTAGEM, carregar_snapshot, compactar_dataframe,
+                           conectar_somente_leitura, ler_esquema_tabela, tabela_existe, ler_estatisticas,
+                           estatisticas_da_tabela, quantil_aproximado, moda, tabela_histograma)
+from artefato_modelo import COMPRESSOES, COMPRESSAO_PADRAO, carregar_artefato
+from avaliador_floresta import compilar_floresta, prever_com_probabilidades
+from tarefas import (ESTADOS_ATIVOS, enfileirar_tarefa, listar_tarefas, obter_pool, salvar_envio,
+                     tabela_de_tarefas)
+from geracao import ler_geracao, caminho_publicado
+from instrumentacao import listar_perfis, tabela_de_perfis, tabela_de_etapas
+from consultas import (AGREGACOES, consultar_agregado, montar_consulta_rollup, grade_densidade,
+                       amostra_estratificada, retas_de_regressao)
 
 # ==============================================================================
 # CONFIGURAÇÃO DA PÁGINA E CAMINHOS
@@ -16,9 +31,20 @@ st.set_page_config(layout="wide", page_title="Análise de CyberSecurity")
 # --- Definição de Caminhos ---
 caminho_projeto = Path(".") 
 caminho_pasta_csv = caminho_projeto / "CyberSec" 
-caminho_db = caminho_pasta_csv / "CyberSec.db" 
+# Geração publicada da base e do modelo (trocada pelas tarefas só depois de
+# validada): define os arquivos lidos nesta execução e entra na chave dos caches
+geracao_atual = ler_geracao(caminho_pasta_csv)
+GERACAO_BASE = geracao_atual['base']
+GERACAO_MODELO = geracao_atual['modelo']
+caminho_db = caminho_publicado(caminho_pasta_csv, 'base', geracao_atual)
 NOME_TABELA = 'CyberSec_data'
-CAMINHO_MODELO = caminho_pasta_csv / 'modelo_classificador.pkl' 
+CAMINHO_MODELO = caminho_publicado(caminho_pasta_csv, 'modelo', geracao_atual)
+CAMINHO_CODIFICADOR = caminho_do_codificador(CAMINHO_MODELO)
+# Um arquivo por pontuação (cada sessão baixa só o próprio resultado)
+CAMINHO_PONTUACOES = caminho_pasta_csv / 'pontuacoes'
+VALIDADE_PONTUACAO_S = 24 * 60 * 60
+CAMINHO_CONTROLE = caminho_pasta_csv / 'controle.db'
+CAMINHO_ENVIOS = caminho_pasta_csv / 'envios'
 
 caminho_pasta_csv.mkdir(exist_ok=True)
 
@@ -26,45 +52,207 @@ caminho_pasta_csv.mkdir(exist_ok=True)
 # VERIFICAÇÃO INICIAL DE ARQUIVOS
 # ==============================================================================
 db_existe = caminho_db.exists()
-modelo_existe = CAMINHO_MODELO.exists()
+modelo_existe = CAMINHO_MODELO.exists() and CAMINHO_CODIFICADOR.exists()
 setup_necessario = not (db_existe and modelo_existe)
 
 # ==============================================================================
 # FUNÇÕES DE CACHE
 # ==============================================================================
-@st.cache_resource
-def carregar_modelo(caminho):
-    if not modelo_existe:
+# Resultados de consultas são pequenos, mas variam com cada filtro escolhido:
+# limitados em quantidade e em tempo (os de gerações antigas saem sozinhos)
+TTL_CONSULTAS = 60 * 60
+
+@st.cache_resource(max_entries=2)
+def carregar_modelo(caminho, geracao):
+    """Modelo, codificador e manifesto do artefato salvo pelo treino (None se não houver)."""
+    if not (Path(caminho).exists() and caminho_do_codificador(caminho).exists()):
         print("Arquivo de modelo não encontrado. Pulando o carregamento.")
-        return None
-    print(f"Carregando modelo de: {caminho}")
+        return None, None, None
+    print(f"Carregando modelo de: {caminho} (geração {geracao})")
     try:
-        modelo = joblib.load(caminho)
-        return modelo
-    except FileNotFoundError:
+        return carregar_artefato(caminho)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Não foi possível carregar o modelo: {e}")
+        return None, None, None
+
+@st.cache_resource(max_entries=2)
+def compilar_modelo(caminho, geracao, _modelo):
+    """Floresta achatada em arrays para o simulador (None se o modelo não for uma floresta)."""
+    if _modelo is None:
         return None
+    print(f"Compilando a floresta de: {caminho}")
+    return compilar_floresta(_modelo)
 
-@st.cache_data
-def carregar_dados_completos(db_path, query):
-    if not db_existe:
+@st.cache_data(max_entries=256, ttl=TTL_CONSULTAS)
+def carregar_dados_completos(db_path, geracao, query, params=()):
+    if not Path(db_path).exists():
         return pd.DataFrame() 
         
     print(f"Carregando dados do banco: {db_path}")
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query(query, conn)
+    conn = conectar_somente_leitura(db_path)
+    df = pd.read_sql_query(query, conn, params=params)
     conn.close()
     return df
 
+@st.cache_resource(max_entries=2)
+def carregar_base(db_path, geracao):
+    # Objeto compartilhado entre as sessões (cache_resource): os arquivos do snapshot
+    # ficam mapeados em memória em vez de serem copiados a cada execução da página.
+    # Retorna a base já compactada e o relatório de memória por coluna.
+    if not Path(db_path).exists():
+        return pd.DataFrame(), pd.DataFrame()
+    df = carregar_snapshot(db_path, NOME_TABELA)
+    if df is None:
+        # Base publicada sem snapshot (ou com um desatualizado): a geração só é
+        # lida; o snapshot volta na próxima carga
+        df = carregar_dados_completos(db_path, geracao, f"SELECT * FROM {NOME_TABELA}")
+    else:
+        print(f"Base carregada do snapshot colunar: {len(df):,} linhas")
+    return compactar_dataframe(df)
+
+@st.cache_data(max_entries=2)
+def carregar_estatisticas(db_path, geracao):
+    # Vocabulários, medianas e histogramas calculados na ingestão: poucas linhas,
+    # qualquer que seja o tamanho da base. Numa base publicada antes deles, são
+    # calculados em memória (uma vez por geração) sem gravar nada no banco.
+    if not Path(db_path).exists():
+        return {}
+    conn = conectar_somente_leitura(db_path)
+    try:
+        estatisticas = ler_estatisticas(conn, NOME_TABELA)
+        if not estatisticas:
+            print("Base sem estatísticas gravadas: calculando em memória...")
+            estatisticas = estatisticas_da_tabela(conn, NOME_TABELA, ler_esquema_tabela(conn, NOME_TABELA))
+        return estatisticas
+    finally:
+        conn.close()
+
+@st.cache_data(max_entries=2)
+def base_tem_rollups(db_path, geracao):
+    # Bases publicadas antes dos resumos pré-agregados são agregadas direto da tabela
+    if not Path(db_path).exists():
+        return False
+    conn = conectar_somente_leitura(db_path)
+    try:
+        return tabela_existe(conn, f"{NOME_TABELA}_rollups")
+    finally:
+        conn.close()
+
+@st.cache_data(max_entries=64, ttl=TTL_CONSULTAS)
+def carregar_agregado(db_path, geracao, col_x, col_y, agregacao):
+    # 'geracao' só entra na chave do cache: depois de uma nova carga a consulta roda de novo
+    print(f"Consultando {agregacao} de '{col_y}' por '{col_x}' (geração {geracao})")
+    return consultar_agregado(db_path, NOME_TABELA, col_x, col_y, agregacao)
+
+@st.cache_data(max_entries=8, ttl=TTL_CONSULTAS)
+def resumir_dispersao(_df, geracao, col_x, col_y, col_grupo, modo):
+    # '_df' não entra no hash do cache (seria caro); a 'geracao' da base identifica os dados
+    retas = retas_de_regressao(_df, col_x, col_y, col_grupo)
+    if modo == "Mapa de densidade":
+        pontos = grade_densidade(_df, col_x, col_y)
+    else:
+        pontos = amostra_estratificada(_df[[col_x, col_y, col_grupo]].dropna(), col_grupo)
+    return pontos, retas
+
+def carregar_rollup(dim_a, dim_b='', medida=MEDIDA_CONTAGEM):
+    """
+    Lê da tabela de resumos só os grupos de uma coluna (ou par de colunas) e
+    medida: poucas linhas, qualquer que seja o tamanho da base.
+    """
+    query, params = montar_consulta_rollup(NOME_TABELA, dim_a, dim_b, medida,
+                                           rollups=base_tem_rollups(caminho_db, GERACAO_BASE))
+    return carregar_dados_completos(caminho_db, GERACAO_BASE, query, params)
+
+def opcoes_da_coluna(col):
+    """Valores distintos de uma coluna categórica (sem os vazios), em ordem, do vocabulário da ingestão."""
+    return sorted((estatisticas.get(col) or {}).get('vocabulario') or {})
+
+def apagar_pontuacoes_antigas():
+    # Resultados de sessões que já terminaram (nenhuma sessão guarda um arquivo por mais de um dia)
+    limite = time.time() - VALIDADE_PONTUACAO_S
+    for arquivo in CAMINHO_PONTUACOES.glob('pontuacao_*.csv'):
+        if arquivo.stat().st_mtime < limite:
+            arquivo.unlink(missing_ok=True)
+
+# ==============================================================================
+# TAREFAS EM SEGUNDO PLANO (Carga e treino fora da sessão do Streamlit)
+# ==============================================================================
+# Na primeira execução do servidor, marca as tarefas que ficaram pela metade
+obter_pool(CAMINHO_CONTROLE)
+
+@st.cache_resource
+def geracoes_em_cache():
+    # Gerações (e os arquivos delas) cujos objetos grandes estão no cache, para todas as sessões
+    return {'base': GERACAO_BASE, 'modelo': GERACAO_MODELO, 'caminho_base': caminho_db, 'caminho_modelo': CAMINHO_MODELO}
+
+# Uma tarefa publicou uma nova geração: descarta só a base ou o modelo da
+# geração substituída, pelos arquivos dela (que a coleta pode já ter apagado;
+# as consultas antigas saem pelo limite de entradas e pelo TTL)
+geracoes_anteriores = geracoes_em_cache()
+if geracoes_anteriores['base'] != GERACAO_BASE:
+    print(f"Nova geração da base ({geracoes_anteriores['base']} -> {GERACAO_BASE}): descartando a anterior do cache.")
+    carregar_base.clear(geracoes_anteriores['caminho_base'], geracoes_anteriores['base'])
+    carregar_estatisticas.clear(geracoes_anteriores['caminho_base'], geracoes_anteriores['base'])
+    base_tem_rollups.clear(geracoes_anteriores['caminho_base'], geracoes_anteriores['base'])
+    geracoes_anteriores.update(base=GERACAO_BASE, caminho_base=caminho_db)
+if geracoes_anteriores['modelo'] != GERACAO_MODELO:
+    print(f"Nova geração do modelo ({geracoes_anteriores['modelo']} -> {GERACAO_MODELO}): descartando a anterior do cache.")
+    carregar_modelo.clear(geracoes_anteriores['caminho_modelo'], geracoes_anteriores['modelo'])
+    compilar_modelo.clear(geracoes_anteriores['caminho_modelo'], geracoes_anteriores['modelo'], None)
+    geracoes_anteriores.update(modelo=GERACAO_MODELO, caminho_modelo=CAMINHO_MODELO)
+
+def painel_de_tarefas():
+    """Progresso das tarefas (consultado de novo a cada poucos segundos enquanto houver alguma ativa)."""
+    tarefas = listar_tarefas(CAMINHO_CONTROLE)
+    ativas = [tarefa for tarefa in tarefas if tarefa['estado'] in ESTADOS_ATIVOS]
+    if st.session_state.get('tarefas_em_andamento') and not ativas:
+        # Uma tarefa acabou: recarrega o app inteiro (a nova geração é lida no início)
+        st.session_state['tarefas_em_andamento'] = False
+        st.rerun()
+    st.session_state['tarefas_em_andamento'] = bool(ativas)
+
+    for tarefa in reversed(ativas):
+        st.write(f"**Tarefa #{tarefa['id']}** ({tarefa['parametros'].get('nome_arquivo', '')}): {tarefa['etapa']}")
+        progresso = tarefa['progresso'] or {}
+        if progresso.get('total'):
+            st.progress(progresso['arvores'] / progresso['total'],
+                        text=f"{progresso['arvores']} de {progresso['total']} árvores ajustadas")
+        elif progresso.get('rodadas'):
+            st.progress((progresso['rodada'] - 1) / progresso['rodadas'],
+                        text=f"Rodada {progresso['rodada']} de {progresso['rodadas']}: {progresso['candidatos']} "
+                             f"candidatos com {progresso['amostra']:,} linhas")
+        elif 'linhas_lidas' in progresso:
+            st.caption(f"{progresso['linhas_lidas']:,} linhas lidas")
+
+    if tarefas:
+        st.subheader("Tarefas Recentes")
+        st.dataframe(tabela_de_tarefas(tarefas), hide_index=True, use_container_width=True)
+
+    # Resultado da última atualização incremental do modelo
+    resultado = next((tarefa['resultado'] for tarefa in tarefas
+                      if tarefa['resultado'] and 'acuracia' in tarefa['resultado']), None)
+    if resultado is not None:
+        st.subheader("Última Atualização Incremental")
+        st.write(f"{resultado['linhas_novas']:,} incidentes novos; árvores na floresta: "
+                 f"{resultado['arvores_antes']} → {resultado['arvores_depois']}.")
+        colunas_metricas = st.columns(len(resultado['acuracia']))
+        for coluna_metrica, (conjunto, acuracia) in zip(colunas_metricas, resultado['acuracia'].items()):
+            coluna_metrica.metric(f"Acurácia – {conjunto}", f"{acuracia['depois'] * 100:.2f}%",
+                                  delta=f"{(acuracia['depois'] - acuracia['antes']) * 100:+.2f} p.p.")
+
 # ==============================================================================
 # CARREGAMENTO INICIAL
 # ==============================================================================
-modelo = carregar_modelo(CAMINHO_MODELO)
-df_original = carregar_dados_completos(caminho_db, f"SELECT * FROM {NOME_TABELA}")
+modelo, codificador, manifesto_modelo = carregar_modelo(CAMINHO_MODELO, GERACAO_MODELO)
+floresta_compilada = compilar_modelo(CAMINHO_MODELO, GERACAO_MODELO, modelo)
+# A base inteira só é carregada nas páginas que precisam das linhas (Análise
+# Exploratória e o relatório de memória); o resto usa as estatísticas da ingestão
+estatisticas = carregar_estatisticas(caminho_db, GERACAO_BASE)
 
-# Listas de colunas (só as preenche se o df_original não estiver vazio)
+# Listas de colunas (só as preenche se a base tiver estatísticas)
 colunas_categoricas_plot = []
 colunas_numericas_plot = []
-if not df_original.empty:
+if estatisticas:
     colunas_categoricas_plot = [
         'Attack Source', 'Attack Type', 'Country', 'Defense Mechanism Used', 
         'Security Vulnerability Type', 'Target Industry', 'Year'
@@ -72,14 +260,14 @@ if not df_original.empty:
     colunas_numericas_plot = [
         'Financial Loss (in Million $)', 'Incident Resolution Time (in Hours)', 'Number of Affected Users'
     ]
-    colunas_categoricas_plot = [col for col in colunas_categoricas_plot if col in df_original.columns]
-    colunas_numericas_plot = [col for col in colunas_numericas_plot if col in df_original.columns]
+    colunas_categoricas_plot = [col for col in colunas_categoricas_plot if col in estatisticas]
+    colunas_numericas_plot = [col for col in colunas_numericas_plot if col in estatisticas]
 
 # ==============================================================================
 # INTERFACE DO USUÁRIO (Sidebar de Navegação)
 # ==============================================================================
 st.sidebar.title("Navegação")
-pagina_opcoes = ["Atualizar Base de Dados", "Análise Exploratória", "Simulador de Predição"]
+pagina_opcoes = ["Atualizar Base de Dados", "Análise Exploratória", "Simulador de Predição", "Pontuação em Lote"]
 default_index = 0 if setup_necessario else 1 
 
 if setup_necessario:
@@ -87,6 +275,11 @@ if setup_necessario:
 
 pagina = st.sidebar.radio("Selecione uma página:", pagina_opcoes, index=default_index)
 
+for tarefa in listar_tarefas(CAMINHO_CONTROLE, limite=5):
+    if tarefa['estado'] in ESTADOS_ATIVOS:
+        st.sidebar.info(f"Tarefa #{tarefa['id']} em andamento: {tarefa['etapa']}. "
+                        "Acompanhe em 'Atualizar Base de Dados'.")
+
 
 # =_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=
 # PÁGINA 1: ATUALIZAR BASE DE DADOS
@@ -94,7 +287,63 @@ pagina = st.sidebar.radio("Selecione uma página:", pagina_opcoes, index=default
 if pagina == "Atualizar Base de Dados":
     st.title("Atualizar Base de Dados e Re-treinar Modelo")
     
-    st.warning("Atenção: Este processo irá substituir a base de dados e o modelo de ML existentes.")
+    opcoes_modo = {"Substituir a base atual": 'substituir', "Anexar à base atual": 'anexar'}
+    modo_escolhido = st.radio("Modo de atualização:", list(opcoes_modo), horizontal=True, disabled=not db_existe)
+    modo_ingestao = opcoes_modo[modo_escolhido] if db_existe else 'substituir'
+    chave_dedupe = None
+    
+    if modo_ingestao == 'substituir':
+        st.warning("Atenção: Este processo irá substituir a base de dados e o modelo de ML existentes.")
+    else:
+        st.info("Os incidentes enviados serão adicionados ao histórico. Arquivos que já foram enviados antes "
+                "(mesmo conteúdo) são ignorados, e colunas novas são incluídas na base automaticamente.")
+        chave_dedupe = st.multiselect(
+            "Colunas que identificam um incidente (opcional, para descartar linhas repetidas):",
+            options=list(estatisticas)
+        ) or None
+
+    # Atualização incremental: só faz sentido ao anexar e com um modelo já treinado
+    opcoes_treino = {"Re-treino completo": 'completo', "Atualização incremental (novas árvores)": 'incremental'}
+    treino_escolhido = st.radio("Treinamento do modelo:", list(opcoes_treino), horizontal=True,
+                                disabled=modo_ingestao != 'anexar' or modelo is None,
+                                help="A atualização incremental acrescenta árvores treinadas só com os incidentes "
+                                     "novos e descarta as mais antigas. Se surgirem categorias ou tipos de ataque "
+                                     "novos, o re-treino completo é feito automaticamente.")
+    modo_treino = opcoes_treino[treino_escolhido] if modo_ingestao == 'anexar' and modelo is not None else 'completo'
+    # O motor do modelo atual vem selecionado; a atualização incremental sempre mantém o motor salvo
+    motor_atual = codificador.get('motor', MOTOR_PADRAO) if codificador else MOTOR_PADRAO
+    motor = st.selectbox(
+        "Motor de classificação:", list(MOTORES_CLASSIFICADOR), index=list(MOTORES_CLASSIFICADOR).index(motor_atual),
+        format_func=lambda chave: MOTORES_CLASSIFICADOR[chave]['rotulo'], disabled=modo_treino != 'completo',
+        help="Florestas usam as categorias em One-Hot (uma coluna por valor). O Gradient Boosting por histograma "
+             "usa cada categoria como uma única coluna, sem dummies, e não suporta a atualização incremental "
+             "(ela vira um re-treino completo)."
+    )
+    orcamento_selecao = st.number_input(
+        "Orçamento da seleção de modelo (segundos):", min_value=0, value=ORCAMENTO_SELECAO_S, step=30,
+        disabled=modo_treino != 'completo',
+        help="Tempo para comparar os classificadores candidatos (successive halving) antes do treino final. "
+             "Use 0 para treinar direto o candidato padrão do motor."
+    )
+    # Formato do artefato salvo; a atualização incremental mantém o do modelo atual
+    with st.expander("Formato do modelo salvo"):
+        compressao = st.selectbox(
+            "Compressão:", list(COMPRESSOES), index=list(COMPRESSOES).index(COMPRESSAO_PADRAO),
+            disabled=modo_treino != 'completo',
+            help="Sem compressão a carga é mais rápida (nada a descompactar); "
+                 "com compressão o arquivo fica menor, mas a carga descompacta tudo."
+        )
+        col_profundidade, col_folhas = st.columns(2)
+        max_profundidade = col_profundidade.number_input(
+            "Profundidade máxima das árvores (0 = sem limite):", min_value=0, value=0, step=1,
+            disabled=modo_treino != 'completo'
+        )
+        max_folhas = col_folhas.number_input(
+            "Máximo de folhas por árvore (0 = sem limite):", min_value=0, value=0, step=100,
+            disabled=modo_treino != 'completo',
+            help="As florestas são podadas depois do treino, mantendo as divisões com mais incidentes. "
+                 "A acurácia exibida já é a do modelo podado."
+        )
     
     uploaded_file = st.file_uploader(
         "Selecione um arquivo .zip ou .csv",
@@ -105,46 +354,130 @@ if pagina == "Atualizar Base de Dados":
     if st.button("Processar e Treinar Nova Base"):
         if uploaded_file is not None:
             try:
-                # --- Etapa 1: Processar a Base ---
-                with st.spinner("Etapa 1/2: Processando nova base de dados... Isso pode levar vários minutos."):
-                    sucesso_db, msg_db = processar_nova_base(
-                        uploaded_file=uploaded_file,
-                        db_path=caminho_db,
-                        table_name=NOME_TABELA
-                    )
-                if not sucesso_db:
-                    st.error(f"Falha ao processar a base: {msg_db}")
-                else:
-                    st.success(f"Etapa 1/2: {msg_db}")
-                    
-                    # --- Etapa 2: Treinar o Modelo ---
-                    with st.spinner("Etapa 2/2: Treinando novo modelo de Machine Learning..."):
-                        sucesso_ml, msg_ml = treinar_novo_modelo(
-                            db_path=caminho_db,
-                            table_name=NOME_TABELA,
-                            model_save_path=CAMINHO_MODELO 
-                        )
-                    if not sucesso_ml:
-                        st.error(f"Falha ao treinar o modelo: {msg_ml}")
-                    else:
-                        st.success(f"Etapa 2/2: {msg_ml}")
-                        
-                        st.info("Limpando cache e recarregando a aplicação...")
-                        st.cache_data.clear()
-                        st.cache_resource.clear()
-                        st.rerun() 
-
+                # A carga e o treino rodam em outro processo: a página continua livre
+                # e o trabalho não se perde se o navegador for fechado
+                parametros = salvar_envio(CAMINHO_ENVIOS, uploaded_file)
+                parametros.update({
+                    'pasta_dados': str(caminho_pasta_csv),
+                    'table_name': NOME_TABELA,
+                    'modo': modo_ingestao,
+                    'chave_dedupe': chave_dedupe,
+                    'modo_treino': modo_treino,
+                    'orcamento_selecao': orcamento_selecao,
+                    'motor': motor,
+                    'compressao': compressao,
+                    'max_profundidade': max_profundidade or None,
+                    'max_folhas': max_folhas or None,
+                })
+                tarefa_id = enfileirar_tarefa(CAMINHO_CONTROLE, 'carga_e_treino', parametros)
+                st.success(f"Tarefa #{tarefa_id} enviada para a fila. Acompanhe o progresso abaixo; "
+                           "a aplicação será recarregada quando ela terminar.")
             except Exception as e:
                 st.error(f"Um erro inesperado ocorreu: {e}")
         else:
             st.error("Por favor, selecione um arquivo para enviar.")
 
+    # Enquanto houver tarefa ativa, o painel é atualizado a cada 2 segundos
+    ha_tarefas_ativas = any(tarefa['estado'] in ESTADOS_ATIVOS for tarefa in listar_tarefas(CAMINHO_CONTROLE))
+    st.fragment(painel_de_tarefas, run_every=2 if ha_tarefas_ativas else None)()
+
+    # --- Perfil de cada execução (tempo, CPU e memória por etapa da carga e do treino) ---
+    perfis = listar_perfis(CAMINHO_CONTROLE)
+    if perfis:
+        with st.expander("Histórico de Execuções (Tempo e Memória por Etapa)"):
+            st.dataframe(tabela_de_perfis(perfis), hide_index=True, use_container_width=True)
+            perfis_por_rotulo = {
+                f"Execução #{perfil['id']} (tarefa #{perfil['tarefa_id']}, {perfil['iniciado_em']})": perfil
+                for perfil in perfis
+            }
+            perfil_escolhido = perfis_por_rotulo[st.selectbox("Detalhar a execução:", list(perfis_por_rotulo))]
+            tabela_etapas = tabela_de_etapas(perfil_escolhido['etapas'])
+            if not tabela_etapas.empty:
+                # Numeradas: uma etapa pode se repetir (ex.: ajuste de mais de um finalista)
+                tabela_etapas['Etapa'] = [f"{i}. {etapa}" for i, etapa in enumerate(tabela_etapas['Etapa'], start=1)]
+                fig_etapas = px.bar(
+                    tabela_etapas, x='Tempo (s)', y='Etapa', color='Fase', orientation='h',
+                    hover_data=['CPU (s)', 'Pico de memória (MB)', 'Linhas', '% do tempo'],
+                    title="Tempo por etapa"
+                )
+                fig_etapas.update_yaxes(categoryorder='array', categoryarray=tabela_etapas['Etapa'].tolist()[::-1])
+                st.plotly_chart(fig_etapas, use_container_width=True)
+                st.dataframe(tabela_etapas, hide_index=True, use_container_width=True)
+
+            # Vazão pedaço a pedaço: mostra se a carga ou a leitura desaceleram ao longo da execução
+            linhas_pedacos = [
+                {'Etapa': etapa['etapa'], 'Pedaço': i, 'Linhas/s': pedaco['linhas'] / pedaco['tempo_s']}
+                for etapa in perfil_escolhido['etapas']
+                for i, pedaco in enumerate(etapa['pedacos'], start=1) if pedaco['tempo_s']
+            ]
+            if linhas_pedacos:
+                fig_pedacos = px.line(pd.DataFrame(linhas_pedacos), x='Pedaço', y='Linhas/s', color='Etapa',
+                                      markers=True, title="Vazão por pedaço")
+                st.plotly_chart(fig_pedacos, use_container_width=True)
+    
+    # --- Arquivos que compõem a base atual (com o dialeto detectado na ingestão) ---
+    if db_existe:
+        try:
+            df_arquivos = carregar_dados_completos(caminho_db, GERACAO_BASE, f"SELECT * FROM {NOME_TABELA}_arquivos")
+        except Exception:
+            df_arquivos = pd.DataFrame()
+        if not df_arquivos.empty:
+            st.subheader("Arquivos da Base Atual")
+            st.write("Dialeto detectado automaticamente em cada arquivo:")
+            df_arquivos['separador'] = df_arquivos['separador'].replace({'\t': 'TAB'})
+            if 'hash_sha256' in df_arquivos.columns:
+                df_arquivos['hash_sha256'] = df_arquivos['hash_sha256'].str[:12]
+            df_arquivos.index = pd.RangeIndex(start=1, stop=len(df_arquivos) + 1, step=1)
+            st.dataframe(df_arquivos, use_container_width=True)
+
+    # --- Memória ocupada pela base carregada no app (tipos compactos) ---
+    relatorio_memoria = carregar_base(caminho_db, GERACAO_BASE)[1] if not setup_necessario else pd.DataFrame()
+    if not relatorio_memoria.empty:
+        with st.expander("Uso de Memória da Base Carregada"):
+            total_antes = relatorio_memoria['Memória antes (MB)'].sum()
+            total_depois = relatorio_memoria['Memória depois (MB)'].sum()
+            st.write(f"Total: **{total_antes:,.1f} MB** → **{total_depois:,.1f} MB** "
+                     f"({total_antes / max(total_depois, 1e-9):.1f}x menor)")
+            st.dataframe(relatorio_memoria.round(2), use_container_width=True, hide_index=True)
+
+    # --- Relatório da seleção de modelo do último treino completo ---
+    caminho_relatorio = caminho_do_relatorio_selecao(CAMINHO_MODELO)
+    if caminho_relatorio.exists():
+        with st.expander("Seleção de Modelo do Último Treino"):
+            relatorio_selecao = json.loads(caminho_relatorio.read_text(encoding='utf-8'))
+            escolhido = relatorio_selecao['escolhido']
+            motor_relatorio = MOTORES_CLASSIFICADOR.get(relatorio_selecao.get('motor', MOTOR_PADRAO), {})
+            st.write(f"Motor: **{motor_relatorio.get('rotulo', relatorio_selecao.get('motor'))}**. "
+                     f"Modelo escolhido: **{escolhido['nome']}** (seleção em {relatorio_selecao['tempo_selecao_s']:.0f}s "
+                     f"de um orçamento de {relatorio_selecao['orcamento_s']:.0f}s).")
+            col_acc, col_ajuste, col_latencia, col_tamanho = st.columns(4)
+            col_acc.metric("Acurácia (teste)", f"{escolhido['acuracia_teste'] * 100:.2f}%")
+            col_ajuste.metric("Tempo de ajuste", f"{escolhido['tempo_ajuste_s']:.1f} s")
+            col_latencia.metric("Latência por incidente", f"{escolhido['latencia_ms']:.1f} ms")
+            col_tamanho.metric("Tamanho do modelo", f"{escolhido['tamanho_mb']:.1f} MB")
+            if manifesto_modelo:
+                poda = manifesto_modelo.get('poda')
+                st.caption(f"Arquivo salvo: {manifesto_modelo['modelo']['bytes'] / 1e6:.1f} MB, compressão "
+                           f"'{manifesto_modelo['modelo']['compressao']}'"
+                           + (f", poda de {poda['nos_antes']:,} para {poda['nos_depois']:,} nós" if poda else "")
+                           + f" (formato v{manifesto_modelo['versao_formato']}).")
+            linhas_rodadas = [
+                {'Rodada': rodada['rodada'], 'Linhas': rodada['amostra'], 'Candidato': candidato['nome'],
+                 'Acurácia (%)': candidato['acuracia'] * 100, 'Ajuste (s)': candidato['tempo_ajuste_s'],
+                 'Latência (ms)': candidato['latencia_ms'], 'Tamanho (MB)': candidato['tamanho_mb'],
+                 'Dentro dos limites': candidato['dentro_dos_limites']}
+                for rodada in relatorio_selecao['rodadas'] for candidato in rodada['candidatos']
+            ]
+            if linhas_rodadas:
+                st.dataframe(pd.DataFrame(linhas_rodadas).round(2), use_container_width=True, hide_index=True)
+
 # =_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=
 # PÁGINA 2: ANÁLISE EXPLORATÓRIA
 # =_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=
 elif pagina == "Análise Exploratória":
     st.title("Painel de Análise Exploratória de Incidentes")
     
+    df_original = carregar_base(caminho_db, GERACAO_BASE)[0] if not setup_necessario else pd.DataFrame()
     if setup_necessario or df_original.empty or not colunas_categoricas_plot or not colunas_numericas_plot:
         st.warning("Nenhum dado ou modelo encontrado. Por favor, carregue uma base de dados na página 'Atualizar Base de Dados'.")
     else:
@@ -154,10 +487,12 @@ elif pagina == "Análise Exploratória":
         # ==============================================================================
         st.header("Resumo Geral da Base de Dados")
 
-        total_linhas = df_original.shape[0]
-        total_prejuizo = df_original['Financial Loss (in Million $)'].sum()
-        tipos_ataque_unicos = sorted(df_original['Attack Type'].unique())
-        paises_unicos = sorted(df_original['Country'].unique())
+        # Métricas vêm das estatísticas das colunas; mapa, tabelas e gráficos de
+        # barras, dos resumos pré-agregados ('<tabela>_rollups'). Ambos gerados na ingestão
+        total_linhas = max(estatistica['linhas'] for estatistica in estatisticas.values())
+        total_prejuizo = estatisticas.get('Financial Loss (in Million $)', {}).get('soma') or 0
+        tipos_ataque_unicos = opcoes_da_coluna('Attack Type')
+        paises_unicos = opcoes_da_coluna('Country')
         
         tooltip_ataques = f"Códigos encontrados: {', '.join(map(str, tipos_ataque_unicos))}"
         tooltip_paises = f"Códigos encontrados: {', '.join(map(str, paises_unicos))}"
@@ -187,7 +522,7 @@ elif pagina == "Análise Exploratória":
         st.info("Nota: Este mapa traduz os códigos de país do seu dataset (ex: 'UK') para códigos ISO padrão (ex: 'GBR') para colorir o mapa-múndi.")
 
         try:
-            contagem_paises = df_original['Country'].value_counts().reset_index()
+            contagem_paises = carregar_rollup('Country')[['val_a', 'contagem']].sort_values('contagem', ascending=False)
             contagem_paises.columns = ['Country_Code', 'Contagem']
             contagem_paises['ISO_Code'] = contagem_paises['Country_Code'].map(MAPA_ISO)
             df_mapa = contagem_paises.dropna(subset=['ISO_Code'])
@@ -218,7 +553,7 @@ elif pagina == "Análise Exploratória":
 
         with col_t1:
             st.write("Por Tipo de Ataque:")
-            df_dist_ataque = df_original['Attack Type'].value_counts().reset_index()
+            df_dist_ataque = carregar_rollup('Attack Type')[['val_a', 'contagem']].sort_values('contagem', ascending=False, kind='stable')
             df_dist_ataque.columns = ['Attack Type', 'Contagem']
             df_dist_ataque['Percentual (%)'] = (df_dist_ataque['Contagem'] / total_linhas * 100).round(2)
             df_dist_ataque.index = pd.RangeIndex(start=1, stop=len(df_dist_ataque) + 1, step=1)
@@ -226,7 +561,7 @@ elif pagina == "Análise Exploratória":
         
         with col_t2:
             st.write("Por Indústria Alvo:")
-            df_dist_industry = df_original['Target Industry'].value_counts().reset_index()
+            df_dist_industry = carregar_rollup('Target Industry')[['val_a', 'contagem']].sort_values('contagem', ascending=False, kind='stable')
             df_dist_industry.columns = ['Target Industry', 'Contagem']
             df_dist_industry['Percentual (%)'] = (df_dist_industry['Contagem'] / total_linhas * 100).round(2)
             df_dist_industry.index = pd.RangeIndex(start=1, stop=len(df_dist_industry) + 1, step=1)
@@ -241,7 +576,8 @@ elif pagina == "Análise Exploratória":
         # --- Gráfico 1: Impacto Financeiro por Tipo de Ataque ---
         st.subheader("Impacto Financeiro Total por Tipo de Ataque") 
         try:
-            df_loss = df_original.groupby("Attack Type", as_index=False)["Financial Loss (in Million $)"].sum()
+            df_loss = carregar_rollup("Attack Type", medida="Financial Loss (in Million $)")[['val_a', 'soma']].fillna(0)
+            df_loss.columns = ["Attack Type", "Financial Loss (in Million $)"]
             fig1 = px.bar(
                 df_loss,
                 x="Attack Type",
@@ -257,17 +593,42 @@ elif pagina == "Análise Exploratória":
 
         # --- Gráfico 2: Relação Usuários Afetados vs. Prejuízo ---
         st.subheader("Relação entre Usuários Afetados e Prejuízo")
+        modo_dispersao = st.radio("Exibição:", ("Mapa de densidade", "Amostra estratificada"), horizontal=True,
+                                  help="Com muitos incidentes, os pontos são resumidos antes de ir para o navegador. "
+                                       "As retas de regressão usam sempre todas as linhas.")
         try:
-            fig2 = px.scatter(
-                df_original,
-                x="Number of Affected Users",
-                y="Financial Loss (in Million $)",
-                title="Relação entre Usuários Afetados e Prejuízo Financeiro",
-                template="plotly_dark",
-                color="Attack Type", # Colore por tipo de ataque para mais insight
-                trendline="ols",     # Adiciona linha de regressão
-                labels={'Number of Affected Users': 'Número de Usuários Afetados', 'Financial Loss (in Million $)': 'Prejuízo (em Milhões de $)'}
-            )
+            col_usuarios, col_prejuizo = "Number of Affected Users", "Financial Loss (in Million $)"
+            pontos, retas = resumir_dispersao(df_original, GERACAO_BASE, col_usuarios, col_prejuizo,
+                                              "Attack Type", modo_dispersao)
+            rotulos = {col_usuarios: 'Número de Usuários Afetados', col_prejuizo: 'Prejuízo (em Milhões de $)'}
+            # Mesma cor para os pontos e a reta de cada tipo de ataque
+            paleta = px.colors.qualitative.Plotly
+            cores = {grupo: paleta[i % len(paleta)] for i, grupo in enumerate(retas["Attack Type"])}
+
+            if modo_dispersao == "Mapa de densidade":
+                fig2 = px.density_heatmap(
+                    pontos, x=col_usuarios, y=col_prejuizo, z="Incidentes", histfunc="sum",
+                    nbinsx=60, nbinsy=60, color_continuous_scale=px.colors.sequential.YlOrRd,
+                    title="Relação entre Usuários Afetados e Prejuízo Financeiro (densidade)",
+                    template="plotly_dark", labels=rotulos
+                )
+            else:
+                fig2 = px.scatter(
+                    pontos, x=col_usuarios, y=col_prejuizo,
+                    title=f"Relação entre Usuários Afetados e Prejuízo Financeiro (amostra de {len(pontos):,} incidentes)",
+                    template="plotly_dark",
+                    color="Attack Type", # Colore por tipo de ataque para mais insight
+                    color_discrete_map=cores, opacity=0.6, labels=rotulos
+                )
+
+            # Retas de regressão (mínimos quadrados) por tipo de ataque
+            for _, reta in retas.dropna(subset=["inclinacao"]).iterrows():
+                grupo = reta["Attack Type"]
+                fig2.add_trace(go.Scatter(
+                    x=[reta["x_min"], reta["x_max"]],
+                    y=[reta["intercepto"] + reta["inclinacao"] * reta["x_min"], reta["intercepto"] + reta["inclinacao"] * reta["x_max"]],
+                    mode="lines", name=f"Tendência: {grupo}", line=dict(color=cores[grupo], width=3)
+                ))
             st.plotly_chart(fig2, use_container_width=True)
         except Exception as e:
             st.error(f"Erro ao gerar Gráfico 2: {e}")
@@ -275,16 +636,28 @@ elif pagina == "Análise Exploratória":
         # --- Gráfico 3: Distribuição do Tempo de Resolução ---
         st.subheader("Distribuição do Tempo de Resolução de Incidentes")
         try:
-            fig3 = px.histogram(
-                df_original,
-                x="Incident Resolution Time (in Hours)",
-                title="Distribuição do Tempo de Resolução de Incidentes",
-                template="plotly_dark",
-                nbins=30,
-                marginal="box", # Adiciona um box plot no topo
-                labels={'Incident Resolution Time (in Hours)': 'Tempo de Resolução (em Horas)', 'count': 'Frequência (Nº de Incidentes)'}
-            )
-            st.plotly_chart(fig3, use_container_width=True)
+            # Histograma gravado na ingestão (até 256 faixas): a base não é percorrida
+            estatistica_tempo = estatisticas.get('Incident Resolution Time (in Hours)') or {}
+            df_hist = tabela_histograma(estatistica_tempo)
+            if df_hist.empty:
+                st.info("A base não tem valores de tempo de resolução.")
+            else:
+                fig3 = px.bar(
+                    df_hist,
+                    x='Início',
+                    y='Contagem',
+                    hover_data=['Fim'],
+                    title="Distribuição do Tempo de Resolução de Incidentes",
+                    template="plotly_dark",
+                    labels={'Início': 'Tempo de Resolução (em Horas)', 'Contagem': 'Frequência (Nº de Incidentes)'}
+                )
+                # Cada barra cobre a faixa inteira [Início, Fim)
+                fig3.update_traces(offset=0, width=float(df_hist['Fim'].iloc[0] - df_hist['Início'].iloc[0]))
+                # Quartis aproximados no lugar do box plot
+                for q, nome in ((0.25, 'Q1'), (0.5, 'Mediana'), (0.75, 'Q3')):
+                    fig3.add_vline(x=quantil_aproximado(estatistica_tempo, q), line_dash='dash',
+                                   annotation_text=nome)
+                st.plotly_chart(fig3, use_container_width=True)
         except Exception as e:
             st.error(f"Erro ao gerar Gráfico 3: {e}")
 
@@ -294,15 +667,12 @@ elif pagina == "Análise Exploratória":
         
         col_x = st.selectbox("Selecione a Categoria (Eixo X):", colunas_categoricas_plot, index=1 if len(colunas_categoricas_plot) > 1 else 0)
         col_y = st.selectbox("Selecione o Valor (Eixo Y):", colunas_numericas_plot, index=0)
-        agregacao = st.radio("Selecione a Agregação:", ("Soma", "Média"), horizontal=True)
+        agregacao = st.radio("Selecione a Agregação:", list(AGREGACOES), horizontal=True)
 
         try:
-            if agregacao == "Soma":
-                df_dynamic = df_original.groupby(col_x, as_index=False)[col_y].sum()
-                titulo_grafico = f'Soma de "{col_y}" por "{col_x}"'
-            else:
-                df_dynamic = df_original.groupby(col_x, as_index=False)[col_y].mean()
-                titulo_grafico = f'Média de "{col_y}" por "{col_x}"'
+            # A agregação roda no SQLite: só uma linha por categoria chega ao app
+            df_dynamic = carregar_agregado(caminho_db, GERACAO_BASE, col_x, col_y, agregacao)
+            titulo_grafico = f'{agregacao} de "{col_y}" por "{col_x}"'
             
             fig4 = px.bar(
                 df_dynamic,
@@ -325,23 +695,28 @@ elif pagina == "Análise Exploratória":
 elif pagina == "Simulador de Predição":
     st.title("Simulador para Predição de Tipo de Ataque")
     
-    if setup_necessario or modelo is None or df_original.empty:
+    if setup_necessario or modelo is None or codificador is None or not estatisticas:
         st.error("Modelo ou banco de dados não encontrado. "
                  "Por favor, carregue e processe uma nova base na página 'Atualizar Base de Dados' primeiro.")
     else:
         st.info("Preencha os dados do incidente. Campos deixados em branco usarão o valor mais neutro (mediano/comum) para a predição.")
+        motor_carregado = MOTORES_CLASSIFICADOR.get(codificador.get('motor', MOTOR_PADRAO), {})
+        versao_artefato = (f", artefato v{manifesto_modelo['versao_formato']} de {manifesto_modelo['criado_em']}"
+                           if manifesto_modelo else "")
+        st.caption(f"Modelo carregado: {type(modelo).__name__} "
+                   f"({motor_carregado.get('rotulo', codificador.get('motor'))}{versao_artefato}).")
         
-        # --- Cálculo dos Valores Padrão (Median/Mode) ---
+        # --- Valores Padrão (Mediana/Moda das estatísticas gravadas na ingestão) ---
         defaults = {
-            'financial_loss': df_original["Financial Loss (in Million $)"].median(),
-            'resolution_time': df_original["Incident Resolution Time (in Hours)"].median(),
-            'affected_users': df_original["Number of Affected Users"].median(),
-            'attack_source': df_original['Attack Source'].mode()[0],
-            'country': df_original['Country'].mode()[0],
-            'defense': df_original['Defense Mechanism Used'].mode()[0],
-            'vulnerability': df_original['Security Vulnerability Type'].mode()[0],
-            'industry': df_original['Target Industry'].mode()[0],
-            'year': df_original['Year'].mode()[0]
+            'financial_loss': quantil_aproximado(estatisticas["Financial Loss (in Million $)"], 0.5),
+            'resolution_time': quantil_aproximado(estatisticas["Incident Resolution Time (in Hours)"], 0.5),
+            'affected_users': quantil_aproximado(estatisticas["Number of Affected Users"], 0.5),
+            'attack_source': moda(estatisticas['Attack Source']),
+            'country': moda(estatisticas['Country']),
+            'defense': moda(estatisticas['Defense Mechanism Used']),
+            'vulnerability': moda(estatisticas['Security Vulnerability Type']),
+            'industry': moda(estatisticas['Target Industry']),
+            'year': moda(estatisticas['Year'])
         }
         
         # --- Formulário de Input ---
@@ -365,24 +740,24 @@ elif pagina == "Simulador de Predição":
             
             with col2:
                 op_nao_informar = "Não Especificar"
-                # Garante que as opções do selectbox sejam únicas
+                # Vocabulário de cada coluna (valores únicos, sem os vazios)
                 attack_source = st.selectbox(
-                    "Fonte do Ataque (Código):", [op_nao_informar] + sorted(df_original['Attack Source'].unique())
+                    "Fonte do Ataque (Código):", [op_nao_informar] + opcoes_da_coluna('Attack Source')
                 )
                 country = st.selectbox(
-                    "País de Origem (Código):", [op_nao_informar] + sorted(df_original['Country'].unique())
+                    "País de Origem (Código):", [op_nao_informar] + opcoes_da_coluna('Country')
                 )
                 defense = st.selectbox(
-                    "Mecanismo de Defesa (Código):", [op_nao_informar] + sorted(df_original['Defense Mechanism Used'].unique())
+                    "Mecanismo de Defesa (Código):", [op_nao_informar] + opcoes_da_coluna('Defense Mechanism Used')
                 )
                 vulnerability = st.selectbox(
-                    "Vulnerabilidade (Código):", [op_nao_informar] + sorted(df_original['Security Vulnerability Type'].unique())
+                    "Vulnerabilidade (Código):", [op_nao_informar] + opcoes_da_coluna('Security Vulnerability Type')
                 )
                 industry = st.selectbox(
-                    "Indústria Alvo (Código):", [op_nao_informar] + sorted(df_original['Target Industry'].unique())
+                    "Indústria Alvo (Código):", [op_nao_informar] + opcoes_da_coluna('Target Industry')
                 )
                 year = st.selectbox(
-                    "Ano:", [op_nao_informar] + sorted(df_original['Year'].unique())
+                    "Ano:", [op_nao_informar] + opcoes_da_coluna('Year')
                 )
             
             submitted = st.form_submit_button("Prever Tipo de Ataque")
@@ -390,35 +765,24 @@ elif pagina == "Simulador de Predição":
         # --- Lógica de Predição ---
         if submitted:
             
-            input_data = {
-                'Attack Source': [defaults['attack_source'] if attack_source == op_nao_informar else attack_source],
-                'Country': [defaults['country'] if country == op_nao_informar else country],
-                'Defense Mechanism Used': [defaults['defense'] if defense == op_nao_informar else defense],
-                'Financial Loss (in Million $)': [defaults['financial_loss'] if financial_loss is None else financial_loss],
-                'Incident Resolution Time (in Hours)': [defaults['resolution_time'] if resolution_time is None else resolution_time],
-                'Number of Affected Users': [defaults['affected_users'] if affected_users is None else affected_users],
-                'Security Vulnerability Type': [defaults['vulnerability'] if vulnerability == op_nao_informar else vulnerability],
-                'Target Industry': [defaults['industry'] if industry == op_nao_informar else industry],
-                'Year': [defaults['year'] if year == op_nao_informar else year]
+            registro = {
+                'Attack Source': defaults['attack_source'] if attack_source == op_nao_informar else attack_source,
+                'Country': defaults['country'] if country == op_nao_informar else country,
+                'Defense Mechanism Used': defaults['defense'] if defense == op_nao_informar else defense,
+                'Financial Loss (in Million $)': defaults['financial_loss'] if financial_loss is None else financial_loss,
+                'Incident Resolution Time (in Hours)': defaults['resolution_time'] if resolution_time is None else resolution_time,
+                'Number of Affected Users': defaults['affected_users'] if affected_users is None else affected_users,
+                'Security Vulnerability Type': defaults['vulnerability'] if vulnerability == op_nao_informar else vulnerability,
+                'Target Industry': defaults['industry'] if industry == op_nao_informar else industry,
+                'Year': defaults['year'] if year == op_nao_informar else year
             }
-            input_df = pd.DataFrame(input_data)
-            
-            # Prepara os dados para o One-Hot Encoding
-            df_para_dummies = pd.concat([df_original.drop(columns=['Attack Type']), input_df], ignore_index=True)
-            df_processado = pd.get_dummies(df_para_dummies, 
-                                           columns=[
-                                               'Attack Source', 'Country', 'Defense Mechanism Used', 
-                                               'Security Vulnerability Type', 'Target Industry', 'Year'
-                                           ], 
-                                           drop_first=True, 
-                                           dtype=int)
             
-            # Pega apenas a última linha (input do usuário)
-            input_final = df_processado.iloc[-1:]
+            # Codifica só a linha do usuário com o esquema salvo no treino
+            input_final = codificar_linha(registro, codificador)
             
             try:
-                predicao = modelo.predict(input_final)
-                predicao_proba = modelo.predict_proba(input_final)
+                # Classe e probabilidades numa única passada pela floresta compilada
+                predicao, predicao_proba = prever_com_probabilidades(modelo, input_final, floresta_compilada)
                 
                 st.subheader("Resultado da Predição")
                 st.success(f"O modelo previu que o **Tipo de Ataque** é: **{predicao[0]}**")
@@ -430,4 +794,67 @@ elif pagina == "Simulador de Predição":
 
             except Exception as e:
                 st.error(f"Erro ao fazer a predição: {e}")
-                st.error("Verifique se as colunas do modelo treinado correspondem às colunas do input.")
\ No newline at end of file
+                st.error("Verifique se as colunas do modelo treinado correspondem às colunas do input.")
+
+# =_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=
+# PÁGINA 4: PONTUAÇÃO EM LOTE
+# =_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=_=
+elif pagina == "Pontuação em Lote":
+    st.title("Pontuação em Lote de Incidentes Abertos")
+    
+    if setup_necessario or modelo is None or codificador is None:
+        st.error("Modelo não encontrado. "
+                 "Por favor, carregue e processe uma nova base na página 'Atualizar Base de Dados' primeiro.")
+    else:
+        st.info("Envie um .csv com os incidentes em aberto (mesmas colunas da base, sem precisar do 'Attack Type'). "
+                "Campos vazios usarão o valor mediano/mais comum da base de treino.")
+        
+        arquivo_lote = st.file_uploader(
+            "Selecione um arquivo .csv",
+            type=['csv'],
+            accept_multiple_files=False,
+            key="uploader_lote"
+        )
+        
+        if st.button("Pontuar Incidentes"):
+            if arquivo_lote is not None:
+                try:
+                    CAMINHO_PONTUACOES.mkdir(exist_ok=True)
+                    apagar_pontuacoes_antigas()
+                    destino = CAMINHO_PONTUACOES / f"pontuacao_{uuid.uuid4().hex}.csv"
+                    with st.spinner("Calculando as probabilidades dos incidentes..."):
+                        sucesso_lote, msg_lote = pontuar_lote(
+                            uploaded_file=arquivo_lote,
+                            model_path=CAMINHO_MODELO,
+                            output_path=destino
+                        )
+                    if not sucesso_lote:
+                        st.error(f"Falha na pontuação: {msg_lote}")
+                    else:
+                        # O resultado anterior desta sessão não é mais oferecido
+                        anterior = st.session_state.get('pontuacao_lote')
+                        st.session_state['pontuacao_lote'] = str(destino)
+                        if anterior:
+                            Path(anterior).unlink(missing_ok=True)
+                        st.success(msg_lote)
+                except Exception as e:
+                    st.error(f"Um erro inesperado ocorreu: {e}")
+            else:
+                st.error("Por favor, selecione um arquivo para enviar.")
+        
+        # --- Resultado da última pontuação concluída nesta sessão ---
+        caminho_resultado = st.session_state.get('pontuacao_lote')
+        if caminho_resultado and Path(caminho_resultado).exists():
+            st.subheader("Resultado da Última Pontuação")
+            st.write("Prévia das primeiras linhas:")
+            df_previa = pd.read_csv(caminho_resultado, sep=';', nrows=20)
+            df_previa.index = pd.RangeIndex(start=1, stop=len(df_previa) + 1, step=1)
+            st.dataframe(df_previa, use_container_width=True)
+            
+            # O arquivo só é lido quando o botão é clicado, e não a cada execução da página
+            st.download_button(
+                "Baixar resultado completo (.csv)",
+                data=lambda: Path(caminho_resultado).read_bytes(),
+                file_name="incidentes_pontuados.csv",
+                mime="text/csv"
+            )
@@ -0,0 +1,321 @@
+"""
+Formato do modelo salvo (artefato versionado).
+
+O treino grava três arquivos na pasta do modelo:
+    modelo_classificador.pkl   -> o classificador (joblib, com ou sem compressão)
+    codificador_features.pkl   -> o codificador de features (vocabulário e ordem das colunas)
+    manifesto_modelo.json      -> versão do formato, bibliotecas usadas, esquema do
+                                  codificador, metadados do treino e o SHA-256 de cada arquivo
+
+Os arquivos são gravados em nomes temporários e trocados de uma vez
+(os.replace); o manifesto é sempre o último, então quem carrega nunca aceita
+um modelo pela metade: se o SHA-256 não bater, a carga falha.
+
+Sem compressão a carga não tem nada a descompactar; com zlib ou lzma o arquivo
+fica menor e a carga, mais lenta. As florestas podem ser podadas antes de
+salvar (profundidade máxima e/ou número máximo de folhas por árvore), o que
+reduz o arquivo e a latência.
+
+Uso (comparação de tamanho e tempo de carga com o pickle atual):
+    python artefato_modelo.py --modelo CyberSec/modelo_classificador.pkl
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.tree import BaseDecisionTree
+from sklearn.tree._tree import TREE_LEAF, TREE_UNDEFINED
+
+VERSAO_ARTEFATO = 1
+
+# Compressões oferecidas: nome -> parâmetro 'compress' do joblib.dump
+COMPRESSOES = {
+    'nenhuma': 0,
+    'zlib': ('zlib', 3),
+    'lzma': ('lzma', 3),
+}
+COMPRESSAO_PADRAO = 'nenhuma'  # Carga mais rápida (nada a descompactar)
+
+# ==============================================================================
+# CAMINHOS DOS ARQUIVOS
+# ==============================================================================
+def caminho_do_codificador(model_save_path):
+    """
+    Retorna o caminho do codificador de features, salvo na mesma pasta do modelo.
+    """
+    return Path(model_save_path).with_name('codificador_features.pkl')
+
+def caminho_do_manifesto(model_save_path):
+    """O manifesto do artefato fica ao lado do modelo."""
+    return Path(model_save_path).with_name('manifesto_modelo.json')
+
+def sha256_do_arquivo(caminho):
+    with open(caminho, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+# ==============================================================================
+# PODA DAS ÁRVORES (Profundidade e número de folhas)
+# ==============================================================================
+def _profundidade_dos_nos(esquerda, direita):
+    """Profundidade de cada nó, calculada nível a nível (sem recursão em Python)."""
+    profundidade = np.zeros(len(esquerda), dtype=np.int64)
+    nivel, fronteira = 0, np.array([0])
+    while fronteira.size:
+        profundidade[fronteira] = nivel
+        filhos = np.concatenate([esquerda[fronteira], direita[fronteira]])
+        fronteira = filhos[filhos != TREE_LEAF]
+        nivel += 1
+    return profundidade
+
+def podar_arvore(arvore, max_profundidade=None, max_folhas=None):
+    """
+    Corta uma árvore do scikit-learn: nenhum nó abaixo de 'max_profundidade'
+    e no máximo 'max_folhas' folhas. As divisões mantidas são as dos nós com
+    mais amostras (o peso de um filho nunca passa o do pai, então o conjunto
+    escolhido é sempre uma subárvore a partir da raiz). Cada nó guarda a
+    distribuição das classes das suas amostras, então o nó cortado vira uma
+    folha que prevê essa distribuição. Retorna o número de nós antes e depois.
+    """
+    estado = arvore.tree_.__getstate__()
+    nos, valores = estado['nodes'], estado['values']
+    n_nos = len(nos)
+    esquerda, direita = nos['left_child'], nos['right_child']
+
+    # Nós internos que podem continuar divididos
+    divididos = esquerda != TREE_LEAF
+    if max_profundidade is not None:
+        divididos &= _profundidade_dos_nos(esquerda, direita) < max_profundidade
+    if max_folhas is not None:
+        candidatos = np.flatnonzero(divididos)
+        # Maior peso primeiro; no empate, o menor índice (o pai vem antes do filho)
+        ordem = np.lexsort((candidatos, -nos['weighted_n_node_samples'][candidatos]))
+        divididos = np.zeros(n_nos, dtype=bool)
+        divididos[candidatos[ordem[:max(max_folhas - 1, 0)]]] = True
+
+    # Mantém a raiz e os filhos dos nós divididos, na ordem original dos índices
+    manter = np.zeros(n_nos, dtype=bool)
+    manter[0] = True
+    manter[esquerda[divididos]] = True
+    manter[direita[divididos]] = True
+    indices = np.flatnonzero(manter)
+    if len(indices) == n_nos:
+        return n_nos, n_nos
+
+    novo_indice = np.full(n_nos, TREE_LEAF)
+    novo_indice[indices] = np.arange(len(indices))
+    novos_nos = nos[indices].copy()
+    folhas = ~divididos[indices]
+    novos_nos['left_child'] = np.where(folhas, TREE_LEAF, novo_indice[novos_nos['left_child']])
+    novos_nos['right_child'] = np.where(folhas, TREE_LEAF, novo_indice[novos_nos['right_child']])
+    novos_nos['feature'][folhas] = TREE_UNDEFINED
+    novos_nos['threshold'][folhas] = TREE_UNDEFINED
+    novos_nos['missing_go_to_left'][folhas] = 0
+
+    estado.update({
+        'max_depth': int(_profundidade_dos_nos(novos_nos['left_child'], novos_nos['right_child']).max()),
+        'node_count': len(indices),
+        'nodes': novos_nos,
+        'values': np.ascontiguousarray(valores[indices]),
+    })
+    arvore.tree_.__setstate__(estado)
+    return n_nos, len(indices)
+
+def podar_floresta(modelo, max_profundidade=None, max_folhas=None):
+    """
+    Aplica 'podar_arvore' a cada árvore de uma floresta (modifica o modelo).
+    Modelos sem árvores do scikit-learn (Gradient Boosting por histograma,
+    Regressão Logística) não são alterados. Retorna o resumo da poda, ou
+    None se nada foi feito.
+    """
+    if max_profundidade is None and max_folhas is None:
+        return None
+    arvores = [arvore for arvore in getattr(modelo, 'estimators_', []) if isinstance(arvore, BaseDecisionTree)]
+    if not arvores:
+        print(f"  - Poda ignorada: {type(modelo).__name__} não é uma floresta de árvores de decisão.")
+        return None
+    nos_antes = nos_depois = 0
+    for arvore in arvores:
+        antes, depois = podar_arvore(arvore, max_profundidade, max_folhas)
+        nos_antes += antes
+        nos_depois += depois
+    print(f"  - Poda: {nos_antes:,} -> {nos_depois:,} nós em {len(arvores)} árvores.")
+    return {'max_profundidade': max_profundidade, 'max_folhas': max_folhas,
+            'nos_antes': nos_antes, 'nos_depois': nos_depois}
+
+# ==============================================================================
+# GRAVAÇÃO E LEITURA DO ARTEFATO
+# ==============================================================================
+def gravar_atomico(destino, gravar):
+    """Grava em um arquivo temporário na mesma pasta e troca pelo destino de uma vez."""
+    destino = Path(destino)
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, prefix=f'.{destino.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        gravar(temporario)
+        # O mkstemp cria o arquivo só para o dono: mantém as permissões do arquivo anterior
+        os.chmod(temporario, destino.stat().st_mode & 0o777 if destino.exists() else 0o644)
+        os.replace(temporario, destino)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+
+def salvar_artefato(model_save_path, modelo, codificador, metadados=None, compressao=COMPRESSAO_PADRAO, poda=None):
+    """
+    Salva o modelo, o codificador e o manifesto. 'metadados' (linhas de treino,
+    acurácia, nome do candidato...) e 'poda' (resumo do 'podar_floresta')
+    vão para o manifesto. Retorna o manifesto gravado.
+    """
+    if compressao not in COMPRESSOES:
+        raise ValueError(f"Compressão inválida: '{compressao}'. Use {list(COMPRESSOES)}.")
+    model_save_path = Path(model_save_path)
+    caminho_codificador = caminho_do_codificador(model_save_path)
+
+    gravar_atomico(model_save_path, lambda f: joblib.dump(modelo, f, compress=COMPRESSOES[compressao]))
+    gravar_atomico(caminho_codificador, lambda f: joblib.dump(codificador, f))
+
+    manifesto = {
+        'versao_formato': VERSAO_ARTEFATO,
+        'criado_em': datetime.now().isoformat(timespec='seconds'),
+        'bibliotecas': {'scikit-learn': sklearn.__version__, 'numpy': np.__version__, 'joblib': joblib.__version__},
+        'modelo': {
+            'arquivo': model_save_path.name,
+            'tipo': type(modelo).__name__,
+            'classes': [str(classe) for classe in getattr(modelo, 'classes_', [])],
+            'compressao': compressao,
+            'bytes': model_save_path.stat().st_size,
+            'sha256': sha256_do_arquivo(model_save_path),
+        },
+        'codificador': {
+            'arquivo': caminho_codificador.name,
+            'formato': codificador.get('formato', 'one_hot'),
+            'motor': codificador.get('motor'),
+            'colunas_categoricas': codificador['colunas_categoricas'],
+            'colunas_numericas': codificador['colunas_numericas'],
+            'n_features': len(codificador['colunas_features']),
+            'bytes': caminho_codificador.stat().st_size,
+            'sha256': sha256_do_arquivo(caminho_codificador),
+        },
+        'poda': poda,
+        'treino': metadados or {},
+    }
+    gravar_atomico(caminho_do_manifesto(model_save_path), lambda f: Path(f).write_text(
+        json.dumps(manifesto, ensure_ascii=False, indent=2, default=str), encoding='utf-8'))
+    return manifesto
+
+def ler_manifesto(model_save_path):
+    """Lê o manifesto do modelo, ou None se o modelo foi salvo antes do formato versionado."""
+    caminho = caminho_do_manifesto(model_save_path)
+    if not caminho.exists():
+        return None
+    return json.loads(caminho.read_text(encoding='utf-8'))
+
+def carregar_artefato(model_save_path, verificar=True):
+    """
+    Carrega (modelo, codificador, manifesto). Com 'verificar', confere o
+    SHA-256 dos dois arquivos com o manifesto antes de carregá-los (um treino
+    gravando ao mesmo tempo faz a carga falhar em vez de devolver um modelo
+    misturado). Modelos sem manifesto (formato antigo) são carregados direto,
+    com manifesto None. Lança FileNotFoundError se faltar um arquivo e
+    ValueError se o artefato for inválido.
+    """
+    model_save_path = Path(model_save_path)
+    caminho_codificador = caminho_do_codificador(model_save_path)
+    manifesto = ler_manifesto(model_save_path)
+    if manifesto is None:
+        return joblib.load(model_save_path), joblib.load(caminho_codificador), None
+
+    if manifesto.get('versao_formato', 0) > VERSAO_ARTEFATO:
+        raise ValueError(f"Modelo salvo no formato {manifesto['versao_formato']}, mais novo que o suportado "
+                         f"({VERSAO_ARTEFATO}). Atualize a aplicação.")
+    if verificar:
+        for parte, caminho in (('modelo', model_save_path), ('codificador', caminho_codificador)):
+            if sha256_do_arquivo(caminho) != manifesto[parte]['sha256']:
+                raise ValueError(f"O arquivo '{caminho.name}' não confere com o manifesto (SHA-256 diferente).")
+    versao_treino = manifesto['bibliotecas'].get('scikit-learn')
+    if versao_treino != sklearn.__version__:
+        print(f"Aviso: modelo treinado com scikit-learn {versao_treino}, carregado com {sklearn.__version__}.")
+
+    modelo = joblib.load(model_save_path)
+    codificador = joblib.load(caminho_codificador)
+    return modelo, codificador, manifesto
+
+# ==============================================================================
+# COMPARAÇÃO DE FORMATOS (Tamanho e tempo de carga)
+# ==============================================================================
+def _tempo_de_carga(carregar, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        carregar()
+        tempos.append(time.perf_counter() - inicio)
+    return float(np.median(tempos))
+
+def comparar_formatos(modelo, codificador, pasta, max_profundidade=None, max_folhas=None, repeticoes=3):
+    """
+    Salva o modelo como o pickle antigo (joblib.dump sem manifesto) e como
+    artefato em cada compressão (e podado, se houver limites), e mede o
+    tamanho, o tempo para salvar e o tempo de carga (mediana de
+    'repeticoes', com o arquivo já no cache do sistema operacional).
+    Retorna um DataFrame com uma linha por formato.
+    """
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    linhas = []
+
+    caminho = pasta / 'pickle_atual' / 'modelo_classificador.pkl'
+    caminho.parent.mkdir(exist_ok=True)
+    inicio = time.perf_counter()
+    joblib.dump(modelo, caminho)
+    tempo_gravacao = time.perf_counter() - inicio
+    linhas.append({'Formato': 'Pickle atual (joblib.dump)', 'Tamanho (MB)': caminho.stat().st_size / 1e6,
+                   'Gravação (s)': tempo_gravacao, 'Carga (s)': _tempo_de_carga(lambda: joblib.load(caminho), repeticoes)})
+
+    variantes = [(compressao, None) for compressao in COMPRESSOES]
+    if max_profundidade is not None or max_folhas is not None:
+        modelo_podado = joblib.load(caminho)
+        poda = podar_floresta(modelo_podado, max_profundidade, max_folhas)
+        variantes.append((COMPRESSAO_PADRAO, (modelo_podado, poda)))
+    for compressao, podado in variantes:
+        rotulo = f"Artefato ({compressao}{', podado' if podado else ''})"
+        caminho = pasta / rotulo.replace(' ', '_').replace('(', '').replace(')', '').replace(',', '') / 'modelo_classificador.pkl'
+        caminho.parent.mkdir(exist_ok=True)
+        inicio = time.perf_counter()
+        salvar_artefato(caminho, podado[0] if podado else modelo, codificador, compressao=compressao,
+                        poda=podado[1] if podado else None)
+        tempo_gravacao = time.perf_counter() - inicio
+        linhas.append({
+            'Formato': rotulo, 'Tamanho (MB)': caminho.stat().st_size / 1e6, 'Gravação (s)': tempo_gravacao,
+            'Carga (s)': _tempo_de_carga(lambda: carregar_artefato(caminho, verificar=False), repeticoes),
+            'Carga verificada (s)': _tempo_de_carga(lambda: carregar_artefato(caminho), repeticoes),
+        })
+    return pd.DataFrame(linhas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o tamanho e o tempo de carga dos formatos do modelo.")
+    parser.add_argument('--modelo', default=str(Path("CyberSec") / "modelo_classificador.pkl"),
+                        help="Caminho do modelo_classificador.pkl")
+    parser.add_argument('--pasta', default=None, help="Pasta para os arquivos de teste (padrão: temporária)")
+    parser.add_argument('--max-profundidade', type=int, default=None, help="Inclui uma versão podada nessa profundidade")
+    parser.add_argument('--max-folhas', type=int, default=None, help="Inclui uma versão podada com esse nº de folhas")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    modelo, codificador, _ = carregar_artefato(args.modelo, verificar=False)
+    with tempfile.TemporaryDirectory() as temporaria:
+        resultado = comparar_formatos(modelo, codificador, args.pasta or temporaria,
+                                      args.max_profundidade, args.max_folhas, args.repeticoes)
+    print(resultado.round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
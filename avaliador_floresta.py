@@ -0,0 +1,207 @@
+"""
+Avaliador de floresta em arrays (predição de baixa latência para poucos incidentes).
+
+O 'predict' e o 'predict_proba' do scikit-learn validam a entrada e percorrem
+árvore por árvore a cada chamada; o simulador chamava os dois a cada clique.
+Aqui a floresta salva (Random Forest ou Extra Trees) é achatada uma única vez
+em arrays NumPy contíguos com os nós de todas as árvores (feature, limiar,
+filhos, lado dos valores vazios) e a distribuição de classes de cada folha.
+Uma linha (ou um lote pequeno) desce por todas as árvores ao mesmo tempo,
+um nível por iteração, e a classe e as probabilidades saem da mesma passada.
+
+O resultado é idêntico ao do scikit-learn: a entrada é convertida para
+float32 como nas árvores dele, as folhas guardam a mesma distribuição de
+classes e as árvores são somadas na mesma ordem.
+
+Uso (confere com o scikit-learn e compara a latência; por padrão usa o
+modelo e a base publicados em CyberSec/):
+    python avaliador_floresta.py --modelo CyberSec/modelo_classificador.pkl
+"""
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.tree._tree import TREE_LEAF
+
+from artefato_modelo import carregar_artefato
+from backend_tasks import codificar_dataframe
+from geracao import caminho_publicado
+
+# ==============================================================================
+# FLORESTA ACHATADA
+# ==============================================================================
+class FlorestaCompilada:
+    """
+    Nós de todas as árvores em arrays únicos. Os filhos de uma folha apontam
+    para ela mesma, então uma linha que já chegou à folha fica parada enquanto
+    as outras continuam descendo.
+    """
+
+    def __init__(self, modelo):
+        arvores = [estimador.tree_ for estimador in modelo.estimators_]
+        n_classes = len(modelo.classes_)
+        tamanhos = np.array([arvore.node_count for arvore in arvores])
+        deslocamentos = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])
+
+        esquerda, direita, proba_nos = [], [], []
+        for arvore, deslocamento in zip(arvores, deslocamentos):
+            folha = arvore.children_left == TREE_LEAF
+            proprio = np.arange(arvore.node_count) + deslocamento
+            esquerda.append(np.where(folha, proprio, arvore.children_left + deslocamento))
+            direita.append(np.where(folha, proprio, arvore.children_right + deslocamento))
+            # O value de cada nó já é a fração de cada classe: é o que o
+            # DecisionTreeClassifier.predict_proba devolve, sem outra normalização
+            proba_nos.append(arvore.value[:, 0, :n_classes])
+
+        self.classes_ = modelo.classes_
+        self.feature_names_in_ = getattr(modelo, 'feature_names_in_', None)
+        self.n_features_in_ = modelo.n_features_in_
+        self.raizes = deslocamentos.astype(np.intp)
+        self.esquerda = np.concatenate(esquerda).astype(np.intp)
+        self.direita = np.concatenate(direita).astype(np.intp)
+        # Folhas usam a feature 0 só para a consulta não sair do array (o resultado é descartado)
+        self.feature = np.maximum(np.concatenate([arvore.feature for arvore in arvores]), 0).astype(np.intp)
+        self.limiar = np.concatenate([arvore.threshold for arvore in arvores])
+        self.vazio_a_esquerda = np.concatenate([arvore.missing_go_to_left for arvore in arvores]).astype(bool)
+        self.folha = self.esquerda == np.arange(len(self.esquerda))
+        self.proba = np.concatenate(proba_nos)
+        self.profundidade_max = max(arvore.max_depth for arvore in arvores)
+
+    def _validar(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names_in_ is not None and list(X.columns) != list(self.feature_names_in_):
+                raise ValueError("As colunas recebidas não correspondem às features do modelo treinado.")
+            X = X.to_numpy()
+        X = np.asarray(X, dtype=np.float32)  # As árvores do scikit-learn comparam em float32
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Esperado um array com {self.n_features_in_} colunas, recebido {X.shape}.")
+        return X
+
+    def folhas(self, X):
+        """Índice (global) da folha alcançada em cada árvore: array (árvores, linhas)."""
+        X = self._validar(X)
+        n_linhas = X.shape[0]
+        nos = np.repeat(self.raizes[:, np.newaxis], n_linhas, axis=1)
+        linhas = np.arange(n_linhas)[np.newaxis, :]
+        for _ in range(self.profundidade_max):
+            if self.folha[nos].all():
+                break
+            valores = X[linhas, self.feature[nos]]
+            # Valor vazio segue o lado aprendido no treino, como no scikit-learn
+            esquerda = np.where(np.isnan(valores), self.vazio_a_esquerda[nos], valores <= self.limiar[nos])
+            nos = np.where(esquerda, self.esquerda[nos], self.direita[nos])
+        return nos
+
+    def predict_proba(self, X):
+        # Soma árvore a árvore na ordem do estimators_ (mesma ordem de soma do scikit-learn)
+        return np.add.reduce(self.proba[self.folhas(X)], axis=0) / len(self.raizes)
+
+    def prever(self, X):
+        """Classe prevista e probabilidades de cada classe, calculadas numa única passada."""
+        proba = self.predict_proba(X)
+        return self.classes_.take(np.argmax(proba, axis=1), axis=0), proba
+
+
+def compilar_floresta(modelo):
+    """
+    Achata uma Random Forest / Extra Trees de classificação. Retorna None para
+    modelos que não são florestas de uma saída (Gradient Boosting, Regressão
+    Logística), que seguem usando o próprio scikit-learn.
+    """
+    if not isinstance(modelo, (RandomForestClassifier, ExtraTreesClassifier)) or modelo.n_outputs_ != 1:
+        return None
+    return FlorestaCompilada(modelo)
+
+
+def prever_com_probabilidades(modelo, X, floresta=None):
+    """
+    Classe prevista e probabilidades numa única avaliação do modelo: pela
+    floresta compilada quando houver, senão pelo 'predict_proba' do
+    scikit-learn (a classe é a de maior probabilidade, a mesma regra do
+    'predict' das florestas).
+    """
+    if floresta is not None:
+        return floresta.prever(X)
+    proba = modelo.predict_proba(X)
+    return modelo.classes_.take(np.argmax(proba, axis=1), axis=0), proba
+
+
+def conferir_com_sklearn(floresta, modelo, X):
+    """True se as probabilidades e as classes forem exatamente iguais às do scikit-learn."""
+    classes, proba = floresta.prever(X)
+    proba_sklearn = modelo.predict_proba(X)
+    return bool(np.array_equal(proba, proba_sklearn) and np.array_equal(classes, modelo.predict(X)))
+
+# ==============================================================================
+# CONFERÊNCIA E LATÊNCIA (Linha de comando)
+# ==============================================================================
+def montar_corpus(db_path, table_name, codificador, n_linhas=2000, semente=42):
+    """
+    Incidentes da base codificados como no simulador, mais cópias com campos
+    vazios e categorias desconhecidas, para exercitar todos os caminhos.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql_query(f'SELECT * FROM "{table_name}" ORDER BY RANDOM() LIMIT ?', conn, params=(n_linhas,))
+    finally:
+        conn.close()
+    rng = np.random.default_rng(semente)
+    alterado = df.copy()
+    for col in codificador['colunas_categoricas']:
+        alterado[col] = alterado[col].astype(object)
+        alterado.loc[rng.random(len(alterado)) < 0.2, col] = 'Valor desconhecido'
+    X = pd.concat([codificar_dataframe(df, codificador), codificar_dataframe(alterado, codificador)], ignore_index=True)
+    # Vazios nas numéricas (o codificador normalmente os preenche com o valor padrão)
+    com_vazios = X.copy()
+    for col in codificador['colunas_numericas']:
+        com_vazios.loc[rng.random(len(com_vazios)) < 0.2, col] = np.nan
+    return pd.concat([X, com_vazios], ignore_index=True)
+
+
+def _latencia_ms(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return float(np.median(tempos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere o avaliador de floresta com o scikit-learn e mede a latência.")
+    parser.add_argument('--modelo', default=str(caminho_publicado(Path("CyberSec"), 'modelo')))
+    parser.add_argument('--db', default=str(caminho_publicado(Path("CyberSec"), 'base')))
+    parser.add_argument('--tabela', default='CyberSec_data')
+    parser.add_argument('--linhas', type=int, default=2000, help="Incidentes sorteados da base para o corpus")
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    modelo, codificador, _ = carregar_artefato(args.modelo)
+    inicio = time.perf_counter()
+    floresta = compilar_floresta(modelo)
+    if floresta is None:
+        print(f"{type(modelo).__name__} não é uma floresta: nada a compilar.")
+        return
+    print(f"Floresta compilada em {time.perf_counter() - inicio:.3f}s "
+          f"({len(floresta.raizes)} árvores, {len(floresta.esquerda):,} nós).")
+
+    corpus = montar_corpus(args.db, args.tabela, codificador, args.linhas)
+    # Referência sequencial: com várias threads a ordem da soma entre árvores varia no próprio scikit-learn
+    modelo.set_params(n_jobs=1)
+    iguais = conferir_com_sklearn(floresta, modelo, corpus)
+    print(f"Corpus de {len(corpus):,} linhas: resultado {'idêntico ao' if iguais else 'DIFERENTE do'} scikit-learn.")
+
+    for n in (1, 10, 100):
+        lote = corpus.iloc[:n]
+        sklearn_ms = _latencia_ms(lambda: (modelo.predict(lote), modelo.predict_proba(lote)), args.repeticoes)
+        compilada_ms = _latencia_ms(lambda: floresta.prever(lote), args.repeticoes)
+        print(f"{n:>4} linha(s): scikit-learn (predict + predict_proba) {sklearn_ms:7.2f} ms | "
+              f"floresta compilada {compilada_ms:7.2f} ms ({sklearn_ms / compilada_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
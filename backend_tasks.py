@@ -1,26 +1,1080 @@
 import sqlite3
+import csv
+import codecs
 import pandas as pd
 from pathlib import Path
 import glob
 import zipfile
 import tempfile  # Usaremos para lidar com os uploads
 import shutil    # Para limpar pastas temporárias
-import joblib
+import os
+import time
+import hashlib
+import json
+import math
+from datetime import datetime
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sp
 
+import pickle
+from joblib import Parallel, delayed
+
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+from sklearn.ensemble import (RandomForestRegressor, RandomForestClassifier, ExtraTreesClassifier,
+                              HistGradientBoostingClassifier)
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import MaxAbsScaler
 from sklearn.metrics import mean_squared_error, r2_score, accuracy_score
 
+from instrumentacao import Perfilador
+from artefato_modelo import (caminho_do_codificador, caminho_do_manifesto, salvar_artefato, carregar_artefato,
+                             podar_floresta, COMPRESSAO_PADRAO)
+
+# ==============================================================================
+# DETECÇÃO DO DIALETO DO CSV (separador, encoding e aspas)
+# ==============================================================================
+SEPARADORES_CANDIDATOS = ',;\t|'
+
+def _ler_amostra(origem, tamanho):
+    """Lê os primeiros bytes de um caminho ou de um arquivo enviado (volta o cursor ao início)."""
+    if hasattr(origem, 'read'):
+        posicao = origem.tell()
+        amostra = origem.read(tamanho)
+        origem.seek(posicao)
+        return amostra
+    with open(origem, 'rb') as f:
+        return f.read(tamanho)
+
+def detectar_dialeto(origem, tamanho_amostra=64 * 1024):
+    """
+    Lê uma amostra do início do arquivo uma única vez e descobre o encoding,
+    o separador e o tipo de aspas. O resultado é usado para ler o arquivo
+    inteiro com o parser em C do pandas (bem mais rápido que sep=None).
+    """
+    amostra = _ler_amostra(origem, tamanho_amostra)
+
+    # --- Encoding: UTF-8 (com ou sem BOM); se não decodificar, latin1 ---
+    if amostra.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    try:
+        # Decodificador incremental: não falha se a amostra cortar um caractere no meio
+        texto = codecs.getincrementaldecoder(encoding)().decode(amostra, final=False)
+    except UnicodeDecodeError:
+        encoding = 'latin1'
+        texto = amostra.decode(encoding)
+
+    # Descarta a última linha (provavelmente cortada pela amostra)
+    linhas = texto.splitlines()
+    if len(linhas) > 1 and not texto.endswith(('\n', '\r')):
+        linhas = linhas[:-1]
+    texto = '\n'.join(linhas)
+
+    # --- Separador e aspas ---
+    try:
+        dialeto = csv.Sniffer().sniff(texto, delimiters=SEPARADORES_CANDIDATOS)
+        separador = dialeto.delimiter
+        aspas = dialeto.quotechar or '"'
+        aspas_duplas = dialeto.doublequote
+        escape = dialeto.escapechar
+    except csv.Error:
+        # Sniffer não decidiu: usa o candidato que mais aparece no cabeçalho
+        cabecalho = linhas[0] if linhas else ''
+        separador = max(SEPARADORES_CANDIDATOS, key=cabecalho.count)
+        aspas, aspas_duplas, escape = '"', True, None
+
+    return {
+        'separador': separador,
+        'encoding': encoding,
+        'aspas': aspas,
+        'aspas_duplas': aspas_duplas,
+        'escape': escape,
+    }
+
+def opcoes_leitura_csv(dialeto):
+    """Converte o dialeto detectado nos parâmetros do pd.read_csv (parser em C)."""
+    return {
+        'sep': dialeto['separador'],
+        'encoding': dialeto['encoding'],
+        'encoding_errors': 'replace',
+        'quotechar': dialeto['aspas'],
+        'doublequote': dialeto['aspas_duplas'],
+        'escapechar': dialeto['escape'],
+        'engine': 'c',
+    }
+
+# ==============================================================================
+# ESQUEMA DE TIPOS (Inferido a partir de uma amostra do início dos CSVs)
+# ==============================================================================
+LINHAS_AMOSTRA_ESQUEMA = 50000
+
+# Ordem de "generalidade": ao juntar arquivos, vale o tipo mais geral
+ORDEM_TIPOS_SQL = {'INTEGER': 0, 'REAL': 1, 'TEXT': 2}
+
+def normalizar_colunas(df):
+    """Remove espaços e quebras de linha dos nomes das colunas."""
+    df.columns = df.columns.str.strip().str.replace('\n', '')
+    return df
+
+def inferir_tipo_coluna(serie):
+    """
+    Define o tipo SQL de uma coluna lida como texto: INTEGER se todos os
+    valores preenchidos forem inteiros, REAL se forem numéricos e TEXT caso
+    contrário (ou se a amostra não tiver nenhum valor preenchido).
+    """
+    valores = serie.dropna()
+    if valores.empty:
+        return 'TEXT'
+    convertidos = pd.to_numeric(valores, errors='coerce')
+    if convertidos.isna().any():
+        return 'TEXT'
+    if (convertidos % 1 == 0).all():
+        return 'INTEGER'
+    return 'REAL'
+
+def analisar_arquivo(arquivo, n_linhas=LINHAS_AMOSTRA_ESQUEMA):
+    """
+    Pré-análise de um CSV: detecta o dialeto e lê as primeiras 'n_linhas'
+    (como texto) para descobrir as colunas e o tipo SQL de cada uma.
+    """
+    dialeto = detectar_dialeto(arquivo)
+    df_amostra = pd.read_csv(arquivo, nrows=n_linhas, dtype=str, **opcoes_leitura_csv(dialeto))
+    normalizar_colunas(df_amostra)
+    tipos = {col: inferir_tipo_coluna(df_amostra[col]) for col in df_amostra.columns}
+    return dialeto, tipos
+
+def combinar_esquemas(lista_tipos):
+    """
+    Junta os tipos encontrados em cada arquivo numa tabela mestra com as
+    colunas ordenadas. Em caso de conflito vale o tipo mais geral.
+    """
+    esquema = {}
+    for tipos in lista_tipos:
+        for col, tipo in tipos.items():
+            if col not in esquema or ORDEM_TIPOS_SQL[tipo] > ORDEM_TIPOS_SQL[esquema[col]]:
+                esquema[col] = tipo
+    return {col: esquema[col] for col in sorted(esquema)}
+
+def converter_chunk(chunk, esquema, nome_arquivo):
+    """
+    Ajusta um pedaço lido do CSV aos tipos do esquema. As colunas numéricas
+    normalmente já chegam convertidas pelo parser em C; só quando um pedaço
+    traz algum valor que não é número a coluna vem como texto e é convertida
+    aqui. Esses valores viram NULL na tabela e são devolvidos à parte para
+    registro em '<tabela>_rejeitados'. NULLs continuam NULL (não viram 'nan').
+    """
+    chunk = normalizar_colunas(chunk).reindex(columns=list(esquema))
+    rejeitados = []
+    for col, tipo in esquema.items():
+        if tipo == 'TEXT' or pd.api.types.is_numeric_dtype(chunk[col]):
+            continue
+        original = chunk[col]
+        convertido = pd.to_numeric(original, errors='coerce')
+        falhas = convertido.isna() & original.notna()
+        if falhas.any():
+            rejeitados.append(pd.DataFrame({
+                'arquivo': nome_arquivo,
+                'linha': chunk.index[falhas] + 2,  # +1 do cabeçalho, +1 por começar em 1
+                'coluna': col,
+                'valor': original[falhas],
+            }))
+        # Em colunas INTEGER o SQLite grava 2015.0 como 2015, então não é preciso converter para int
+        chunk[col] = convertido
+
+    df_rejeitados = pd.concat(rejeitados, ignore_index=True) if rejeitados else None
+    return chunk, df_rejeitados
+
+def ler_pedacos_tipados(arquivo, dialeto, esquema, chunksize=100000):
+    """Lê um CSV em pedaços e devolve cada pedaço já convertido pelo esquema."""
+    nome_arquivo = Path(arquivo).name
+    opcoes = opcoes_leitura_csv(dialeto)
+    # Colunas TEXT são lidas como texto; as numéricas ficam com o parser em C
+    # (nomes originais do cabeçalho, antes da limpeza feita por normalizar_colunas)
+    colunas_originais = pd.read_csv(arquivo, nrows=0, **opcoes).columns
+    tipos_leitura = {
+        original: str
+        for original, limpa in zip(colunas_originais, normalizar_colunas(pd.DataFrame(columns=colunas_originais)).columns)
+        if esquema.get(limpa, 'TEXT') == 'TEXT'
+    }
+    chunk_reader = pd.read_csv(arquivo, chunksize=chunksize, dtype=tipos_leitura, **opcoes)
+    for chunk in chunk_reader:
+        chunk_tipado, df_rejeitados = converter_chunk(chunk, esquema, nome_arquivo)
+        yield chunk_tipado, df_rejeitados
+
+# ==============================================================================
+# CARGA EM MASSA NO SQLITE (Pragmas de carga, transação única e executemany)
+# ==============================================================================
+# Durante a carga o banco está sendo criado do zero: se algo falhar ele é
+# descartado, então dá para abrir mão do journal e do fsync.
+PRAGMAS_CARGA = {
+    'journal_mode': 'OFF',
+    'threads': os.cpu_count() or 1,  # threads auxiliares na ordenação do CREATE INDEX
+    'synchronous': 'OFF',
+    'cache_size': -256000,  # em KiB (~250 MB)
+    'temp_store': 'MEMORY',
+    'locking_mode': 'EXCLUSIVE',
+}
+
+# Colunas categóricas usadas nos agrupamentos do dashboard (indexadas após a carga)
+COLUNAS_INDICE = [
+    'Attack Source', 'Attack Type', 'Country', 'Defense Mechanism Used',
+    'Security Vulnerability Type', 'Target Industry', 'Year'
+]
+
+# No modo "anexar" o banco já tem o histórico: o journal continua ligado para
+# que uma falha no meio da carga seja desfeita (ROLLBACK) sem corromper nada.
+PRAGMAS_ANEXO = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'NORMAL',
+    'cache_size': -256000,
+    'temp_store': 'MEMORY',
+}
+
+def abrir_conexao_carga(db_path, pragmas=PRAGMAS_CARGA):
+    """
+    Abre uma conexão para carga em massa. As transações são controladas
+    manualmente (isolation_level=None) para a carga inteira caber em uma só.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    for pragma, valor in pragmas.items():
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+    return conn
+
+def inserir_em_massa(conn, table_name, df, ignorar_duplicados=False):
+    """
+    Insere um DataFrame com um único INSERT preparado e 'executemany'.
+    Os valores são convertidos para tipos nativos do Python (NaN/NA -> NULL).
+    Com 'ignorar_duplicados', linhas que violam um índice UNIQUE são puladas
+    (INSERT OR IGNORE). Retorna o número de linhas efetivamente inseridas.
+    """
+    if df.empty:
+        return 0
+    colunas = ', '.join(f'"{col}"' for col in df.columns)
+    marcadores = ', '.join('?' * len(df.columns))
+    valores_por_coluna = [
+        df[col].astype(object).where(df[col].notna(), None).tolist()
+        for col in df.columns
+    ]
+    comando = 'INSERT OR IGNORE' if ignorar_duplicados else 'INSERT'
+    cursor = conn.executemany(f'{comando} INTO "{table_name}" ({colunas}) VALUES ({marcadores})', zip(*valores_por_coluna))
+    return cursor.rowcount
+
+def criar_indices(conn, table_name, colunas, analisar=True):
+    """
+    Cria os índices depois da carga (bem mais barato que mantê-los a cada
+    INSERT) e roda o ANALYZE. Índices que já existem não são recriados; com
+    analisar=False roda só o 'PRAGMA optimize', que é barato.
+    """
+    for col in colunas:
+        nome_indice = f"idx_{table_name}_{col}".replace(' ', '_')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{nome_indice}" ON "{table_name}" ("{col}")')
+    conn.execute("ANALYZE" if analisar else "PRAGMA optimize")
+
+# ==============================================================================
+# CONTROLE DE INGESTÃO (Manifesto de arquivos, deduplicação e modo "anexar")
+# ==============================================================================
+MODOS_INGESTAO = ('substituir', 'anexar')
+
+def calcular_hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    """SHA-256 do conteúdo do arquivo (identifica arquivos já ingeridos, mesmo renomeados)."""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def conectar_somente_leitura(db_path):
+    return sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+
+def ler_esquema_tabela(conn, table_name):
+    """Colunas e tipos declarados de uma tabela existente ({coluna: tipo})."""
+    return {linha[1]: linha[2] for linha in conn.execute(f'PRAGMA table_info("{table_name}")')}
+
+def garantir_tabelas_controle(conn, table_name):
+    """
+    Cria (se preciso) as tabelas de controle da ingestão:
+      - <tabela>_arquivos: manifesto dos arquivos ingeridos (hash e dialeto)
+      - <tabela>_ingestoes: uma linha por carga, com a faixa de rowid inserida
+      - <tabela>_rejeitados: valores que não couberam no tipo da coluna
+    """
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS "{table_name}_ingestoes" (
+        ingestao_id INTEGER PRIMARY KEY, modo TEXT, data_hora TEXT,
+        rowid_inicial INTEGER, rowid_final INTEGER, linhas_lidas INTEGER, linhas_inseridas INTEGER)''')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS "{table_name}_arquivos" (
+        arquivo TEXT, hash_sha256 TEXT, separador TEXT, encoding TEXT, aspas TEXT,
+        linhas INTEGER, linhas_inseridas INTEGER, ingestao_id INTEGER)''')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS "{table_name}_rejeitados" (
+        arquivo TEXT, linha INTEGER, coluna TEXT, valor TEXT)''')
+    # Bancos criados antes do manifesto não têm todas as colunas
+    colunas_manifesto = ler_esquema_tabela(conn, f"{table_name}_arquivos")
+    for col, tipo in [('hash_sha256', 'TEXT'), ('linhas_inseridas', 'INTEGER'), ('ingestao_id', 'INTEGER')]:
+        if col not in colunas_manifesto:
+            conn.execute(f'ALTER TABLE "{table_name}_arquivos" ADD COLUMN "{col}" {tipo}')
+
+def definir_chave_deduplicacao(conn, table_name, colunas_chave):
+    """
+    (Re)cria o índice UNIQUE usado para descartar linhas repetidas. Falha se
+    a base atual já tiver linhas repetidas nessa chave.
+    """
+    nome_indice = f"ux_{table_name}_dedupe"
+    conn.execute(f'DROP INDEX IF EXISTS "{nome_indice}"')
+    colunas_sql = ', '.join(f'"{col}"' for col in colunas_chave)
+    try:
+        conn.execute(f'CREATE UNIQUE INDEX "{nome_indice}" ON "{table_name}" ({colunas_sql})')
+    except sqlite3.IntegrityError:
+        raise ValueError(f"A base atual já tem linhas repetidas na chave {list(colunas_chave)}; "
+                         "não é possível usá-la para deduplicar.")
+
+def tem_chave_deduplicacao(conn, table_name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                        (f"ux_{table_name}_dedupe",)).fetchone() is not None
+
+# ==============================================================================
+# RESUMOS PRÉ-AGREGADOS (Rollups lidos pelo painel de Análise Exploratória)
+# ==============================================================================
+# Pares de colunas categóricas que também ganham resumo cruzado
+PARES_ROLLUP = [
+    ('Attack Type', 'Country'), ('Attack Type', 'Target Industry'), ('Attack Type', 'Year'),
+    ('Attack Type', 'Attack Source'), ('Country', 'Year'), ('Target Industry', 'Year'),
+]
+
+# Nome da "medida" das linhas que guardam só a contagem de incidentes do grupo
+MEDIDA_CONTAGEM = '*'
+
+def tabela_existe(conn, nome):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (nome,)).fetchone() is not None
+
+def colunas_medidas(esquema):
+    """Colunas numéricas resumidas nos rollups (as categóricas, como 'Year', ficam de fora)."""
+    return [col for col, tipo in esquema.items() if tipo in ('INTEGER', 'REAL') and col not in COLUNAS_INDICE]
+
+def garantir_tabela_rollups(conn, table_name):
+    """
+    Cria (se preciso) a tabela <tabela>_rollups, em formato longo: uma linha
+    por grupo e medida, com contagem, soma, mínimo e máximo (a média é
+    soma / contagem). Resumos de uma coluna têm dim_b = '' e o total da base
+    tem dim_a = dim_b = ''. Retorna False se a tabela ainda não existia.
+    """
+    existia = tabela_existe(conn, f"{table_name}_rollups")
+    # val_a/val_b sem tipo declarado: 'Year' continua inteiro e os códigos continuam texto
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS "{table_name}_rollups" (
+        dim_a TEXT NOT NULL, val_a NOT NULL, dim_b TEXT NOT NULL, val_b NOT NULL, medida TEXT NOT NULL,
+        contagem INTEGER, soma REAL, minimo REAL, maximo REAL,
+        PRIMARY KEY (dim_a, val_a, dim_b, val_b, medida))''')
+    return existia
+
+def _valor_python(valor):
+    """Converte escalares do numpy/pandas para tipos do Python (NaN/NA -> None)."""
+    if pd.isna(valor):
+        return None
+    if hasattr(valor, 'item'):
+        valor = valor.item()
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def _mesclar_parcial(parciais, chave, contagem, soma, minimo, maximo):
+    atual = parciais.get(chave)
+    if atual is None:
+        parciais[chave] = [contagem, soma, minimo, maximo]
+        return
+    atual[0] += contagem
+    for posicao, valor, juntar in ((1, soma, lambda a, b: a + b), (2, minimo, min), (3, maximo, max)):
+        if valor is not None:
+            atual[posicao] = valor if atual[posicao] is None else juntar(atual[posicao], valor)
+
+def acumular_rollups(parciais, chunk, dimensoes, medidas, pares=PARES_ROLLUP):
+    """
+    Agrega um pedaço de linhas (total, por coluna categórica e pelos pares)
+    e soma o resultado em 'parciais', um dicionário
+    {(dim_a, val_a, dim_b, val_b, medida): [contagem, soma, mínimo, máximo]}.
+    Como as quatro estatísticas se combinam, os pedaços podem ser agregados
+    separadamente. Grupos com a categoria vazia (NULL) ficam de fora.
+    """
+    agrupamentos = [()] + [(dim,) for dim in dimensoes] + [par for par in pares if set(par) <= set(dimensoes)]
+    for grupo in agrupamentos:
+        # O total é um agrupamento com uma única chave constante
+        chaves = list(grupo) if grupo else np.zeros(len(chunk), dtype=np.int8)
+        agrupado = chunk.groupby(chaves, sort=False)
+        nomes = (list(grupo) + ['', ''])[:2]
+        for valores, contagem in agrupado.size().items():
+            valores = valores if isinstance(valores, tuple) else (valores,)
+            val_a, val_b = ([_valor_python(v) for v in valores] + ['', ''])[:2] if grupo else ('', '')
+            _mesclar_parcial(parciais, (nomes[0], val_a, nomes[1], val_b, MEDIDA_CONTAGEM), int(contagem), None, None, None)
+        if not medidas:
+            continue
+        estatisticas = [
+            agrupado[medidas].count(), agrupado[medidas].sum(min_count=1),
+            agrupado[medidas].min(), agrupado[medidas].max(),
+        ]
+        for medida in medidas:
+            colunas = zip(*(estatistica[medida].tolist() for estatistica in estatisticas))
+            for valores, (contagem, soma, minimo, maximo) in zip(estatisticas[0].index, colunas):
+                valores = valores if isinstance(valores, tuple) else (valores,)
+                val_a, val_b = ([_valor_python(v) for v in valores] + ['', ''])[:2] if grupo else ('', '')
+                _mesclar_parcial(parciais, (nomes[0], val_a, nomes[1], val_b, medida), int(contagem),
+                                 _valor_python(soma), _valor_python(minimo), _valor_python(maximo))
+
+def gravar_rollups(conn, table_name, parciais):
+    """
+    Soma os parciais aos resumos já gravados (upsert): numa carga do modo
+    anexar só as linhas novas são agregadas, sem reler o histórico.
+    """
+    conn.executemany(
+        f'INSERT INTO "{table_name}_rollups" (dim_a, val_a, dim_b, val_b, medida, contagem, soma, minimo, maximo) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (dim_a, val_a, dim_b, val_b, medida) DO UPDATE SET '
+        'contagem = contagem + excluded.contagem, '
+        'soma = COALESCE(soma + excluded.soma, soma, excluded.soma), '
+        'minimo = COALESCE(MIN(minimo, excluded.minimo), minimo, excluded.minimo), '
+        'maximo = COALESCE(MAX(maximo, excluded.maximo), maximo, excluded.maximo)',
+        [chave + tuple(valores) for chave, valores in parciais.items()]
+    )
+
+def agregar_linhas_da_tabela(conn, table_name, esquema, rowid_desde=0, chunksize=200000):
+    """Calcula os parciais dos rollups relendo do banco as linhas com rowid > rowid_desde."""
+    dimensoes = [col for col in COLUNAS_INDICE if col in esquema]
+    medidas = colunas_medidas(esquema)
+    parciais = {}
+    colunas_sql = ', '.join(f'"{col}"' for col in dimensoes + medidas)
+    consulta = f'SELECT {colunas_sql} FROM "{table_name}" WHERE rowid > ?'
+    for chunk in pd.read_sql_query(consulta, conn, params=(rowid_desde,), chunksize=chunksize):
+        acumular_rollups(parciais, chunk, dimensoes, medidas)
+    return parciais
+
+def reconstruir_rollups(db_path, table_name):
+    """
+    Gera a tabela de resumos de uma base que ainda não a tem (bases criadas
+    antes dos rollups). Retorna (sucesso, mensagem).
+    """
+    if not Path(db_path).exists():
+        return False, "Banco de dados não encontrado."
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        if garantir_tabela_rollups(conn, table_name):
+            conn.execute("ROLLBACK")
+            return True, "Os resumos já existiam."
+        print("Gerando os resumos pré-agregados da base atual...")
+        parciais = agregar_linhas_da_tabela(conn, table_name, ler_esquema_tabela(conn, table_name))
+        gravar_rollups(conn, table_name, parciais)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    print(f"{len(parciais)} linhas de resumo gravadas.")
+    return True, "Resumos gerados com sucesso."
+
+# ==============================================================================
+# ESTATÍSTICAS DAS COLUNAS (Vocabulários, medianas e histogramas lidos pelo app)
+# ==============================================================================
+# A mediana aproximada erra no máximo a largura de uma faixa do histograma
+MAX_FAIXAS_HISTOGRAMA = 256
+# Colunas de texto com mais valores distintos que isso ficam sem vocabulário
+MAX_VOCABULARIO = 1000
+
+def colunas_categoricas_estatisticas(esquema):
+    """Colunas resumidas por vocabulário (as de texto e as categóricas numéricas, como 'Year')."""
+    return [col for col, tipo in esquema.items() if tipo == 'TEXT' or col in COLUNAS_INDICE]
+
+def garantir_tabela_estatisticas(conn, table_name):
+    """
+    Cria (se preciso) a tabela <tabela>_estatisticas, com uma linha por
+    coluna: linhas vistas, nulos e, conforme o tipo, o vocabulário com as
+    contagens ou soma, mínimo, máximo e histograma. Retorna False se a
+    tabela ainda não existia.
+    """
+    existia = tabela_existe(conn, f"{table_name}_estatisticas")
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS "{table_name}_estatisticas" (
+        coluna TEXT PRIMARY KEY, tipo TEXT NOT NULL, linhas INTEGER NOT NULL, nulos INTEGER NOT NULL,
+        soma REAL, minimo REAL, maximo REAL, expoente INTEGER, histograma TEXT, vocabulario TEXT)''')
+    return existia
+
+def _mesclar_histogramas(histograma_a, expoente_a, histograma_b, expoente_b):
+    """
+    Junta dois histogramas {faixa: contagem}. A faixa k cobre
+    [k * 2^expoente, (k + 1) * 2^expoente): com larguras em potências de 2,
+    dobrar a largura é só k // 2, então histogramas de pedaços (ou de cargas)
+    diferentes se juntam sem perder contagens. A largura dobra até caberem
+    MAX_FAIXAS_HISTOGRAMA faixas.
+    """
+    if expoente_a is None:
+        return dict(histograma_b), expoente_b
+    if expoente_b is None:
+        return dict(histograma_a), expoente_a
+    expoente = max(expoente_a, expoente_b)
+    while True:
+        juntos = {}
+        for histograma, expoente_origem in ((histograma_a, expoente_a), (histograma_b, expoente_b)):
+            divisor = 2 ** (expoente - expoente_origem)
+            for faixa, contagem in histograma.items():
+                juntos[faixa // divisor] = juntos.get(faixa // divisor, 0) + contagem
+        if max(juntos) - min(juntos) < MAX_FAIXAS_HISTOGRAMA:
+            return juntos, expoente
+        expoente += 1
+
+def _histograma_do_pedaco(valores):
+    """Histograma de um pedaço de valores (sem nulos), com a menor largura que cabe nas faixas."""
+    amplitude = float(valores.max() - valores.min())
+    expoente = math.ceil(math.log2(amplitude / (MAX_FAIXAS_HISTOGRAMA - 1))) if amplitude > 0 else 0
+    while True:
+        faixas = np.floor(valores / 2.0 ** expoente).astype(np.int64)
+        if faixas.max() - faixas.min() < MAX_FAIXAS_HISTOGRAMA:
+            break
+        expoente += 1
+    faixas, contagens = np.unique(faixas, return_counts=True)
+    return dict(zip(faixas.tolist(), contagens.tolist())), expoente
+
+def _estatistica_vazia(tipo, categorica):
+    if categorica:
+        return {'tipo': tipo, 'linhas': 0, 'nulos': 0, 'vocabulario': {}}
+    return {'tipo': tipo, 'linhas': 0, 'nulos': 0, 'soma': 0.0, 'minimo': None, 'maximo': None,
+            'expoente': None, 'histograma': {}}
+
+def _mesclar_estatistica(atual, nova):
+    """Soma 'nova' em 'atual' (mesma coluna, pedaços ou cargas diferentes)."""
+    atual['tipo'] = nova['tipo']
+    atual['linhas'] += nova['linhas']
+    atual['nulos'] += nova['nulos']
+    if 'vocabulario' in atual:
+        if atual['vocabulario'] is None or nova.get('vocabulario') is None:
+            atual['vocabulario'] = None
+        else:
+            for valor, contagem in nova['vocabulario'].items():
+                atual['vocabulario'][valor] = atual['vocabulario'].get(valor, 0) + contagem
+            if len(atual['vocabulario']) > MAX_VOCABULARIO:
+                atual['vocabulario'] = None
+        return
+    if nova.get('expoente') is None:
+        return
+    atual['soma'] = (atual['soma'] or 0.0) + nova['soma']
+    atual['minimo'] = nova['minimo'] if atual['minimo'] is None else min(atual['minimo'], nova['minimo'])
+    atual['maximo'] = nova['maximo'] if atual['maximo'] is None else max(atual['maximo'], nova['maximo'])
+    atual['histograma'], atual['expoente'] = _mesclar_histogramas(atual['histograma'], atual['expoente'],
+                                                                  nova['histograma'], nova['expoente'])
+
+def acumular_estatisticas(parciais, chunk, esquema):
+    """
+    Resume um pedaço de linhas e soma o resultado em 'parciais'
+    ({coluna: estatística}). Como na carga dos rollups, cada pedaço é lido
+    uma única vez e as estatísticas se combinam entre pedaços e entre cargas.
+    """
+    categoricas = set(colunas_categoricas_estatisticas(esquema))
+    for col, tipo in esquema.items():
+        if col not in chunk.columns:
+            continue
+        serie = chunk[col]
+        validos = serie.dropna()
+        nova = _estatistica_vazia(tipo, col in categoricas)
+        nova['linhas'], nova['nulos'] = len(serie), len(serie) - len(validos)
+        if col in categoricas:
+            contagens = validos.value_counts(sort=False)
+            nova['vocabulario'] = {_valor_python(valor): int(contagem) for valor, contagem in contagens.items()
+                                   if contagem > 0}
+            if len(nova['vocabulario']) > MAX_VOCABULARIO:
+                nova['vocabulario'] = None
+        elif len(validos):
+            valores = validos.to_numpy(dtype=np.float64)
+            nova['soma'] = float(valores.sum())
+            nova['minimo'], nova['maximo'] = float(valores.min()), float(valores.max())
+            nova['histograma'], nova['expoente'] = _histograma_do_pedaco(valores)
+        if col in parciais:
+            _mesclar_estatistica(parciais[col], nova)
+        else:
+            parciais[col] = nova
+
+def ler_estatisticas(conn, table_name):
+    """Estatísticas gravadas de cada coluna ({coluna: estatística}); vazio se a base não as tem."""
+    try:
+        linhas = conn.execute(
+            f'SELECT coluna, tipo, linhas, nulos, soma, minimo, maximo, expoente, histograma, vocabulario '
+            f'FROM "{table_name}_estatisticas"'
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    estatisticas = {}
+    for coluna, tipo, linhas, nulos, soma, minimo, maximo, expoente, histograma, vocabulario in linhas:
+        if histograma is None:
+            # Coluna categórica ('vocabulario' NULL: distintos demais)
+            estatisticas[coluna] = {'tipo': tipo, 'linhas': linhas, 'nulos': nulos,
+                                    'vocabulario': dict(map(tuple, json.loads(vocabulario))) if vocabulario else None}
+        else:
+            estatisticas[coluna] = {'tipo': tipo, 'linhas': linhas, 'nulos': nulos, 'soma': soma, 'minimo': minimo,
+                                    'maximo': maximo, 'expoente': expoente,
+                                    'histograma': dict(map(tuple, json.loads(histograma)))}
+    return estatisticas
+
+def gravar_estatisticas(conn, table_name, parciais):
+    """
+    Soma os parciais às estatísticas já gravadas: numa carga do modo anexar
+    só as linhas novas são resumidas. Uma coluna nova na base conta as
+    linhas anteriores como nulas.
+    """
+    estatisticas = ler_estatisticas(conn, table_name)
+    linhas_anteriores = max((estatistica['linhas'] for estatistica in estatisticas.values()), default=0)
+    for col, nova in parciais.items():
+        if col not in estatisticas:
+            estatisticas[col] = _estatistica_vazia(nova['tipo'], 'vocabulario' in nova)
+            estatisticas[col]['linhas'] = estatisticas[col]['nulos'] = linhas_anteriores
+        _mesclar_estatistica(estatisticas[col], nova)
+    registros = []
+    for col, estatistica in estatisticas.items():
+        if 'vocabulario' in estatistica:
+            vocabulario = (json.dumps(sorted(estatistica['vocabulario'].items(), key=lambda item: str(item[0])),
+                                      ensure_ascii=False) if estatistica['vocabulario'] is not None else None)
+            registros.append((col, estatistica['tipo'], estatistica['linhas'], estatistica['nulos'],
+                              None, None, None, None, None, vocabulario))
+        else:
+            registros.append((col, estatistica['tipo'], estatistica['linhas'], estatistica['nulos'],
+                              estatistica['soma'], estatistica['minimo'], estatistica['maximo'], estatistica['expoente'],
+                              json.dumps(sorted(estatistica['histograma'].items())), None))
+    conn.executemany(
+        f'INSERT OR REPLACE INTO "{table_name}_estatisticas" '
+        '(coluna, tipo, linhas, nulos, soma, minimo, maximo, expoente, histograma, vocabulario) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', registros
+    )
+
+def estatisticas_da_tabela(conn, table_name, esquema, rowid_desde=0, chunksize=200000):
+    """Calcula os parciais das estatísticas relendo do banco as linhas com rowid > rowid_desde."""
+    parciais = {}
+    consulta = f'SELECT * FROM "{table_name}" WHERE rowid > ?'
+    for chunk in pd.read_sql_query(consulta, conn, params=(rowid_desde,), chunksize=chunksize):
+        acumular_estatisticas(parciais, chunk, esquema)
+    return parciais
+
+def reconstruir_estatisticas(db_path, table_name):
+    """
+    Gera as estatísticas das colunas de uma base que ainda não as tem (bases
+    criadas antes delas). Retorna (sucesso, mensagem).
+    """
+    if not Path(db_path).exists():
+        return False, "Banco de dados não encontrado."
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        if garantir_tabela_estatisticas(conn, table_name):
+            conn.execute("ROLLBACK")
+            return True, "As estatísticas já existiam."
+        print("Gerando as estatísticas das colunas da base atual...")
+        gravar_estatisticas(conn, table_name,
+                            estatisticas_da_tabela(conn, table_name, ler_esquema_tabela(conn, table_name)))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return True, "Estatísticas geradas com sucesso."
+
+def quantil_aproximado(estatistica, q):
+    """
+    Quantil 'q' (0 a 1) de uma coluna numérica, interpolado dentro da faixa
+    do histograma onde ele cai. Colunas INTEGER devolvem um inteiro.
+    """
+    histograma = estatistica.get('histograma')
+    if not histograma:
+        return None
+    largura = 2.0 ** estatistica['expoente']
+    alvo = q * sum(histograma.values())
+    acumulado = 0
+    for faixa in sorted(histograma):
+        contagem = histograma[faixa]
+        if acumulado + contagem >= alvo:
+            valor = (faixa + (alvo - acumulado) / contagem) * largura
+            break
+        acumulado += contagem
+    valor = min(max(valor, estatistica['minimo']), estatistica['maximo'])
+    return int(round(valor)) if estatistica['tipo'] == 'INTEGER' else valor
+
+def moda(estatistica):
+    """Valor mais frequente de uma coluna categórica (no empate, o menor, como o pandas)."""
+    vocabulario = estatistica.get('vocabulario')
+    if not vocabulario:
+        return None
+    maior = max(vocabulario.values())
+    return min(valor for valor, contagem in vocabulario.items() if contagem == maior)
+
+def tabela_histograma(estatistica):
+    """Faixas do histograma de uma coluna numérica (início, fim e contagem)."""
+    largura = 2.0 ** estatistica['expoente'] if estatistica.get('expoente') is not None else 0
+    return pd.DataFrame([{'Início': faixa * largura, 'Fim': (faixa + 1) * largura, 'Contagem': contagem}
+                         for faixa, contagem in sorted((estatistica.get('histograma') or {}).items())])
+
+# ==============================================================================
+# SNAPSHOT COLUNAR (Um arquivo binário do NumPy por coluna, lido via memmap)
+# ==============================================================================
+# Layout da pasta '<banco>_colunar':
+#   manifesto.json -> nº de linhas, carga de origem e, por coluna: arquivo,
+#                     tipo SQL, dtype e categorias (dicionário das colunas TEXT)
+#   col_NNN.bin    -> valores da coluna, em sequência, sem cabeçalho
+# Colunas TEXT guardam só o código (int32, -1 = NULL) de cada valor; as
+# numéricas guardam float64 (NaN = NULL). No modo anexar os arquivos só
+# recebem as linhas novas no final.
+FORMATO_SNAPSHOT = 1
+
+def caminho_do_snapshot(db_path):
+    """Pasta do snapshot colunar, ao lado do banco (ex.: CyberSec/CyberSec_colunar)."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}_colunar")
+
+def ler_manifesto_colunar(pasta):
+    try:
+        with open(Path(pasta) / 'manifesto.json', encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return manifesto if manifesto.get('formato') == FORMATO_SNAPSHOT else None
+
+class EscritorColunar:
+    """
+    Grava as linhas de uma carga no snapshot colunar. Os arquivos recebem os
+    pedaços à medida que chegam, mas o manifesto (que diz quantas linhas
+    valem) só muda em 'concluir': uma carga interrompida não aparece no
+    snapshot e os bytes que sobraram são cortados na próxima abertura.
+    """
+
+    def __init__(self, pasta, esquema, rowid_anterior):
+        self.pasta = Path(pasta)
+        manifesto = ler_manifesto_colunar(self.pasta)
+        if manifesto is None or manifesto['rowid_final'] > rowid_anterior:
+            # Sem snapshot (ou de outra base): começa do zero
+            shutil.rmtree(self.pasta, ignore_errors=True)
+            manifesto = {'formato': FORMATO_SNAPSHOT, 'linhas': 0, 'ingestao_id': None, 'rowid_final': 0, 'colunas': []}
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self.manifesto = manifesto
+        # Linhas do banco que ainda faltam no snapshot: rowid > rowid_desde
+        self.rowid_desde = manifesto['rowid_final']
+
+        colunas_existentes = {coluna['nome'] for coluna in manifesto['colunas']}
+        for col, tipo in esquema.items():
+            if col not in colunas_existentes:
+                manifesto['colunas'].append({
+                    'nome': col, 'arquivo': f"col_{len(manifesto['colunas']):03d}.bin", 'tipo_sql': tipo,
+                    'dtype': 'int32' if tipo == 'TEXT' else 'float64',
+                    'categorias': [] if tipo == 'TEXT' else None, 'nulos': 0, 'inteiro': tipo == 'INTEGER',
+                })
+        for coluna in manifesto['colunas']:
+            caminho = self.pasta / coluna['arquivo']
+            tamanho = manifesto['linhas'] * np.dtype(coluna['dtype']).itemsize
+            if not caminho.exists():
+                # Coluna nova numa base que já tem linhas: o histórico fica NULL
+                with open(caminho, 'wb') as f:
+                    f.write(self._nulos(coluna, manifesto['linhas']).tobytes())
+                coluna['nulos'] += manifesto['linhas']
+            elif caminho.stat().st_size != tamanho:
+                # Corta o que sobrou de uma carga que não chegou ao fim
+                os.truncate(caminho, tamanho)
+        self._confirmar_estado()
+
+    @staticmethod
+    def _nulos(coluna, n):
+        if coluna['tipo_sql'] == 'TEXT':
+            return np.full(n, -1, dtype=np.int32)
+        return np.full(n, np.nan)
+
+    def _confirmar_estado(self):
+        """Guarda o estado confirmado (usado por 'descartar')."""
+        self.linhas_pendentes = 0
+        self.estado_confirmado = {
+            coluna['nome']: (len(coluna['categorias'] or []), coluna['nulos'], coluna['inteiro'])
+            for coluna in self.manifesto['colunas']
+        }
+        self.mapas = {
+            coluna['nome']: {valor: codigo for codigo, valor in enumerate(coluna['categorias'])}
+            for coluna in self.manifesto['colunas'] if coluna['tipo_sql'] == 'TEXT'
+        }
+
+    def adicionar(self, chunk):
+        """Acrescenta um pedaço de linhas (colunas ausentes ficam NULL)."""
+        n = len(chunk)
+        if n == 0:
+            return
+        for coluna in self.manifesto['colunas']:
+            nome = coluna['nome']
+            if nome not in chunk.columns:
+                valores = self._nulos(coluna, n)
+            elif coluna['tipo_sql'] == 'TEXT':
+                serie = chunk[nome]
+                mapa = self.mapas[nome]
+                for valor in pd.unique(serie.dropna()):
+                    if valor not in mapa:
+                        mapa[valor] = len(coluna['categorias'])
+                        coluna['categorias'].append(valor)
+                valores = serie.map(mapa).fillna(-1).to_numpy(dtype=np.int32)
+            else:
+                valores = pd.to_numeric(chunk[nome], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                if coluna['inteiro'] and not np.all(np.isnan(valores) | (valores % 1 == 0)):
+                    coluna['inteiro'] = False
+            if coluna['tipo_sql'] == 'TEXT':
+                coluna['nulos'] += int((valores == -1).sum())
+            else:
+                coluna['nulos'] += int(np.isnan(valores).sum())
+            with open(self.pasta / coluna['arquivo'], 'ab') as f:
+                f.write(valores.tobytes())
+        self.linhas_pendentes += n
+
+    def descartar(self):
+        """Desfaz tudo o que foi adicionado desde a última confirmação."""
+        for coluna in self.manifesto['colunas']:
+            n_categorias, nulos, inteiro = self.estado_confirmado[coluna['nome']]
+            if coluna['categorias'] is not None:
+                del coluna['categorias'][n_categorias:]
+            coluna['nulos'], coluna['inteiro'] = nulos, inteiro
+            os.truncate(self.pasta / coluna['arquivo'], self.manifesto['linhas'] * np.dtype(coluna['dtype']).itemsize)
+        self._confirmar_estado()
+
+    def concluir(self, ingestao_id, rowid_final):
+        """Grava o manifesto (troca atômica): só agora as novas linhas passam a valer."""
+        self.manifesto['linhas'] += self.linhas_pendentes
+        self.manifesto['ingestao_id'] = ingestao_id
+        self.manifesto['rowid_final'] = rowid_final
+        temporario = self.pasta / 'manifesto.json.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self.manifesto, f, ensure_ascii=False)
+        os.replace(temporario, self.pasta / 'manifesto.json')
+        self._confirmar_estado()
+
+def ultima_ingestao(conn, table_name):
+    """(ingestao_id, rowid_final) da última carga registrada, ou None."""
+    try:
+        return conn.execute(
+            f'SELECT ingestao_id, rowid_final FROM "{table_name}_ingestoes" ORDER BY ingestao_id DESC LIMIT 1'
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+def copiar_tabela_para_snapshot(conn, table_name, escritor, chunksize=200000):
+    """Copia para o snapshot as linhas do banco que ele ainda não tem (rowid > escritor.rowid_desde)."""
+    consulta = f'SELECT * FROM "{table_name}" WHERE rowid > ? ORDER BY rowid'
+    for chunk in pd.read_sql_query(consulta, conn, params=(escritor.rowid_desde,), chunksize=chunksize):
+        escritor.adicionar(chunk)
+
+def reconstruir_snapshot(db_path, table_name):
+    """
+    Gera o snapshot colunar de uma base que ainda não o tem (ou cujo snapshot
+    ficou desatualizado). Retorna (sucesso, mensagem).
+    """
+    if not Path(db_path).exists():
+        return False, "Banco de dados não encontrado."
+    print("Gerando o snapshot colunar da base atual...")
+    conn = sqlite3.connect(db_path)
+    try:
+        esquema = ler_esquema_tabela(conn, table_name)
+        ingestao = ultima_ingestao(conn, table_name)
+        rowid_final = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+        escritor = EscritorColunar(caminho_do_snapshot(db_path), esquema, 0)
+        copiar_tabela_para_snapshot(conn, table_name, escritor)
+        escritor.concluir(ingestao[0] if ingestao else None, rowid_final)
+    finally:
+        conn.close()
+    return True, f"Snapshot colunar gerado com {escritor.manifesto['linhas']:,} linhas."
+
+def conferir_snapshot(db_path, table_name):
+    """
+    (manifesto, colunas da tabela) se o snapshot colunar existir e for da
+    última carga do banco; senão None. Só lê o banco.
+    """
+    manifesto = ler_manifesto_colunar(caminho_do_snapshot(db_path))
+    if manifesto is None:
+        return None
+    conn = conectar_somente_leitura(db_path)
+    try:
+        ingestao = ultima_ingestao(conn, table_name)
+        rowid_final = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+        colunas_tabela = list(ler_esquema_tabela(conn, table_name))
+    finally:
+        conn.close()
+    # O snapshot precisa ser da última carga do banco
+    if (ingestao[0] if ingestao else None, rowid_final) != (manifesto['ingestao_id'], manifesto['rowid_final']):
+        return None
+    if set(colunas_tabela) - {coluna['nome'] for coluna in manifesto['colunas']}:
+        return None
+    return manifesto, colunas_tabela
+
+def carregar_snapshot(db_path, table_name):
+    """
+    Monta o DataFrame da base a partir do snapshot colunar, com os arquivos
+    mapeados em memória (np.memmap): as colunas TEXT viram 'category' direto
+    dos códigos, sem passar linha a linha pelo SQLite. Retorna None se não
+    houver snapshot ou se ele não corresponder à última carga do banco.
+    """
+    conferido = conferir_snapshot(db_path, table_name)
+    if conferido is None:
+        return None
+    manifesto, colunas_tabela = conferido
+    pasta = caminho_do_snapshot(db_path)
+    colunas_snapshot = {coluna['nome']: coluna for coluna in manifesto['colunas']}
+
+    n = manifesto['linhas']
+    dados = {}
+    for nome in colunas_tabela:
+        coluna = colunas_snapshot[nome]
+        caminho = pasta / coluna['arquivo']
+        valores = np.memmap(caminho, dtype=coluna['dtype'], mode='r', shape=(n,)) if n else np.empty(0, coluna['dtype'])
+        if coluna['tipo_sql'] == 'TEXT':
+            dados[nome] = pd.Categorical.from_codes(valores, categories=coluna['categorias'])
+        elif coluna['tipo_sql'] == 'INTEGER' and coluna['nulos'] == 0 and coluna['inteiro']:
+            dados[nome] = valores.astype(np.int64)
+        else:
+            dados[nome] = valores
+    return pd.DataFrame(dados, copy=False)
+
+# ==============================================================================
+# REPRESENTAÇÃO COMPACTA EM MEMÓRIA (Tipos 'category' e numéricos reduzidos)
+# ==============================================================================
+# Colunas de texto com até essa fração de valores distintos viram 'category'
+LIMITE_CARDINALIDADE_CATEGORIA = 0.5
+
+def _bytes_da_coluna(serie):
+    return int(serie.memory_usage(deep=True, index=False))
+
+def compactar_dataframe(df, limite_cardinalidade=LIMITE_CARDINALIDADE_CATEGORIA):
+    """
+    Reduz a memória ocupada pela base carregada no app:
+      - texto com poucos valores distintos -> 'category' (um código por linha)
+      - inteiros -> o menor tipo inteiro que comporta todos os valores
+      - floats -> float32 só se a conversão não alterar nenhum valor
+    Retorna (df_compacto, relatorio), com os bytes de cada coluna antes e depois.
+    """
+    colunas = {}
+    relatorio = []
+    for col in df.columns:
+        serie = df[col]
+        antes = _bytes_da_coluna(serie)
+        dtype_antes = str(serie.dtype)
+        if pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            if serie.nunique(dropna=True) <= limite_cardinalidade * len(serie):
+                serie = serie.astype('category')
+        elif pd.api.types.is_integer_dtype(serie) and not pd.api.types.is_extension_array_dtype(serie):
+            serie = pd.to_numeric(serie, downcast='integer')
+        elif pd.api.types.is_float_dtype(serie) and serie.dtype != np.float32:
+            valores = serie.to_numpy()
+            reduzidos = valores.astype(np.float32)
+            if np.array_equal(reduzidos.astype(valores.dtype), valores, equal_nan=True):
+                serie = pd.Series(reduzidos, index=serie.index, name=col)
+        colunas[col] = serie
+        relatorio.append({
+            'Coluna': col, 'Tipo original': dtype_antes, 'Tipo compacto': str(serie.dtype),
+            'Memória antes (MB)': antes / 1e6, 'Memória depois (MB)': _bytes_da_coluna(serie) / 1e6,
+        })
+
+    df_compacto = pd.DataFrame(colunas, index=df.index, copy=False)
+    df_relatorio = pd.DataFrame(relatorio)
+    total_antes = df_relatorio['Memória antes (MB)'].sum()
+    total_depois = df_relatorio['Memória depois (MB)'].sum()
+    print(f"Base compactada: {total_antes:,.1f} MB -> {total_depois:,.1f} MB "
+          f"({total_antes / max(total_depois, 1e-9):.1f}x menor).")
+    return df_compacto, df_relatorio
+
+# ==============================================================================
+# INGESTÃO PARALELA (Vários CSVs lidos em processos separados)
+# ==============================================================================
+# Fila e sinal de cancelamento de cada processo do pool (definidos no initializer)
+_fila_worker = None
+_cancelar_worker = None
+
+def _iniciar_worker_ingestao(fila, cancelar):
+    global _fila_worker, _cancelar_worker
+    _fila_worker = fila
+    _cancelar_worker = cancelar
+
+def _ler_arquivo_no_worker(arquivo, dialeto, esquema):
+    """
+    Executado num processo do pool: lê e converte o arquivo, entregando os
+    pedaços tipados ao processo principal (o único que escreve no SQLite).
+    O 'put' bloqueia quando a fila está cheia, o que limita a memória.
+    """
+    nome_arquivo = Path(arquivo).name
+    try:
+        for chunk_tipado, df_rejeitados in ler_pedacos_tipados(arquivo, dialeto, esquema):
+            if _cancelar_worker.is_set():
+                break
+            _fila_worker.put(('pedaco', nome_arquivo, chunk_tipado, df_rejeitados))
+        _fila_worker.put(('fim', nome_arquivo, None, None))
+    except Exception as e:
+        _fila_worker.put(('erro', nome_arquivo, f"{type(e).__name__}: {e}", None))
+
+def ler_arquivos_em_paralelo(lista_arquivos_csv, dialetos, esquema, n_processos):
+    """
+    Distribui os arquivos entre 'n_processos' e devolve os pedaços tipados
+    (nome_arquivo, chunk, rejeitados) à medida que ficam prontos. No máximo
+    2 pedaços por processo ficam em memória esperando o escritor.
+    """
+    contexto = multiprocessing.get_context('spawn')
+    fila = contexto.Queue(maxsize=2 * n_processos)
+    cancelar = contexto.Event()
+    with ProcessPoolExecutor(max_workers=n_processos, mp_context=contexto,
+                             initializer=_iniciar_worker_ingestao, initargs=(fila, cancelar)) as pool:
+        futuros = [pool.submit(_ler_arquivo_no_worker, arquivo, dialetos[arquivo], esquema)
+                   for arquivo in lista_arquivos_csv]
+        pendentes = len(futuros)
+        erro = None
+        try:
+            while pendentes:
+                try:
+                    tipo, nome_arquivo, chunk_tipado, df_rejeitados = fila.get(timeout=1)
+                except queue.Empty:
+                    # Um processo que morreu não avisa pela fila: confere os futuros
+                    for futuro in futuros:
+                        if futuro.done() and futuro.exception() is not None:
+                            raise RuntimeError(f"Falha num processo de leitura: {futuro.exception()}")
+                    continue
+                if tipo == 'pedaco':
+                    if erro is None:
+                        yield nome_arquivo, chunk_tipado, df_rejeitados
+                else:
+                    pendentes -= 1
+                    if tipo == 'erro' and erro is None:
+                        # Avisa os outros processos e continua esvaziando a fila até todos pararem
+                        erro = f"Erro ao ler '{nome_arquivo}': {chunk_tipado}"
+                        cancelar.set()
+        finally:
+            if pendentes:
+                # Saída antecipada: esvazia a fila para nenhum processo ficar travado no 'put'
+                cancelar.set()
+                while pendentes and not all(futuro.done() for futuro in futuros):
+                    try:
+                        if fila.get(timeout=1)[0] != 'pedaco':
+                            pendentes -= 1
+                    except queue.Empty:
+                        pass
+        if erro is not None:
+            raise ValueError(erro)
+
 # ==============================================================================
 # FUNÇÃO 1: PROCESSAR A NOVA BASE DE DADOS (Lógica do 01_preparar_dados.py)
 # ==============================================================================
-def processar_nova_base(uploaded_file, db_path, table_name):
+def processar_nova_base(uploaded_file, db_path, table_name, n_processos=None, modo='substituir', chave_dedupe=None,
+                        progresso=None, perfil=None):
     """
     Processa um arquivo (ZIP ou CSV) enviado pelo usuário e o transforma
-    em um banco de dados SQLite otimizado.
+    em um banco de dados SQLite otimizado. Quando o .zip tem vários CSVs,
+    eles são lidos em paralelo por até 'n_processos' processos (padrão: um
+    por núcleo; use 1 para desligar o paralelismo).
+
+    modo='substituir' recria o banco do zero. modo='anexar' mantém o
+    histórico: arquivos já ingeridos (mesmo hash) são pulados, colunas novas
+    são adicionadas à tabela e, se 'chave_dedupe' for informada (lista de
+    colunas), linhas repetidas nessa chave são descartadas.
+
+    'uploaded_file' pode ser o arquivo enviado pelo Streamlit ou o caminho de
+    um arquivo em disco. 'progresso', se informado, é chamado como
+    progresso(etapa, **dados) a cada etapa e a cada pedaço carregado.
+    'perfil' (instrumentacao.Perfilador), se informado, recebe o tempo, a
+    CPU e a memória de cada etapa e de cada pedaço carregado.
+
+    O banco é alterado no lugar: as tarefas do app o chamam sobre uma cópia
+    numa geração nova (geracao.py), publicada só depois de validada.
     """
+    if modo not in MODOS_INGESTAO:
+        raise ValueError(f"Modo de ingestão inválido: '{modo}'. Use {MODOS_INGESTAO}.")
     print("Iniciando o processamento da nova base...")
+    db_path = Path(db_path)
+    perfil = perfil if perfil is not None else Perfilador()
+    perfil.iniciar_fase("Carga da base")
+    perfil.etapa("Recebimento do arquivo")
     
     # Cria um diretório temporário para trabalhar com os arquivos
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -28,22 +1082,29 @@ def processar_nova_base(uploaded_file, db_path, table_name):
         lista_arquivos_csv = []
         
         # Salva o arquivo enviado no diretório temporário
-        temp_file_path = temp_dir_path / uploaded_file.name
-        with open(temp_file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        if isinstance(uploaded_file, (str, os.PathLike)):
+            nome_enviado = Path(uploaded_file).name
+            temp_file_path = temp_dir_path / nome_enviado
+            shutil.copyfile(uploaded_file, temp_file_path)
+        else:
+            nome_enviado = uploaded_file.name
+            temp_file_path = temp_dir_path / nome_enviado
+            with open(temp_file_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
         
-        print(f"Arquivo '{uploaded_file.name}' salvo em diretório temporário.")
+        print(f"Arquivo '{nome_enviado}' salvo em diretório temporário.")
 
         # --- Etapa 0: Descompactar (se for .zip) ---
-        if uploaded_file.name.endswith('.zip'):
+        if nome_enviado.endswith('.zip'):
             print("Arquivo .zip detectado. Descompactando...")
+            perfil.etapa("Descompactação")
             with zipfile.ZipFile(temp_file_path, 'r') as zip_ref:
                 zip_ref.extractall(temp_dir_path)
             # Lista todos os CSVs extraídos
             lista_arquivos_csv = glob.glob(str(temp_dir_path / "*.csv"))
         
         # --- Etapa 0: Lidar com .csv único ---
-        elif uploaded_file.name.endswith('.csv'):
+        elif nome_enviado.endswith('.csv'):
             print("Arquivo .csv único detectado.")
             lista_arquivos_csv = [str(temp_file_path)]
         
@@ -55,157 +1116,1304 @@ def processar_nova_base(uploaded_file, db_path, table_name):
             
         print(f"Arquivos CSV a processar: {len(lista_arquivos_csv)}")
 
-        # --- Etapa 1: Pré-Análise (Achar todas as colunas) ---
-        print("Analisando cabeçalhos de todos os arquivos...")
-        colunas_master = set()
-        for arquivo in lista_arquivos_csv:
-            df_header = pd.read_csv(arquivo, nrows=0, encoding='latin1', sep=None, engine='python')
-            df_header.columns = df_header.columns.str.strip().str.replace('\n', '')
-            colunas_master.update(df_header.columns)
-        
-        master_columns_list = sorted(list(colunas_master))
-        print(f"Total de colunas únicas encontradas: {len(master_columns_list)}")
+        # A conexão é aberta no manifesto (anexar) ou na criação da tabela (substituir)
+        conn = None
+        try:
+            # --- Etapa 0: Manifesto (pula arquivos que já estão na base) ---
+            perfil.etapa("Hash dos arquivos", arquivos=len(lista_arquivos_csv))
+            anexar = modo == 'anexar' and db_path.exists()
+            hashes = {arquivo: calcular_hash_arquivo(arquivo) for arquivo in lista_arquivos_csv}
+            hashes_vistos = set()
+            if anexar:
+                conn = abrir_conexao_carga(db_path, PRAGMAS_ANEXO)
+                garantir_tabelas_controle(conn, table_name)
+                hashes_vistos = {
+                    linha[0] for linha in conn.execute(f'SELECT hash_sha256 FROM "{table_name}_arquivos"')
+                }
+            arquivos_novos = []
+            for arquivo in lista_arquivos_csv:
+                if hashes[arquivo] in hashes_vistos:
+                    print(f"  - {Path(arquivo).name}: já ingerido anteriormente, pulando.")
+                    continue
+                hashes_vistos.add(hashes[arquivo])
+                arquivos_novos.append(arquivo)
+            lista_arquivos_csv = arquivos_novos
 
-        # --- Etapa 2: Criação da Tabela Mestra e Inserção dos Dados ---
-        # Deletamos o banco antigo, se existir, para criar o novo
-        if db_path.exists():
-            db_path.unlink()
-            
-        conn = sqlite3.connect(db_path)
-        
-        df_vazio = pd.DataFrame(columns=master_columns_list)
-        df_vazio.to_sql(table_name, conn, if_exists='replace', index=False)
-        print(f"Tabela '{table_name}' criada com sucesso.")
+            if not lista_arquivos_csv:
+                print("Nenhum arquivo novo para processar.")
+                return True, "Nenhum arquivo novo: todos os arquivos enviados já estavam na base."
 
-        for arquivo in lista_arquivos_csv:
-            print(f"Processando arquivo em pedaços: {Path(arquivo).name}...")
-            chunk_reader = pd.read_csv(arquivo, chunksize=100000, encoding='latin1', sep=None, engine='python')
-            
-            for i, chunk in enumerate(chunk_reader):
-                chunk.columns = chunk.columns.str.strip().str.replace('\n', '')
-                chunk_reindexado = chunk.reindex(columns=master_columns_list)
-                chunk_reindexado.to_sql(table_name, conn, if_exists='append', index=False)
-            
-        print("Todos os dados foram inseridos na tabela.")
-        conn.close()
+            # Um processo por arquivo (limitado aos núcleos da máquina)
+            if n_processos is None:
+                n_processos = os.cpu_count() or 1
+            n_processos = max(1, min(n_processos, len(lista_arquivos_csv)))
 
-        # --- Etapa 3: Correção dos Tipos de Dados ---
-        print("Iniciando otimização de tipos de dados...")
-        conn = sqlite3.connect(db_path)
-        
-        print("Analisando amostra para definir os tipos...")
-        df_amostra = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 200000", conn)
-        dtype_map = {}
-        for col in df_amostra.columns:
+            # --- Etapas 1 e 2: Pré-Análise (Dialeto, colunas e tipos de cada arquivo) ---
+            print("Detectando o dialeto e analisando amostras de todos os arquivos...")
+            if progresso:
+                progresso("Analisando arquivos", arquivos=len(lista_arquivos_csv))
+            perfil.etapa("Análise dos cabeçalhos e tipos", arquivos=len(lista_arquivos_csv), processos=n_processos)
+            if n_processos > 1:
+                with ProcessPoolExecutor(max_workers=n_processos, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    analises = list(pool.map(analisar_arquivo, lista_arquivos_csv))
+            else:
+                analises = [analisar_arquivo(arquivo) for arquivo in lista_arquivos_csv]
+
+            dialetos = {}
+            for arquivo, (dialeto, tipos) in zip(lista_arquivos_csv, analises):
+                dialetos[arquivo] = dialeto
+                print(f"  - {Path(arquivo).name}: separador={dialeto['separador']!r}, encoding={dialeto['encoding']}")
+
+            esquema_arquivos = combinar_esquemas([tipos for _, tipos in analises])
+
+            # --- Etapa 3: Tabela Tipada (criada do zero ou evoluída no modo anexar) ---
+            perfil.etapa("Criação da tabela", colunas=len(esquema_arquivos))
+            if anexar:
+                # O esquema da base manda; colunas que ainda não existem são adicionadas
+                esquema = ler_esquema_tabela(conn, table_name)
+                for col, tipo in esquema_arquivos.items():
+                    if col not in esquema:
+                        print(f"  - Nova coluna '{col}' ({tipo}) adicionada à tabela.")
+                        conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" {tipo}')
+                        esquema[col] = tipo
+            else:
+                esquema = esquema_arquivos
+                # Deletamos o banco antigo, se existir, para criar o novo
+                if db_path.exists():
+                    db_path.unlink()
+                shutil.rmtree(caminho_do_snapshot(db_path), ignore_errors=True)
+                conn = abrir_conexao_carga(db_path)
+                colunas_sql = ', '.join(f'"{col}" {tipo}' for col, tipo in esquema.items())
+                conn.execute(f'CREATE TABLE "{table_name}" ({colunas_sql})')
+                garantir_tabelas_controle(conn, table_name)
+                print(f"Tabela '{table_name}' criada com sucesso.")
+
+            print(f"Total de colunas na tabela: {len(esquema)}")
+            for col, tipo in esquema.items():
+                print(f"  - {col}: {tipo}")
+
+            if chave_dedupe:
+                colunas_faltando = [col for col in chave_dedupe if col not in esquema]
+                if colunas_faltando:
+                    raise ValueError(f"Colunas da chave de deduplicação não encontradas: {colunas_faltando}")
+                definir_chave_deduplicacao(conn, table_name, chave_dedupe)
+            deduplicar = tem_chave_deduplicacao(conn, table_name)
+            # Bases anteriores aos rollups precisam agregar o histórico inteiro
+            rollups_existiam = garantir_tabela_rollups(conn, table_name) or not anexar
+            dimensoes_rollup = [col for col in COLUNAS_INDICE if col in esquema]
+            medidas_rollup = colunas_medidas(esquema)
+            estatisticas_existiam = garantir_tabela_estatisticas(conn, table_name) or not anexar
+
+            if n_processos > 1:
+                print(f"Lendo {len(lista_arquivos_csv)} arquivos em {n_processos} processos...")
+                pedacos = ler_arquivos_em_paralelo(lista_arquivos_csv, dialetos, esquema, n_processos)
+            else:
+                pedacos = (
+                    (Path(arquivo).name, chunk_tipado, df_rejeitados)
+                    for arquivo in lista_arquivos_csv
+                    for chunk_tipado, df_rejeitados in ler_pedacos_tipados(arquivo, dialetos[arquivo], esquema)
+                )
+
+            # Único escritor: todos os pedaços (de qualquer processo) são gravados aqui,
+            # dentro de uma única transação
+            rowid_anterior = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+            rollups_desde = rowid_anterior if rollups_existiam else 0
+            rollups_em_memoria = rollups_desde == rowid_anterior
+            estatisticas_desde = rowid_anterior if estatisticas_existiam else 0
+            estatisticas_em_memoria = estatisticas_desde == rowid_anterior
+            # O snapshot colunar recebe os mesmos pedaços; se estiver atrasado em
+            # relação ao banco, é completado relendo o banco depois da carga
+            escritor_colunar = EscritorColunar(caminho_do_snapshot(db_path), esquema, rowid_anterior)
+            snapshot_em_memoria = escritor_colunar.rowid_desde == rowid_anterior
+            linhas_por_arquivo = {Path(arquivo).name: 0 for arquivo in lista_arquivos_csv}
+            inseridas_por_arquivo = {Path(arquivo).name: 0 for arquivo in lista_arquivos_csv}
+            total_rejeitados = 0
+            # Os rollups e as estatísticas das colunas são agregados a partir dos pedaços que já estão em memória
+            parciais_rollup = {}
+            parciais_estatisticas = {}
+            perfil.etapa("Carga dos pedaços", processos=n_processos)
+            inicio_carga = fim_pedaco = time.perf_counter()
+            conn.execute("BEGIN")
             try:
-                coluna_convertida = pd.to_numeric(df_amostra[col], errors='coerce')
-                if df_amostra[col].dtype == 'object' and coluna_convertida.dtype != 'object':
-                    if (coluna_convertida.dropna() % 1 == 0).all():
-                        dtype_map[col] = 'INTEGER'
-                    else:
-                        dtype_map[col] = 'REAL'
-                else:
-                    dtype_map[col] = 'TEXT'
-            except (ValueError, TypeError):
-                 dtype_map[col] = 'TEXT'
-        
-        table_name_new = f"{table_name}_new"
-        
-        print("Criando nova tabela otimizada...")
-        conn.execute(f"DROP TABLE IF EXISTS {table_name_new}")
-        create_table_sql = f"CREATE TABLE {table_name_new} ({', '.join([f'\"{col}\" {tipo}' for col, tipo in dtype_map.items()])})"
-        conn.execute(create_table_sql)
+                for nome_arquivo, chunk_tipado, df_rejeitados in pedacos:
+                    # Espera pelo pedaço: leitura e conversão de tipos (ou os processos de leitura)
+                    inicio_pedaco = time.perf_counter()
+                    inseridas = inserir_em_massa(conn, table_name, chunk_tipado, deduplicar)
+                    inseridas_por_arquivo[nome_arquivo] += inseridas
+                    if df_rejeitados is not None:
+                        total_rejeitados += inserir_em_massa(conn, f"{table_name}_rejeitados", df_rejeitados)
+                    tempo_insercao = time.perf_counter() - inicio_pedaco
+                    linhas_por_arquivo[nome_arquivo] += len(chunk_tipado)
+                    if inseridas != len(chunk_tipado):
+                        # A deduplicação descartou linhas deste pedaço: rollups, estatísticas
+                        # e snapshot serão montados relendo do banco só o que foi inserido
+                        rollups_em_memoria = estatisticas_em_memoria = snapshot_em_memoria = False
+                    if rollups_em_memoria:
+                        acumular_rollups(parciais_rollup, chunk_tipado, dimensoes_rollup, medidas_rollup)
+                    if estatisticas_em_memoria:
+                        acumular_estatisticas(parciais_estatisticas, chunk_tipado, esquema)
+                    if snapshot_em_memoria:
+                        escritor_colunar.adicionar(chunk_tipado)
+                    perfil.pedaco(len(chunk_tipado), arquivo=nome_arquivo, inseridas=inseridas,
+                                  leitura_s=round(inicio_pedaco - fim_pedaco, 4), insercao_s=round(tempo_insercao, 4))
+                    fim_pedaco = time.perf_counter()
+                    if progresso:
+                        progresso("Carregando linhas", linhas_lidas=sum(linhas_por_arquivo.values()),
+                                  linhas_inseridas=sum(inseridas_por_arquivo.values()))
 
-        print("Copiando dados para a nova tabela...")
-        chunk_reader_sql = pd.read_sql_query(f"SELECT * FROM {table_name}", conn, chunksize=100000)
-        
-        for i, chunk in enumerate(chunk_reader_sql):
-            chunk_convertido = chunk.astype({col: str for col in chunk.columns if dtype_map[col] == 'TEXT'})
-            chunk_convertido.to_sql(table_name_new, conn, if_exists='append', index=False)
-        
-        print("Substituindo tabelas...")
-        conn.execute(f"DROP TABLE {table_name}")
-        conn.execute(f"ALTER TABLE {table_name_new} RENAME TO {table_name}")
-        
-        conn.commit()
-        conn.close()
+                # --- Etapa 4: Resumos pré-agregados para o dashboard (mesma transação dos dados) ---
+                print("Atualizando os resumos pré-agregados (rollups)...")
+                if progresso:
+                    progresso("Atualizando resumos")
+                perfil.etapa("Resumos pré-agregados", em_memoria=rollups_em_memoria)
+                if not rollups_em_memoria:
+                    parciais_rollup = agregar_linhas_da_tabela(conn, table_name, esquema, rollups_desde)
+                gravar_rollups(conn, table_name, parciais_rollup)
+
+                # Vocabulários, medianas e histogramas do simulador e das métricas do painel
+                perfil.etapa("Estatísticas das colunas", em_memoria=estatisticas_em_memoria)
+                if not estatisticas_em_memoria:
+                    parciais_estatisticas = estatisticas_da_tabela(conn, table_name, esquema, estatisticas_desde)
+                gravar_estatisticas(conn, table_name, parciais_estatisticas)
+            except Exception:
+                # No modo anexar o histórico volta ao estado anterior à carga
+                conn.execute("ROLLBACK")
+                escritor_colunar.descartar()
+                raise
+
+            perfil.etapa("Manifesto e commit")
+            total_linhas = sum(linhas_por_arquivo.values())
+            total_inseridas = sum(inseridas_por_arquivo.values())
+            rowid_final = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+
+            # Manifesto: a carga e os arquivos que entraram nela (na mesma transação dos dados)
+            cursor = conn.execute(
+                f'INSERT INTO "{table_name}_ingestoes" (modo, data_hora, rowid_inicial, rowid_final, linhas_lidas, linhas_inseridas) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                ('anexar' if anexar else 'substituir', datetime.now().isoformat(timespec='seconds'), rowid_anterior + 1, rowid_final, total_linhas, total_inseridas)
+            )
+            ingestao_id = cursor.lastrowid
+            conn.executemany(
+                f'INSERT INTO "{table_name}_arquivos" (arquivo, hash_sha256, separador, encoding, aspas, linhas, linhas_inseridas, ingestao_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (Path(arquivo).name, hashes[arquivo], dialetos[arquivo]['separador'], dialetos[arquivo]['encoding'],
+                     dialetos[arquivo]['aspas'], linhas_por_arquivo[Path(arquivo).name],
+                     inseridas_por_arquivo[Path(arquivo).name], ingestao_id)
+                    for arquivo in lista_arquivos_csv
+                ]
+            )
+            conn.execute("COMMIT")
+
+            duracao_carga = time.perf_counter() - inicio_carga
+            print(f"{total_linhas} linhas carregadas em {duracao_carga:.1f}s "
+                  f"({total_linhas / max(duracao_carga, 1e-9):,.0f} linhas/s).")
+
+            # --- Etapa 5: Snapshot colunar (carregado pelo app no lugar do SELECT *) ---
+            # Só passa a valer depois do COMMIT; se falhar, o app lê do banco
+            print("Atualizando o snapshot colunar...")
+            if progresso:
+                progresso("Atualizando snapshot colunar")
+            # Sem os pedaços em memória, a tabela inteira é copiada do banco para o snapshot
+            perfil.etapa("Snapshot colunar", copia_da_tabela=not snapshot_em_memoria)
+            try:
+                if not snapshot_em_memoria:
+                    escritor_colunar.descartar()
+                    copiar_tabela_para_snapshot(conn, table_name, escritor_colunar)
+                escritor_colunar.concluir(ingestao_id, rowid_final)
+            except OSError as e:
+                print(f"Aviso: não foi possível atualizar o snapshot colunar ({e}).")
+
+            # --- Etapa 6: Índices das colunas categóricas ---
+            # No modo anexar os índices existentes já foram atualizados pelos INSERTs:
+            # só colunas novas ganham índice e o ANALYZE completo é dispensado
+            print("Criando índices e atualizando estatísticas...")
+            if progresso:
+                progresso("Criando índices")
+            perfil.etapa("Índices e estatísticas")
+            criar_indices(conn, table_name, [col for col in COLUNAS_INDICE if col in esquema], analisar=not anexar)
+            perfil.concluir()
+            print("Todos os dados foram inseridos na tabela.")
+        finally:
+            # Qualquer erro (inclusive antes do BEGIN) fecha a conexão
+            if conn is not None:
+                conn.close()
         
+    mensagem = "Processamento da base concluído."
+    if anexar:
+        mensagem = f"{total_inseridas:,} novas linhas anexadas à base."
+        if total_linhas > total_inseridas:
+            mensagem += f" {total_linhas - total_inseridas:,} linhas repetidas foram descartadas."
+    if total_rejeitados:
+        print(f"{total_rejeitados} valores fora do tipo esperado foram gravados como NULL.")
+        mensagem += (f" {total_rejeitados} valores fora do tipo esperado foram gravados como NULL "
+                     f"(detalhes na tabela '{table_name}_rejeitados').")
     print("Processamento da nova base concluído com sucesso!")
-    return True, "Processamento da base concluído."
+    return True, mensagem
+
+# ==============================================================================
+# CODIFICADOR DE FEATURES (One-Hot ou ordinal, salvo junto com o modelo)
+# ==============================================================================
+# O caminho do arquivo (caminho_do_codificador) e a gravação ficam no artefato_modelo.py
+FORMATOS_CODIFICADOR = ('one_hot', 'ordinal')
+
+def montar_codificador(categorias, colunas_numericas, formato='one_hot'):
+    """
+    Registra o esquema das features usado no treino: o vocabulário de cada
+    coluna categórica ({coluna: níveis ordenados}) e a ordem final das colunas
+    (numéricas primeiro). Com ele, uma linha nova é codificada sem precisar
+    rodar o pd.get_dummies sobre a base inteira.
+
+    formato='one_hot': uma dummy por nível, exceto o descartado pelo
+    'drop_first' (como no pd.get_dummies); 'posicoes' guarda a coluna de cada nível.
+    formato='ordinal': uma coluna por categórica com o código do nível (posição
+    no vocabulário; vazio ou fora do vocabulário vira NaN); 'posicoes' guarda o código.
+
+    Os 'valores_padrao' são preenchidos depois, com as estatísticas da base.
+    """
+    if formato not in FORMATOS_CODIFICADOR:
+        raise ValueError(f"Formato de codificador inválido: '{formato}'. Use {FORMATOS_CODIFICADOR}.")
+    colunas_features = list(colunas_numericas)
+    posicoes = {}
+    for col, niveis in categorias.items():
+        if formato == 'ordinal':
+            posicoes[col] = {valor: codigo for codigo, valor in enumerate(niveis)}
+            colunas_features.append(col)
+            continue
+        # O primeiro nível é descartado pelo drop_first=True (vira a linha de zeros)
+        posicoes[col] = {}
+        for valor in niveis[1:]:
+            posicoes[col][valor] = len(colunas_features)
+            colunas_features.append(f"{col}_{valor}")
+
+    return {
+        'formato': formato,
+        'colunas_categoricas': list(categorias),
+        'colunas_numericas': list(colunas_numericas),
+        'categorias': {col: list(niveis) for col, niveis in categorias.items()},
+        'niveis_descartados': {col: niveis[0] for col, niveis in categorias.items() if niveis},
+        'posicoes': posicoes,
+        'colunas_features': colunas_features,
+        'indice_coluna': {nome: i for i, nome in enumerate(colunas_features)},
+        'valores_padrao': {},
+    }
+
+def codificar_linha(registro, codificador):
+    """
+    Codifica um único incidente (dicionário coluna -> valor) no mesmo formato
+    das features de treino. O custo depende só do número de colunas, não do
+    tamanho da base. Valores fora do vocabulário (ou o nível descartado)
+    ficam com todas as dummies da coluna zeradas, como no pd.get_dummies
+    (no formato ordinal, com o código NaN).
+    """
+    colunas_features = codificador['colunas_features']
+    indice_coluna = codificador['indice_coluna']
+    linha = np.zeros((1, len(colunas_features)))
+
+    for col in codificador['colunas_numericas']:
+        linha[0, indice_coluna[col]] = registro[col]
+
+    ordinal = codificador.get('formato', 'one_hot') == 'ordinal'
+    for col, posicoes_col in codificador['posicoes'].items():
+        posicao = posicoes_col.get(registro[col])
+        if ordinal:
+            linha[0, indice_coluna[col]] = np.nan if posicao is None else posicao
+        elif posicao is not None:
+            linha[0, posicao] = 1
+
+    return pd.DataFrame(linha, columns=colunas_features)
+
+def codificar_dataframe(df, codificador):
+    """
+    Versão vetorizada do 'codificar_linha' para um bloco de incidentes.
+    Colunas ausentes ou valores vazios recebem o valor padrão do treino;
+    codificadores gravados antes dos valores padrão preenchem os numéricos
+    com 0 e deixam as dummies da coluna zeradas.
+    """
+    colunas_features = codificador['colunas_features']
+    indice_coluna = codificador['indice_coluna']
+    valores_padrao = codificador.get('valores_padrao', {})
+    matriz = np.zeros((len(df), len(colunas_features)))
+
+    for col in codificador['colunas_numericas']:
+        if col in df.columns:
+            valores = pd.to_numeric(df[col], errors='coerce').fillna(valores_padrao.get(col, 0.0))
+            matriz[:, indice_coluna[col]] = valores.to_numpy()
+        else:
+            matriz[:, indice_coluna[col]] = valores_padrao.get(col, 0.0)
+
+    ordinal = codificador.get('formato', 'one_hot') == 'ordinal'
+    for col, posicoes_col in codificador['posicoes'].items():
+        if col in df.columns:
+            valores = df[col].where(df[col].notna(), valores_padrao.get(col))
+        else:
+            valores = pd.Series(valores_padrao.get(col), index=df.index, dtype=object)
+        posicoes = valores.map(posicoes_col)
+        if ordinal:
+            matriz[:, indice_coluna[col]] = posicoes.astype(np.float64).to_numpy()
+            continue
+        validas = posicoes.notna().to_numpy()
+        matriz[np.flatnonzero(validas), posicoes[validas].astype(int).to_numpy()] = 1
+
+    return pd.DataFrame(matriz, columns=colunas_features, copy=False)
+
+# ==============================================================================
+# FEATURES ESPARSAS (One-Hot em CSR montado em pedaços a partir do SQLite)
+# ==============================================================================
+COLUNA_ALVO_REG = "Financial Loss (in Million $)"
+COLUNA_ALVO_CLASS = "Attack Type"
+COLUNAS_CATEGORICAS_CLASS = [
+    'Attack Source', 'Country', 'Defense Mechanism Used',
+    'Security Vulnerability Type', 'Target Industry', 'Year'
+]
+
+# Acima desse tamanho a matriz de treino da floresta continua esparsa (o
+# RandomForest é bem mais lento com entrada esparsa, mas a memória fica
+# proporcional aos valores não nulos)
+MEMORIA_MAX_DENSO_MB = 1024
+
+def ler_vocabulario(conn, table_name, colunas):
+    """
+    Níveis de cada coluna categórica com a contagem de linhas, em ordem
+    crescente (a mesma do pd.get_dummies). Vêm dos rollups gravados na
+    ingestão, sem varrer a base; sem rollups, um GROUP BY por coluna (indexada).
+    """
+    vocabulario = {}
+    for col in colunas:
+        try:
+            linhas = conn.execute(
+                f'SELECT val_a, contagem FROM "{table_name}_rollups" WHERE dim_a = ? AND dim_b = \'\' AND medida = ?',
+                (col, MEDIDA_CONTAGEM)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            linhas = []
+        if not linhas:
+            linhas = conn.execute(
+                f'SELECT "{col}", COUNT(*) FROM "{table_name}" WHERE "{col}" IS NOT NULL GROUP BY "{col}"'
+            ).fetchall()
+        vocabulario[col] = pd.Series(dict(linhas), dtype=np.int64).sort_index()
+    return vocabulario
+
+def preparar_para_arvores(X):
+    """
+    As árvores do scikit-learn trabalham com float32 denso (com entrada esparsa
+    o treino fica várias vezes mais lento): só mantém o CSR se a versão densa
+    passar do limite de memória. Matrizes que já são densas passam direto.
+    """
+    if not sp.issparse(X):
+        return X
+    tamanho_denso_mb = X.shape[0] * X.shape[1] * 4 / 1e6
+    if tamanho_denso_mb <= MEMORIA_MAX_DENSO_MB:
+        return X.toarray()
+    print(f"  - Matriz de treino densa teria {tamanho_denso_mb:,.0f} MB: treinando com a matriz esparsa.")
+    return X
+
+def ajustar_floresta(modelo, X, y, progresso=None, arvores_por_etapa=10):
+    """
+    Ajusta a floresta. Com 'progresso', as árvores são criadas em etapas de
+    'arvores_por_etapa' (warm_start) e progresso("Treinando floresta",
+    arvores=..., total=...) é chamado a cada etapa. As sementes de cada árvore
+    seguem a mesma sequência de um fit único, então o modelo é o mesmo.
+    """
+    if progresso is None or not hasattr(modelo, 'n_estimators'):
+        return modelo.fit(X, y)
+    total = modelo.n_estimators
+    warm_start_original = modelo.warm_start
+    inicial = len(getattr(modelo, 'estimators_', [])) if warm_start_original else 0
+    modelo.set_params(warm_start=True)
+    if not warm_start_original and hasattr(modelo, 'estimators_'):
+        del modelo.estimators_
+    try:
+        for n_arvores in range(min(inicial + arvores_por_etapa, total), total + arvores_por_etapa, arvores_por_etapa):
+            n_arvores = min(n_arvores, total)
+            modelo.set_params(n_estimators=n_arvores)
+            modelo.fit(X, y)
+            progresso("Treinando floresta", arvores=n_arvores - inicial, total=total - inicial)
+            if n_arvores == total:
+                break
+    finally:
+        modelo.set_params(warm_start=warm_start_original, n_estimators=total)
+    return modelo
+
+def dummies_esparsas(df, posicoes, n_colunas, deslocamento=0):
+    """
+    One-Hot em CSR das colunas em 'posicoes' ({coluna: {valor: índice}}): uma
+    entrada 1 por linha e coluna cujo valor tem posição (o nível descartado,
+    valores vazios ou fora do vocabulário não geram entrada).
+    """
+    linhas, colunas = [], []
+    for col, posicoes_col in posicoes.items():
+        posicoes_linha = df[col].map(posicoes_col)
+        validas = posicoes_linha.notna().to_numpy()
+        linhas.append(np.flatnonzero(validas))
+        colunas.append(posicoes_linha[validas].to_numpy(dtype=np.int64) - deslocamento)
+    linhas = np.concatenate(linhas) if linhas else np.empty(0, np.int64)
+    colunas = np.concatenate(colunas) if colunas else np.empty(0, np.int64)
+    return sp.csr_matrix((np.ones(len(linhas), dtype=np.float32), (linhas, colunas)), shape=(len(df), n_colunas))
+
+def _imputar_numericas(numericas, colunas_numericas, codificador):
+    """
+    Preenche os vazios de cada coluna numérica com o valor padrão do
+    codificador; se ele ainda não tiver um, com a mediana das linhas lidas,
+    que é gravada em codificador['valores_padrao'].
+    """
+    valores_padrao = codificador.setdefault('valores_padrao', {})
+    for i, col in enumerate(colunas_numericas):
+        vazios = np.isnan(numericas[:, i])
+        if col not in valores_padrao:
+            valores_padrao[col] = float(np.median(numericas[~vazios, i])) if (~vazios).any() else 0.0
+        numericas[vazios, i] = valores_padrao[col]
+
+def ler_features_esparsas(conn, table_name, codificador, colunas_extras=(), filtro_sql='', params=(), chunksize=200000,
+                          progresso=None):
+    """
+    Lê a base em pedaços e monta a matriz de features em CSR (float32): as
+    colunas numéricas seguidas das dummies do codificador. Nenhum pedaço vira
+    uma matriz densa de linhas x níveis, então a memória acompanha o número
+    de valores não nulos. Valores numéricos vazios recebem o valor padrão do
+    codificador; se ele ainda não tiver um, a mediana das linhas lidas, que é
+    gravada em codificador['valores_padrao']. 'filtro_sql' (ex.: 'WHERE rowid > ?')
+    restringe as linhas lidas; 'progresso' é chamado a cada pedaço lido.
+    Retorna (X, {coluna_extra: array}) com as colunas extras (ex.: alvos) sem alteração.
+    """
+    colunas_numericas = codificador['colunas_numericas']
+    n_numericas = len(colunas_numericas)
+    n_dummies = len(codificador['colunas_features']) - n_numericas
+    colunas_sql = list(dict.fromkeys(colunas_numericas + codificador['colunas_categoricas'] + list(colunas_extras)))
+    colunas_select = ', '.join(f'"{col}"' for col in colunas_sql)
+
+    blocos_numericos, blocos_dummies = [], []
+    extras = {col: [] for col in colunas_extras}
+    consulta = f'SELECT {colunas_select} FROM "{table_name}" {filtro_sql}'
+    for chunk in pd.read_sql_query(consulta, conn, params=params, chunksize=chunksize):
+        blocos_numericos.append(chunk[colunas_numericas].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64))
+        blocos_dummies.append(dummies_esparsas(chunk, codificador['posicoes'], n_dummies, n_numericas))
+        for col in colunas_extras:
+            extras[col].append(chunk[col].to_numpy())
+        if progresso:
+            progresso("Lendo features", linhas_lidas=sum(len(bloco) for bloco in blocos_numericos))
+
+    numericas = np.concatenate(blocos_numericos) if blocos_numericos else np.empty((0, n_numericas))
+    _imputar_numericas(numericas, colunas_numericas, codificador)
+    dummies = sp.vstack(blocos_dummies, format='csr') if blocos_dummies else sp.csr_matrix((0, n_dummies), dtype=np.float32)
+    X = sp.hstack([sp.csr_matrix(numericas), dummies], format='csr', dtype=np.float32)
+    extras = {col: np.concatenate(partes) if partes else np.empty(0, dtype=object) for col, partes in extras.items()}
+    return X, extras
+
+def ler_features_ordinais(conn, table_name, codificador, colunas_extras=(), filtro_sql='', params=(), chunksize=200000,
+                          progresso=None):
+    """
+    Versão do 'ler_features_esparsas' para o codificador ordinal: uma matriz
+    densa float32 com as numéricas seguidas do código de cada categórica (NaN
+    para vazio ou fora do vocabulário). São poucas colunas, uma por campo, e
+    nenhuma dummy é criada.
+    Retorna (X, {coluna_extra: array}).
+    """
+    colunas_numericas = codificador['colunas_numericas']
+    colunas_categoricas = codificador['colunas_categoricas']
+    colunas_sql = list(dict.fromkeys(colunas_numericas + colunas_categoricas + list(colunas_extras)))
+    colunas_select = ', '.join(f'"{col}"' for col in colunas_sql)
+
+    blocos_numericos, blocos_codigos = [], []
+    extras = {col: [] for col in colunas_extras}
+    consulta = f'SELECT {colunas_select} FROM "{table_name}" {filtro_sql}'
+    for chunk in pd.read_sql_query(consulta, conn, params=params, chunksize=chunksize):
+        blocos_numericos.append(chunk[colunas_numericas].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64))
+        blocos_codigos.append(np.column_stack([
+            chunk[col].map(codificador['posicoes'][col]).astype(np.float32).to_numpy() for col in colunas_categoricas
+        ]) if colunas_categoricas else np.empty((len(chunk), 0), dtype=np.float32))
+        for col in colunas_extras:
+            extras[col].append(chunk[col].to_numpy())
+        if progresso:
+            progresso("Lendo features", linhas_lidas=sum(len(bloco) for bloco in blocos_numericos))
+
+    numericas = np.concatenate(blocos_numericos) if blocos_numericos else np.empty((0, len(colunas_numericas)))
+    _imputar_numericas(numericas, colunas_numericas, codificador)
+    codigos = np.concatenate(blocos_codigos) if blocos_codigos else np.empty((0, len(colunas_categoricas)), np.float32)
+    X = np.hstack([numericas.astype(np.float32), codigos])
+    extras = {col: np.concatenate(partes) if partes else np.empty(0, dtype=object) for col, partes in extras.items()}
+    return X, extras
+
+# ==============================================================================
+# SELEÇÃO DE MODELO (Successive halving com orçamento de tempo)
+# ==============================================================================
+# Candidatos avaliados na seleção (nome exibido no relatório -> estimador)
+CANDIDATOS_SELECAO = {
+    'Random Forest (100 árvores)': RandomForestClassifier(n_estimators=100, random_state=42),
+    'Random Forest (200 árvores, folhas >= 5)': RandomForestClassifier(n_estimators=200, min_samples_leaf=5, random_state=42),
+    'Random Forest (100 árvores, profundidade <= 20)': RandomForestClassifier(n_estimators=100, max_depth=20, random_state=42),
+    'Random Forest (100 árvores, 50% das features)': RandomForestClassifier(n_estimators=100, max_features=0.5, random_state=42),
+    'Extra Trees (200 árvores)': ExtraTreesClassifier(n_estimators=200, random_state=42),
+    'Extra Trees (200 árvores, folhas >= 5)': ExtraTreesClassifier(n_estimators=200, min_samples_leaf=5, random_state=42),
+    'Regressão Logística (C = 1)': make_pipeline(MaxAbsScaler(), LogisticRegression(C=1.0, max_iter=500)),
+    'Regressão Logística (C = 0,1)': make_pipeline(MaxAbsScaler(), LogisticRegression(C=0.1, max_iter=500)),
+}
+# Usado quando a seleção está desligada (orçamento 0)
+CANDIDATO_PADRAO = 'Random Forest (100 árvores)'
+# Variações do HistGradientBoosting (as colunas categóricas são definidas pelo codificador)
+PARAMETROS_HGB = {
+    'Gradient Boosting (padrão)': {},
+    'Gradient Boosting (taxa 0,05, 300 iterações)': {'learning_rate': 0.05, 'max_iter': 300},
+    'Gradient Boosting (63 folhas)': {'max_leaf_nodes': 63},
+    'Gradient Boosting (folhas >= 50, L2 = 1)': {'min_samples_leaf': 50, 'l2_regularization': 1.0},
+}
+MAX_NIVEIS_HGB = 255  # Acima disso o HistGradientBoosting não aceita a coluna como categórica
+
+# Motores de classificação: cada um define o formato das features e os candidatos
+MOTORES_CLASSIFICADOR = {
+    'floresta': {
+        'rotulo': 'Florestas e Regressão Logística (One-Hot)',
+        'formato': 'one_hot',
+        'candidato_padrao': CANDIDATO_PADRAO,
+    },
+    'hist_gradient_boosting': {
+        'rotulo': 'Gradient Boosting por histograma (categorias nativas)',
+        'formato': 'ordinal',
+        'candidato_padrao': 'Gradient Boosting (padrão)',
+    },
+}
+MOTOR_PADRAO = 'floresta'
+ORCAMENTO_SELECAO_S = 120
+FATOR_ELIMINACAO = 2          # A cada rodada fica 1/2 dos candidatos, com o dobro de linhas
+LATENCIA_MAX_MS = 50.0        # Predição de um incidente (o simulador pontua um por vez)
+TAMANHO_MAX_MB = 500.0        # Tamanho do .pkl salvo
+AMOSTRA_INICIAL_MAX = 20000   # Linhas da primeira rodada (as seguintes dobram)
+AMOSTRA_PILOTO = 1000         # Piloto que estima o tempo da primeira rodada
+
+def candidatos_do_motor(motor, codificador):
+    """
+    Candidatos da seleção para o motor escolhido (nome exibido -> estimador).
+    Os do HistGradientBoosting recebem a máscara das colunas categóricas do
+    codificador ordinal, para tratá-las como categorias de verdade.
+    """
+    if motor not in MOTORES_CLASSIFICADOR:
+        raise ValueError(f"Motor inválido: '{motor}'. Use {list(MOTORES_CLASSIFICADOR)}.")
+    if motor == 'floresta':
+        return CANDIDATOS_SELECAO
+    categoricas = [
+        col in codificador['colunas_categoricas'] and len(codificador['posicoes'][col]) <= MAX_NIVEIS_HGB
+        for col in codificador['colunas_features']
+    ]
+    return {
+        nome: HistGradientBoostingClassifier(categorical_features=categoricas, random_state=42, **parametros)
+        for nome, parametros in PARAMETROS_HGB.items()
+    }
+
+def caminho_do_relatorio_selecao(model_save_path):
+    """O relatório da seleção fica ao lado do modelo."""
+    return Path(model_save_path).with_name('relatorio_selecao.json')
+
+def registrar_nomes_features(modelo, nomes):
+    """
+    Treinado sem DataFrame: registra os nomes para o scikit-learn conferir as
+    colunas recebidas na predição (codificar_linha / codificar_dataframe). Num
+    Pipeline, quem confere é o primeiro passo.
+    """
+    alvo = modelo.steps[0][1] if isinstance(modelo, Pipeline) else modelo
+    alvo.feature_names_in_ = np.asarray(nomes, dtype=object)
+
+def medir_modelo(modelo, X_amostra, repeticoes=20):
+    """Latência (mediana, ms) de prever um único incidente e tamanho do modelo serializado (MB)."""
+    linha = X_amostra[:1]
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        modelo.predict_proba(linha)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tamanho_mb = len(pickle.dumps(modelo, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6
+    return float(np.median(tempos)), tamanho_mb
+
+def _avaliar_candidato(nome, estimador, X_train, y_train, X_val, y_val, n_jobs=1):
+    """Ajusta um candidato e mede acurácia, tempo de ajuste, latência e tamanho."""
+    modelo = clone(estimador)
+    if 'n_jobs' in modelo.get_params():
+        modelo.set_params(n_jobs=n_jobs)
+    inicio = time.perf_counter()
+    modelo.fit(X_train, y_train)
+    tempo_ajuste = time.perf_counter() - inicio
+    latencia_ms, tamanho_mb = medir_modelo(modelo, X_val)
+    return {
+        'nome': nome,
+        'acuracia': float(accuracy_score(y_val, modelo.predict(X_val))),
+        'tempo_ajuste_s': round(tempo_ajuste, 3),
+        'latencia_ms': round(latencia_ms, 3),
+        'tamanho_mb': round(tamanho_mb, 3),
+        'dentro_dos_limites': latencia_ms <= LATENCIA_MAX_MS and tamanho_mb <= TAMANHO_MAX_MB,
+    }
+
+def _rodada_de_selecao(candidatos, vivos, X_busca, y_busca, X_val, y_val):
+    """Avalia os candidatos 'vivos' em paralelo; retorna (resultados do melhor para o pior, duração em s)."""
+    inicio = time.perf_counter()
+    resultados = Parallel(n_jobs=-1)(
+        delayed(_avaliar_candidato)(nome, candidatos[nome], X_busca, y_busca, X_val, y_val) for nome in vivos
+    )
+    # Empate na acurácia: fica o mais rápido de treinar (o treino final usa todas as linhas)
+    resultados.sort(key=lambda resultado: (not resultado['dentro_dos_limites'], -resultado['acuracia'],
+                                           resultado['tempo_ajuste_s']))
+    return resultados, time.perf_counter() - inicio
+
+def selecionar_modelo(X, y, orcamento_s=ORCAMENTO_SELECAO_S, candidatos=CANDIDATOS_SELECAO,
+                      fator=FATOR_ELIMINACAO, progresso=None, semente=42):
+    """
+    Successive halving: todos os candidatos são ajustados em paralelo numa
+    subamostra pequena, avaliados numa validação separada, e só a melhor
+    fração 1/'fator' segue para a rodada seguinte, com 'fator' vezes mais
+    linhas (a primeira usa no máximo AMOSTRA_INICIAL_MAX), até a rodada com
+    todas as linhas da busca, onde o vencedor é escolhido. A validação cresce
+    com a rodada (uma linha para cada quatro de treino, como na divisão 80/20).
+
+    Orçamento: um piloto com AMOSTRA_PILOTO linhas mede o custo por linha e
+    a primeira rodada encolhe até caber em 'orcamento_s'; as seguintes só
+    começam se a estimativa do seu tempo (a rodada anterior escalada pelas
+    linhas e pelos candidatos) couber no que resta. Candidatos acima dos
+    limites de latência ou de tamanho são descartados (o vencedor é conferido
+    de novo depois do treino final, com todas as linhas).
+
+    Retorna (nomes dos finalistas do melhor para o pior, rodadas para o relatório).
+    """
+    estratificar = y if pd.Series(y).value_counts().min() > 1 else None
+    X_busca, X_val, y_busca, y_val = train_test_split(X, y, test_size=0.2, random_state=semente, stratify=estratificar)
+    y_busca, y_val = np.asarray(y_busca), np.asarray(y_val)
+    # Subamostras aninhadas: a rodada usa as primeiras linhas de permutações fixas (da busca e da validação)
+    gerador = np.random.default_rng(semente)
+    ordem, ordem_val = gerador.permutation(len(y_busca)), gerador.permutation(len(y_val))
+    n_busca = len(y_busca)
+    n_rodadas = max(1, int(np.ceil(np.log(len(candidatos)) / np.log(fator))))
+    inicial = max(min(n_busca // fator ** (n_rodadas - 1), AMOSTRA_INICIAL_MAX), min(n_busca, 1000))
+
+    def subamostra(n_linhas):
+        linhas = np.sort(ordem[:n_linhas])
+        linhas_val = np.sort(ordem_val[:min(len(y_val), max(1, n_linhas // 4))])
+        return X_busca[linhas], y_busca[linhas], X_val[linhas_val], y_val[linhas_val]
+
+    vivos = list(candidatos)
+    rodadas = []
+    inicio = time.perf_counter()
+    piloto = None
+    if inicial > AMOSTRA_PILOTO:
+        # A primeira rodada não tem anterior para estimar o seu tempo: mede num piloto
+        print(f"  - Piloto: {len(vivos)} candidatos com {AMOSTRA_PILOTO:,} linhas...")
+        piloto = _rodada_de_selecao(candidatos, vivos, *subamostra(AMOSTRA_PILOTO))
+        restante = orcamento_s - (time.perf_counter() - inicio)
+        cabe = max(int(AMOSTRA_PILOTO * restante / max(piloto[1], 1e-6)), AMOSTRA_PILOTO)
+        if cabe < inicial:
+            print(f"  - Primeira rodada reduzida de {inicial:,} para {cabe:,} linhas pelo orçamento.")
+            inicial = cabe
+
+    # Cada tamanho aparece uma vez só: a última rodada possível usa todas as linhas da busca
+    tamanhos = []
+    while len(tamanhos) < n_rodadas and (not tamanhos or tamanhos[-1] < n_busca):
+        tamanhos.append(min(n_busca, inicial * fator ** len(tamanhos)))
+
+    duracao_anterior = None
+    for r, n_linhas in enumerate(tamanhos):
+        if duracao_anterior is not None:
+            anterior = rodadas[-1]
+            estimativa = duracao_anterior * (n_linhas / anterior['amostra']) * (len(vivos) / len(anterior['candidatos']))
+            if time.perf_counter() - inicio + estimativa > orcamento_s:
+                print(f"  - Rodada {r + 1} levaria ~{estimativa:.0f}s: fora do orçamento, seleção encerrada.")
+                break
+        print(f"  - Rodada {r + 1}: {len(vivos)} candidatos com {n_linhas:,} linhas...")
+        if progresso:
+            progresso("Selecionando modelo", rodada=r + 1, rodadas=len(tamanhos), candidatos=len(vivos), amostra=n_linhas)
+        if r == 0 and piloto is not None and n_linhas == AMOSTRA_PILOTO:
+            # O orçamento só comporta o piloto: ele é a primeira rodada
+            resultados, duracao_anterior = piloto
+        else:
+            resultados, duracao_anterior = _rodada_de_selecao(candidatos, vivos, *subamostra(n_linhas))
+        rodadas.append({'rodada': r + 1, 'amostra': int(n_linhas), 'duracao_s': round(duracao_anterior, 2),
+                        'candidatos': resultados})
+        for resultado in resultados:
+            print(f"      {resultado['nome']}: {resultado['acuracia'] * 100:.2f}% "
+                  f"({resultado['tempo_ajuste_s']:.1f}s, {resultado['latencia_ms']:.1f} ms, {resultado['tamanho_mb']:.1f} MB)")
+        validos = [resultado['nome'] for resultado in resultados if resultado['dentro_dos_limites']]
+        if len(validos) <= 1:
+            break
+        vivos = validos[:int(np.ceil(len(validos) / fator))]
+
+    # Finalistas: os candidatos válidos da última rodada concluída, do melhor para o pior
+    finalistas = [resultado['nome'] for resultado in rodadas[-1]['candidatos'] if resultado['dentro_dos_limites']]
+    return finalistas, rodadas
 
 # ==============================================================================
 # FUNÇÃO 2: TREINAR O NOVO MODELO (Lógica do 02_treinar_modelo.py)
 # ==============================================================================
-def treinar_novo_modelo(db_path, table_name, model_save_path):
+def treinar_novo_modelo(db_path, table_name, model_save_path, progresso=None, orcamento_selecao=ORCAMENTO_SELECAO_S,
+                        motor=MOTOR_PADRAO, compressao=COMPRESSAO_PADRAO, max_profundidade=None, max_folhas=None,
+                        perfil=None):
     """
-    Carrega os dados do banco SQLite, treina os modelos de regressão e 
-    classificação, e salva o melhor modelo de classificação.
+    Lê os dados do banco SQLite em pedaços, treina os modelos de regressão e
+    classificação, e salva o melhor modelo de classificação. O 'motor'
+    (MOTORES_CLASSIFICADOR) define as features (One-Hot esparsas ou códigos
+    ordinais) e os candidatos; o classificador é escolhido entre eles por
+    successive halving em até 'orcamento_selecao' segundos (0 desliga a
+    seleção e treina o candidato padrão do motor); o relatório vai para
+    'relatorio_selecao.json'. 'progresso' recebe as linhas lidas, as rodadas
+    da seleção e as árvores ajustadas.
+
+    O modelo é salvo como artefato versionado (artefato_modelo.py) com a
+    'compressao' escolhida; florestas são podadas em 'max_profundidade' e/ou
+    'max_folhas' por árvore antes da avaliação, então as métricas e os
+    limites de latência e tamanho já valem para o modelo podado.
+
+    'perfil' (instrumentacao.Perfilador), se informado, recebe o tempo, a
+    CPU e a memória de cada etapa (e de cada pedaço lido do banco).
     """
     print("Iniciando treinamento do novo modelo...")
+    if motor not in MOTORES_CLASSIFICADOR:
+        return False, f"Motor de classificação inválido: '{motor}'. Use {list(MOTORES_CLASSIFICADOR)}."
+    formato = MOTORES_CLASSIFICADOR[motor]['formato']
+    perfil = perfil if perfil is not None else Perfilador()
+    perfil.iniciar_fase("Treino do modelo")
+    perfil.etapa("Esquema e vocabulário")
     try:
         conn = sqlite3.connect(db_path)
-        df_original = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-        conn.close()
-        print(f"Dados carregados do DB: {df_original.shape[0]} linhas.")
+        try:
+            esquema = ler_esquema_tabela(conn, table_name)
+            if COLUNA_ALVO_CLASS not in esquema:
+                return False, f"Coluna alvo '{COLUNA_ALVO_CLASS}' não encontrada na nova base."
+
+            # Vocabulário conhecido de antemão (metadados da ingestão): o One-Hot
+            # é montado pedaço a pedaço, sem o pd.get_dummies sobre a base inteira
+            colunas_categoricas_class_validas = [col for col in COLUNAS_CATEGORICAS_CLASS if col in esquema]
+            vocabulario = ler_vocabulario(conn, table_name, colunas_categoricas_class_validas + [COLUNA_ALVO_CLASS])
+            colunas_numericas = [
+                col for col, tipo in esquema.items()
+                if tipo in ('INTEGER', 'REAL') and col not in COLUNAS_INDICE and col != COLUNA_ALVO_CLASS
+            ]
+            codificador = montar_codificador(
+                {col: vocabulario[col].index.tolist() for col in colunas_categoricas_class_validas}, colunas_numericas,
+                formato
+            )
+            codificador['motor'] = motor
+            # Última linha vista pelo treino: a atualização incremental parte daqui
+            codificador['rowid_treinado'] = conn.execute(
+                f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+            ler_features = ler_features_esparsas if formato == 'one_hot' else ler_features_ordinais
+            # Substitui o pd.get_dummies: One-Hot esparso (ou códigos ordinais) montado pedaço a pedaço
+            perfil.etapa("Leitura das features", formato=formato)
+            X_class, extras = ler_features(
+                conn, table_name, codificador, [COLUNA_ALVO_CLASS, COLUNA_ALVO_REG], progresso=perfil.acompanhar(progresso)
+            )
+        finally:
+            conn.close()
+        perfil.anotar(linhas=X_class.shape[0], features=X_class.shape[1])
+        if sp.issparse(X_class):
+            print(f"Dados carregados do DB: {X_class.shape[0]} linhas, {X_class.shape[1]} features "
+                  f"({X_class.nnz:,} valores não nulos).")
+        else:
+            print(f"Dados carregados do DB: {X_class.shape[0]} linhas, {X_class.shape[1]} features (ordinais).")
     except Exception as e:
         return False, f"Erro ao carregar dados do DB: {e}"
 
+    # Moda de cada categórica (usada quando um campo vier vazio na predição)
+    for col in colunas_categoricas_class_validas:
+        codificador['valores_padrao'][col] = vocabulario[col].idxmax() if not vocabulario[col].empty else None
+
     # --- PARTE 1: REGRESSÃO (Ainda fazemos para mostrar a análise) ---
     print("\nIniciando Parte 1: Regressão (Prever 'Financial Loss')")
-    COLUNA_ALVO_REG = "Financial Loss (in Million $)"
-    colunas_categoricas_reg = [
-        'Attack Source', 'Attack Type', 'Country', 'Defense Mechanism Used', 
-        'Security Vulnerability Type', 'Target Industry', 'Year'
-    ]
-    # Filtra colunas que realmente existem no df
-    colunas_categoricas_reg_validas = [col for col in colunas_categoricas_reg if col in df_original.columns]
-    
-    df_reg = pd.get_dummies(df_original, columns=colunas_categoricas_reg_validas, drop_first=True, dtype=int)
+    perfil.etapa("Regressão")
+    if COLUNA_ALVO_REG in colunas_numericas and formato == 'one_hot':
+        # Mesmas features da classificação, sem o alvo e com as dummies do tipo de ataque
+        niveis_ataque = vocabulario[COLUNA_ALVO_CLASS].index.tolist()
+        posicoes_ataque = {COLUNA_ALVO_CLASS: {valor: i for i, valor in enumerate(niveis_ataque[1:])}}
+        dummies_ataque = dummies_esparsas(
+            pd.DataFrame({COLUNA_ALVO_CLASS: extras[COLUNA_ALVO_CLASS]}), posicoes_ataque, max(len(niveis_ataque) - 1, 0)
+        )
+        colunas_reg = [i for i, nome in enumerate(codificador['colunas_features']) if nome != COLUNA_ALVO_REG]
+        y_reg = pd.to_numeric(pd.Series(extras[COLUNA_ALVO_REG]), errors='coerce').to_numpy()
+        linhas_reg = np.flatnonzero(~np.isnan(y_reg))
+        X_reg = sp.hstack([X_class[:, colunas_reg], dummies_ataque], format='csr')[linhas_reg]
+        X_reg_train, X_reg_test, y_reg_train, y_reg_test = train_test_split(X_reg, y_reg[linhas_reg], test_size=0.2, random_state=42)
 
-    y_reg = df_reg[COLUNA_ALVO_REG]
-    X_reg = df_reg.drop(columns=[COLUNA_ALVO_REG])
-    X_reg_train, X_reg_test, y_reg_train, y_reg_test = train_test_split(X_reg, y_reg, test_size=0.2, random_state=42)
-
-    modelo_lr = LinearRegression()
-    modelo_lr.fit(X_reg_train, y_reg_train)
-    r2_lr = r2_score(y_reg_test, modelo_lr.predict(X_reg_test))
-    print(f"  - Regressão Linear R²: {r2_lr:.2f}")
+        modelo_lr = LinearRegression()
+        modelo_lr.fit(X_reg_train, y_reg_train)
+        r2_lr = r2_score(y_reg_test, modelo_lr.predict(X_reg_test))
+        print(f"  - Regressão Linear R²: {r2_lr:.2f}")
+        del X_reg, X_reg_train, X_reg_test
+    else:
+        r2_lr = None
+        if formato == 'ordinal':
+            print("  - Regressão ignorada: a regressão linear precisa das features One-Hot.")
 
     # --- PARTE 2: CLASSIFICAÇÃO (O modelo que vamos salvar) ---
     print("\nIniciando Parte 2: Classificação (Prever 'Attack Type')")
-    COLUNA_ALVO_CLASS = "Attack Type"
-    colunas_categoricas_class = [
-        'Attack Source', 'Country', 'Defense Mechanism Used', 
-        'Security Vulnerability Type', 'Target Industry', 'Year'
-    ]
-    colunas_categoricas_class_validas = [col for col in colunas_categoricas_class if col in df_original.columns]
-    
-    df_class = pd.get_dummies(df_original, columns=colunas_categoricas_class_validas, drop_first=True, dtype=int)
-    
-    # Garantir que a coluna alvo exista
-    if COLUNA_ALVO_CLASS not in df_class.columns:
-        return False, f"Coluna alvo '{COLUNA_ALVO_CLASS}' não encontrada na nova base."
+    perfil.etapa("Divisão treino/teste")
+    y_class = pd.Series(extras[COLUNA_ALVO_CLASS])
+    linhas_class = np.flatnonzero(y_class.notna().to_numpy())
+    y_class = y_class.iloc[linhas_class].reset_index(drop=True)
+    X_class = X_class[linhas_class]
 
-    y_class = df_class[COLUNA_ALVO_CLASS]
-    X_class = df_class.drop(columns=[COLUNA_ALVO_CLASS])
-    
     # Verifica se há dados suficientes para 'stratify'
     if y_class.nunique() > 1 and all(y_class.value_counts() > 1):
         X_class_train, X_class_test, y_class_train, y_class_test = train_test_split(X_class, y_class, test_size=0.2, random_state=42, stratify=y_class)
     else:
         X_class_train, X_class_test, y_class_train, y_class_test = train_test_split(X_class, y_class, test_size=0.2, random_state=42)
+    del X_class
+    X_class_train = preparar_para_arvores(X_class_train)
 
-    modelo_rf_class = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
-    modelo_rf_class.fit(X_class_train, y_class_train)
-    acc_rf_class = accuracy_score(y_class_test, modelo_rf_class.predict(X_class_test))
-    print(f"  - Random Forest Classifier Acurácia: {acc_rf_class * 100:.2f}%")
+    # Seleção do classificador dentro do orçamento de tempo (só no conjunto de treino)
+    candidatos = candidatos_do_motor(motor, codificador)
+    perfil.etapa("Seleção do modelo", orcamento_s=orcamento_selecao)
+    inicio_selecao = time.perf_counter()
+    finalistas, rodadas = [], []
+    if orcamento_selecao and y_class_train.nunique() > 1:
+        print(f"Selecionando o classificador (orçamento de {orcamento_selecao}s)...")
+        finalistas, rodadas = selecionar_modelo(X_class_train, y_class_train, orcamento_selecao, candidatos,
+                                                progresso=progresso)
+    tempo_selecao = time.perf_counter() - inicio_selecao
+    if not finalistas:
+        finalistas = [MOTORES_CLASSIFICADOR[motor]['candidato_padrao']]
+    if formato == 'ordinal':
+        # O HistGradientBoosting repassa a entrada ao seu codificador interno de
+        # categorias: o treino final recebe os nomes das colunas, como na predição
+        X_class_train = pd.DataFrame(X_class_train, columns=codificador['colunas_features'], copy=False)
+        X_class_test = pd.DataFrame(X_class_test, columns=codificador['colunas_features'], copy=False)
+
+    # O melhor finalista é re-treinado com todo o conjunto de treino; se passar
+    # dos limites nesse tamanho, tenta o próximo (no máximo três)
+    for nome_escolhido in finalistas[:3]:
+        print(f"Treinando '{nome_escolhido}' com todo o conjunto de treino...")
+        perfil.etapa("Ajuste final", candidato=nome_escolhido)
+        perfil.anotar(linhas=X_class_train.shape[0])
+        modelo_class = clone(candidatos[nome_escolhido])
+        if 'n_jobs' in modelo_class.get_params():
+            modelo_class.set_params(n_jobs=-1)
+        inicio_ajuste = time.perf_counter()
+        ajustar_floresta(modelo_class, X_class_train, y_class_train, progresso)
+        tempo_ajuste = time.perf_counter() - inicio_ajuste
+        perfil.etapa("Poda e avaliação", candidato=nome_escolhido)
+        perfil.anotar(linhas=X_class_test.shape[0])
+        poda = podar_floresta(modelo_class, max_profundidade, max_folhas)
+        acc_class = accuracy_score(y_class_test, modelo_class.predict(X_class_test))
+        latencia_ms, tamanho_mb = medir_modelo(modelo_class, X_class_test)
+        dentro_dos_limites = latencia_ms <= LATENCIA_MAX_MS and tamanho_mb <= TAMANHO_MAX_MB
+        if dentro_dos_limites:
+            break
+        print(f"  - '{nome_escolhido}' passou dos limites ({latencia_ms:.1f} ms, {tamanho_mb:.1f} MB).")
+    print(f"  - {nome_escolhido} Acurácia: {acc_class * 100:.2f}%")
+    registrar_nomes_features(modelo_class, codificador['colunas_features'])
+
+    relatorio = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'motor': motor,
+        'orcamento_s': orcamento_selecao,
+        'tempo_selecao_s': round(tempo_selecao, 2),
+        'limites': {'latencia_max_ms': LATENCIA_MAX_MS, 'tamanho_max_mb': TAMANHO_MAX_MB},
+        'linhas_treino': int(X_class_train.shape[0]),
+        'linhas_teste': int(X_class_test.shape[0]),
+        'rodadas': rodadas,
+        'escolhido': {
+            'nome': nome_escolhido,
+            'acuracia_teste': float(acc_class),
+            'tempo_ajuste_s': round(tempo_ajuste, 3),
+            'latencia_ms': round(latencia_ms, 3),
+            'tamanho_mb': round(tamanho_mb, 3),
+            'dentro_dos_limites': dentro_dos_limites,
+        },
+        'regressao_r2': r2_lr,
+        'artefato': {'compressao': compressao, 'poda': poda},
+    }
 
     # --- ETAPA FINAL: SALVAR O MODELO ---
     print(f"\nSalvando modelo em: {model_save_path}")
+    perfil.etapa("Gravação do artefato", compressao=compressao)
     try:
-        joblib.dump(modelo_rf_class, model_save_path)
-        print("Modelo salvo com sucesso.")
+        manifesto = salvar_artefato(model_save_path, modelo_class, codificador, compressao=compressao, poda=poda, metadados={
+            'candidato': nome_escolhido,
+            'motor': motor,
+            'linhas_treino': int(X_class_train.shape[0]),
+            'acuracia_teste': float(acc_class),
+            'rowid_treinado': codificador['rowid_treinado'],
+            'limites_poda': {'max_profundidade': max_profundidade, 'max_folhas': max_folhas},
+        })
+        with open(caminho_do_relatorio_selecao(model_save_path), 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"Modelo, codificador e relatório da seleção salvos com sucesso "
+              f"({manifesto['modelo']['bytes'] / 1e6:.1f} MB, compressão '{compressao}').")
     except Exception as e:
         return False, f"Erro ao salvar o modelo: {e}"
-        
-    return True, "Treinamento concluído com sucesso."
\ No newline at end of file
+    perfil.concluir()
+
+    return True, f"Treinamento concluído com sucesso ({nome_escolhido}, acurácia de {acc_class * 100:.2f}%)."
+
+# ==============================================================================
+# FUNÇÃO 2.1: ATUALIZAR O MODELO COM AS LINHAS NOVAS (Warm Start)
+# ==============================================================================
+ARVORES_POR_ATUALIZACAO = 25
+MAX_ARVORES = 300
+AMOSTRA_HISTORICO = 20000
+
+def atualizar_modelo_incremental(db_path, table_name, model_save_path,
+                                 arvores_novas=ARVORES_POR_ATUALIZACAO, max_arvores=MAX_ARVORES, progresso=None,
+                                 perfil=None):
+    """
+    Acrescenta 'arvores_novas' árvores à floresta salva, treinadas só com as
+    linhas ingeridas depois do último treino (warm_start do scikit-learn). Com
+    mais de 'max_arvores' árvores, as mais antigas são descartadas (janela
+    deslizante). As árvores antigas não veem as colunas One-Hot novas, então se
+    surgir uma categoria ou um tipo de ataque que o modelo não conhece, ou se o
+    modelo não for uma floresta ou não tiver o ponto de partida salvo, faz o
+    re-treino completo (com o mesmo motor do modelo salvo).
+
+    Retorna (sucesso, mensagem, metricas), com a acurácia antes e depois da
+    atualização em um holdout das linhas novas e em uma amostra do histórico
+    (metricas é None quando a atualização não foi feita). 'progresso' e
+    'perfil' são repassados ao re-treino e ao ajuste das árvores novas.
+    """
+    print("Iniciando atualização incremental do modelo...")
+    perfil = perfil if perfil is not None else Perfilador()
+    perfil.iniciar_fase("Atualização incremental")
+    perfil.etapa("Leitura do modelo salvo")
+    try:
+        modelo, codificador, manifesto = carregar_artefato(model_save_path)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"  - Modelo salvo indisponível: {e}")
+        modelo = codificador = manifesto = None
+
+    # O re-treino e a gravação mantêm o motor, a compressão e a poda do modelo salvo
+    motor = codificador.get('motor', MOTOR_PADRAO) if codificador else MOTOR_PADRAO
+    compressao = manifesto['modelo']['compressao'] if manifesto else COMPRESSAO_PADRAO
+    limites_poda = (manifesto or {}).get('treino', {}).get('limites_poda') or {}
+    max_profundidade, max_folhas = limites_poda.get('max_profundidade'), limites_poda.get('max_folhas')
+
+    def retreino_completo(motivo):
+        print(f"  - {motivo} Fazendo o re-treino completo.")
+        sucesso, mensagem = treinar_novo_modelo(db_path, table_name, model_save_path, progresso, motor=motor,
+                                                compressao=compressao, max_profundidade=max_profundidade,
+                                                max_folhas=max_folhas, perfil=perfil)
+        return sucesso, f"{motivo} {mensagem}", None
+
+    if (modelo is None or 'rowid_treinado' not in codificador
+            or not isinstance(modelo, (RandomForestClassifier, ExtraTreesClassifier))):
+        return retreino_completo("Modelo atual não suporta atualização incremental.")
+
+    perfil.etapa("Conferência do vocabulário")
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            esquema = ler_esquema_tabela(conn, table_name)
+            if COLUNA_ALVO_CLASS not in esquema:
+                return False, f"Coluna alvo '{COLUNA_ALVO_CLASS}' não encontrada na nova base.", None
+            vocabulario = ler_vocabulario(conn, table_name, list(codificador['categorias']) + [COLUNA_ALVO_CLASS])
+            rowid_final = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+        finally:
+            conn.close()
+    except Exception as e:
+        return False, f"Erro ao carregar dados do DB: {e}", None
+
+    # O vocabulário dos resumos cobre a base inteira: qualquer nível fora do
+    # codificador (ou classe fora do modelo) muda as colunas/saídas da floresta
+    for col, niveis in codificador['categorias'].items():
+        novos = set(vocabulario[col].index) - set(niveis)
+        if novos:
+            return retreino_completo(f"Novas categorias em '{col}' ({len(novos)}).")
+    if set(vocabulario[COLUNA_ALVO_CLASS].index) != set(modelo.classes_):
+        return retreino_completo("O conjunto de tipos de ataque mudou.")
+
+    rowid_treinado = codificador['rowid_treinado']
+    if rowid_final <= rowid_treinado:
+        return True, "Nenhuma linha nova desde o último treino: o modelo foi mantido.", None
+
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            perfil.etapa("Leitura das linhas novas")
+            X_novo, extras = ler_features_esparsas(
+                conn, table_name, codificador, [COLUNA_ALVO_CLASS], filtro_sql='WHERE rowid > ?',
+                params=(rowid_treinado,), progresso=perfil.acompanhar(progresso)
+            )
+            perfil.etapa("Leitura da amostra do histórico")
+            # Amostra do histórico já visto pelo modelo, para medir se ele "esqueceu" algo
+            rng = np.random.default_rng(42)
+            ids_historico = np.unique(rng.integers(1, rowid_treinado + 1, size=min(AMOSTRA_HISTORICO, rowid_treinado)))
+            X_hist, extras_hist = ler_features_esparsas(
+                conn, table_name, codificador, [COLUNA_ALVO_CLASS],
+                filtro_sql='WHERE rowid IN (SELECT value FROM json_each(?))', params=(json.dumps(ids_historico.tolist()),)
+            )
+        finally:
+            conn.close()
+        perfil.anotar(linhas=X_hist.shape[0])
+        print(f"Linhas novas desde o último treino: {X_novo.shape[0]}.")
+    except Exception as e:
+        return False, f"Erro ao carregar dados do DB: {e}", None
+
+    y_novo = pd.Series(extras[COLUNA_ALVO_CLASS])
+    linhas = np.flatnonzero(y_novo.notna().to_numpy())
+    y_novo = y_novo.iloc[linhas].reset_index(drop=True)
+    X_novo = X_novo[linhas]
+    y_hist = pd.Series(extras_hist[COLUNA_ALVO_CLASS])
+    linhas_hist = np.flatnonzero(y_hist.notna().to_numpy())
+    y_hist = y_hist.iloc[linhas_hist].reset_index(drop=True)
+    X_hist = X_hist[linhas_hist]
+
+    if y_novo.nunique() > 1 and all(y_novo.value_counts() > 1):
+        X_train, X_test, y_train, y_test = train_test_split(X_novo, y_novo, test_size=0.2, random_state=42, stratify=y_novo)
+    else:
+        return retreino_completo("Poucas linhas novas para separar um holdout.")
+    # O warm_start recalcula classes_ a partir do y recebido: se faltar algum tipo
+    # de ataque nas linhas novas, as árvores antigas e novas ficariam incompatíveis
+    if set(y_train) != set(modelo.classes_):
+        return retreino_completo("As linhas novas não trazem todos os tipos de ataque.")
+
+    def avaliar(m):
+        return {
+            'Holdout das linhas novas': accuracy_score(y_test, m.predict(X_test)),
+            'Amostra do histórico': accuracy_score(y_hist, m.predict(X_hist)) if len(y_hist) else float('nan'),
+        }
+
+    # Avaliação e predição com matrizes sem nomes de coluna, como no treino
+    nomes_features = modelo.feature_names_in_
+    del modelo.feature_names_in_
+    perfil.etapa("Avaliação antes")
+    antes = avaliar(modelo)
+
+    arvores_antes = len(modelo.estimators_)
+    modelo.set_params(warm_start=True, n_estimators=arvores_antes + arvores_novas)
+    perfil.etapa("Ajuste das árvores novas", arvores=arvores_novas)
+    perfil.anotar(linhas=X_train.shape[0])
+    ajustar_floresta(modelo, preparar_para_arvores(X_train), y_train, progresso)
+    # Janela deslizante: descarta as árvores mais antigas
+    if len(modelo.estimators_) > max_arvores:
+        modelo.estimators_ = modelo.estimators_[-max_arvores:]
+        modelo.set_params(n_estimators=max_arvores)
+    modelo.set_params(warm_start=False)
+    # As árvores novas seguem os mesmos limites de poda do treino (as antigas já estão podadas)
+    poda = podar_floresta(modelo, max_profundidade, max_folhas)
+
+    perfil.etapa("Avaliação depois")
+    depois = avaliar(modelo)
+    modelo.feature_names_in_ = nomes_features
+    codificador['rowid_treinado'] = rowid_final
+    for conjunto in antes:
+        print(f"  - Acurácia ({conjunto}): {antes[conjunto] * 100:.2f}% -> {depois[conjunto] * 100:.2f}%")
+
+    print(f"\nSalvando modelo em: {model_save_path}")
+    try:
+        metadados = dict((manifesto or {}).get('treino', {}))
+        metadados.update({'rowid_treinado': rowid_final, 'atualizado_em': datetime.now().isoformat(timespec='seconds'),
+                          'arvores': len(modelo.estimators_)})
+        perfil.etapa("Gravação do artefato", compressao=compressao)
+        salvar_artefato(model_save_path, modelo, codificador, metadados, compressao=compressao, poda=poda)
+        print("Modelo e codificador salvos com sucesso.")
+    except Exception as e:
+        return False, f"Erro ao salvar o modelo: {e}", None
+    perfil.concluir()
+
+    metricas = {
+        'linhas_novas': int(X_novo.shape[0]),
+        'arvores_antes': arvores_antes,
+        'arvores_depois': len(modelo.estimators_),
+        'acuracia': {conjunto: {'antes': antes[conjunto], 'depois': depois[conjunto]} for conjunto in antes},
+    }
+    return True, f"Modelo atualizado com {arvores_novas} árvores novas ({X_novo.shape[0]:,} linhas novas).", metricas
+
+# ==============================================================================
+# FUNÇÃO 3: PONTUAR INCIDENTES EM LOTE (CSV -> Probabilidades)
+# ==============================================================================
+def pontuar_lote(uploaded_file, model_path, output_path, chunksize=50000):
+    """
+    Lê um CSV de incidentes em pedaços, codifica cada pedaço com o esquema
+    salvo no treino e calcula as probabilidades com uma única chamada de
+    'predict_proba' por pedaço. O resultado é escrito incrementalmente num
+    arquivo temporário ao lado de 'output_path', então o uso de memória não
+    depende do tamanho do arquivo; só uma pontuação completa é renomeada para
+    'output_path' (uma falha não deixa resultado pela metade).
+    """
+    print("Iniciando pontuação em lote...")
+    try:
+        modelo, codificador, _ = carregar_artefato(model_path)
+    except FileNotFoundError as e:
+        return False, f"Modelo ou codificador não encontrado: {e}"
+    except ValueError as e:
+        return False, f"Modelo salvo inválido: {e}"
+
+    classes = list(modelo.classes_)
+    colunas_proba = [f"Prob. {classe} (%)" for classe in classes]
+
+    output_path = Path(output_path)
+    caminho_parcial = output_path.with_name(f"{output_path.name}.{os.getpid()}.parcial")
+
+    total_linhas = 0
+    try:
+        dialeto = detectar_dialeto(uploaded_file)
+        chunk_reader = pd.read_csv(uploaded_file, chunksize=chunksize, **opcoes_leitura_csv(dialeto))
+        with open(caminho_parcial, 'w', encoding='utf-8', newline='') as saida:
+            for i, chunk in enumerate(chunk_reader):
+                normalizar_colunas(chunk)
+
+                X_chunk = codificar_dataframe(chunk, codificador)
+                probabilidades = modelo.predict_proba(X_chunk)
+
+                resultado = chunk.copy()
+                resultado['Tipo de Ataque Previsto'] = np.asarray(classes, dtype=object)[probabilidades.argmax(axis=1)]
+                df_proba = pd.DataFrame((probabilidades * 100).round(2), columns=colunas_proba, index=chunk.index)
+                resultado = pd.concat([resultado, df_proba], axis=1)
+
+                resultado.to_csv(saida, header=(i == 0), index=False, sep=';')
+                total_linhas += len(chunk)
+                print(f"  - Pedaço {i + 1}: {total_linhas} incidentes pontuados.")
+
+        if total_linhas == 0:
+            return False, "Nenhum incidente encontrado no arquivo enviado."
+        os.replace(caminho_parcial, output_path)
+    finally:
+        caminho_parcial.unlink(missing_ok=True)
+
+    print("Pontuação em lote concluída com sucesso!")
+    return True, f"{total_linhas:,} incidentes pontuados."
+
+# ==============================================================================
+# FUNÇÃO 4: GERAÇÃO NOVA (Cópia e validação antes da publicação)
+# ==============================================================================
+# ioctl do Linux que clona um arquivo por reflink (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+def _clonar_arquivo(origem, destino):
+    """
+    Cópia por reflink: os blocos passam a ser compartilhados e só são
+    duplicados quando alterados, então o tempo não depende do tamanho.
+    Retorna False se o sistema de arquivos (ou o sistema) não suportar.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # Windows
+        return False
+    with open(origem, 'rb') as f_origem, open(destino, 'wb') as f_destino:
+        try:
+            fcntl.ioctl(f_destino.fileno(), FICLONE, f_origem.fileno())
+            return True
+        except OSError:
+            pass
+    Path(destino).unlink(missing_ok=True)
+    return False
+
+def copiar_base(origem, destino):
+    """
+    Leva a base publicada (banco e snapshot colunar) para a pasta de uma
+    geração nova, onde o modo anexar acrescenta as linhas. A geração
+    publicada nunca é alterada, então:
+      - o banco é clonado por reflink quando o sistema de arquivos permite
+        (tempo constante); senão, copiado pelo backup do SQLite, o único
+        passo do anexar cujo tempo cresce com o histórico;
+      - os arquivos das colunas do snapshot, que só crescem no final, ganham
+        links físicos: a carga acrescenta só as linhas novas, e quem lê a
+        geração publicada continua vendo as linhas do manifesto dela.
+    """
+    origem, destino = Path(origem), Path(destino)
+    # Com o WAL pendente, o arquivo principal sozinho não tem a base inteira
+    wal = origem.with_name(f"{origem.name}-wal")
+    if not (wal.exists() and wal.stat().st_size) and _clonar_arquivo(origem, destino):
+        print(f"Base atual clonada (reflink) para a nova geração: {destino}")
+    else:
+        print(f"Copiando a base atual para a nova geração: {destino}")
+        conn_origem = conectar_somente_leitura(origem)
+        conn_destino = sqlite3.connect(destino)
+        try:
+            conn_origem.backup(conn_destino)
+        finally:
+            conn_destino.close()
+            conn_origem.close()
+
+    # Sem snapshot, a carga o gera relendo o banco
+    pasta_origem, pasta_destino = caminho_do_snapshot(origem), caminho_do_snapshot(destino)
+    manifesto = ler_manifesto_colunar(pasta_origem)
+    if manifesto is None:
+        return
+    pasta_destino.mkdir()
+    for coluna in manifesto['colunas']:
+        arquivo, copia = pasta_origem / coluna['arquivo'], pasta_destino / coluna['arquivo']
+        tamanho = manifesto['linhas'] * np.dtype(coluna['dtype']).itemsize
+        if arquivo.stat().st_size == tamanho:
+            try:
+                os.link(arquivo, copia)
+                continue
+            except OSError:
+                # Sistema de arquivos sem links físicos
+                pass
+        # Bytes além do manifesto (sobra de uma carga interrompida): copia só as linhas que valem
+        shutil.copyfile(arquivo, copia)
+        os.truncate(copia, tamanho)
+    shutil.copyfile(pasta_origem / 'manifesto.json', pasta_destino / 'manifesto.json')
+
+def vincular_modelo(origem, destino):
+    """
+    Leva o modelo publicado para a pasta de uma geração nova (a atualização
+    incremental parte dele). Modelo, codificador e manifesto nunca são
+    alterados no lugar (a gravação troca o arquivo inteiro), então um link
+    físico basta; o relatório da seleção é regravado no lugar e é copiado.
+    """
+    origem, destino = Path(origem), Path(destino)
+    for arquivo, copia in [(origem, destino), (caminho_do_codificador(origem), caminho_do_codificador(destino)),
+                           (caminho_do_manifesto(origem), caminho_do_manifesto(destino))]:
+        if not arquivo.exists():
+            continue
+        try:
+            os.link(arquivo, copia)
+        except OSError:
+            # Sistema de arquivos sem links físicos
+            shutil.copy2(arquivo, copia)
+    if caminho_do_relatorio_selecao(origem).exists():
+        shutil.copy2(caminho_do_relatorio_selecao(origem), caminho_do_relatorio_selecao(destino))
+
+def completar_base(db_path, table_name):
+    """
+    Gera na geração ainda não publicada o que faltar na base (resumos,
+    estatísticas das colunas e snapshot colunar, ex.: quando a gravação do
+    snapshot falhou na carga). Depois de publicada, a base não muda mais.
+    """
+    reconstruir_rollups(db_path, table_name)
+    reconstruir_estatisticas(db_path, table_name)
+    if conferir_snapshot(db_path, table_name) is None:
+        reconstruir_snapshot(db_path, table_name)
+
+def validar_base(db_path, table_name):
+    """
+    Confere a base montada antes de publicá-la: integridade do SQLite, tabela
+    com linhas e com a coluna alvo do modelo, e registro da ingestão.
+    Retorna (sucesso, mensagem).
+    """
+    try:
+        conn = conectar_somente_leitura(db_path)
+        try:
+            integridade = conn.execute("PRAGMA quick_check").fetchone()[0]
+            if integridade != 'ok':
+                return False, f"O SQLite encontrou problemas na base nova: {integridade}"
+            total_linhas = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            esquema = ler_esquema_tabela(conn, table_name)
+            ingestao = ultima_ingestao(conn, table_name)
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        return False, f"A base nova não pôde ser lida: {e}"
+    if total_linhas == 0:
+        return False, "A base nova está vazia."
+    if COLUNA_ALVO_CLASS not in esquema:
+        return False, f"Coluna alvo '{COLUNA_ALVO_CLASS}' não encontrada na base nova."
+    if ingestao is None:
+        return False, "A base nova não tem o registro da ingestão."
+    return True, f"Base nova validada ({total_linhas:,} linhas)."
+
+def validar_modelo(model_path, db_path, table_name, n_linhas=100):
+    """
+    Confere o modelo salvo antes de publicá-lo: o artefato carrega (com o
+    SHA-256 conferido) e prevê uma amostra da base com probabilidades válidas.
+    Retorna (sucesso, mensagem).
+    """
+    try:
+        modelo, codificador, _ = carregar_artefato(model_path)
+    except (FileNotFoundError, ValueError) as e:
+        return False, f"O modelo novo não pôde ser carregado: {e}"
+    conn = conectar_somente_leitura(db_path)
+    try:
+        amostra = pd.read_sql_query(f'SELECT * FROM "{table_name}" LIMIT ?', conn, params=(n_linhas,))
+    finally:
+        conn.close()
+    try:
+        probabilidades = modelo.predict_proba(codificar_dataframe(amostra, codificador))
+    except Exception as e:
+        return False, f"O modelo novo falhou ao prever uma amostra da base: {e}"
+    if len(amostra) and not np.allclose(probabilidades.sum(axis=1), 1):
+        return False, "O modelo novo gerou probabilidades inválidas."
+    return True, "Modelo novo validado."
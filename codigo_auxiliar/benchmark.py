@@ -0,0 +1,306 @@
+"""
+Benchmark de ponta a ponta com dados sintéticos.
+
+Para cada tamanho de base: gera os incidentes (geração_CSV.py, sempre com a
+mesma semente), e mede o tempo e o pico de memória de cada etapa do app:
+
+    gerar_dados           -> .zip com vários CSVs
+    processar_nova_base   -> ingestão no SQLite (com resumos e snapshot)
+    treinar_novo_modelo   -> treino e gravação do modelo
+    agregacoes_dashboard  -> abertura do snapshot e Gerador de Gráfico Dinâmico
+    predicao_unitaria     -> simulador (um incidente por vez)
+    pontuacao_em_lote     -> pontuar_lote sobre um CSV de incidentes
+
+Cada etapa roda em um processo novo, então o pico de memória (ru_maxrss) é
+só dela. Os resultados são acrescentados a um arquivo JSONL (uma linha por
+execução, tamanho e etapa), com o commit e o ambiente, e a execução é
+comparada com a anterior: etapas que ficaram mais lentas ou usaram mais
+memória do que a tolerância aparecem como regressão.
+
+Uso:
+    python codigo_auxiliar/benchmark.py --tamanhos 10000 100000 1000000
+    python codigo_auxiliar/benchmark.py --comparar                # última execução x anterior
+    python codigo_auxiliar/benchmark.py --comparar 20261017-101500  # última execução x uma específica
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource  # Só existe em Linux/macOS: no Windows o pico de memória fica vazio
+except ImportError:
+    resource = None
+
+PASTA_AUXILIAR = Path(__file__).resolve().parent
+PASTA_PROJETO = PASTA_AUXILIAR.parent
+sys.path.insert(0, str(PASTA_PROJETO))
+
+ARQUIVO_RESULTADOS = PASTA_AUXILIAR / 'resultados_benchmark.jsonl'
+TAMANHOS_PADRAO = [10000, 100000, 1000000]
+NOME_TABELA = 'CyberSec_data'
+TOLERANCIA = 0.20          # Variação acima disso (tempo ou memória) é regressão
+MARGEM_TEMPO_S = 0.5       # ...desde que o tempo também suba mais que isso (etapas curtas oscilam muito)
+LINHAS_LOTE_MAX = 100000   # Tamanho máximo do CSV da pontuação em lote
+AMOSTRAS_UNITARIAS = 200   # Incidentes previstos um a um
+
+# ==============================================================================
+# MEDIÇÃO (Cada etapa em um processo separado)
+# ==============================================================================
+def _pico_mb(quem):
+    if resource is None:
+        return None
+    pico = resource.getrusage(quem).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / 1e6 if sys.platform == 'darwin' else pico / 1024
+
+def _executar_medido(nome_etapa, parametros):
+    """Roda a etapa neste processo e mede o tempo e o pico de memória dele e dos filhos."""
+    memoria_base = _pico_mb(resource.RUSAGE_SELF) if resource else None
+    inicio = time.perf_counter()
+    sucesso, mensagem, metricas = ETAPAS[nome_etapa](**parametros)
+    return {
+        'tempo_s': round(time.perf_counter() - inicio, 4),
+        'pico_mb': _pico_mb(resource.RUSAGE_SELF) if resource else None,
+        'memoria_base_mb': memoria_base,
+        'pico_filhos_mb': _pico_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        'sucesso': bool(sucesso),
+        'mensagem': mensagem,
+        'metricas': metricas or {},
+    }
+
+def medir_etapa(nome_etapa, **parametros):
+    """Executa a etapa num processo novo (spawn), para o pico de memória não herdar o das anteriores."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_executar_medido, nome_etapa, parametros).result()
+
+# ==============================================================================
+# ETAPAS (Cada uma retorna (sucesso, mensagem, metricas))
+# ==============================================================================
+def etapa_gerar_dados(destino, linhas, arquivos, semente):
+    from geração_CSV import gerar_arquivos
+    gerar_arquivos(destino, linhas, arquivos, semente=semente, compactar=True)
+    return True, f"{linhas:,} linhas em {arquivos} arquivo(s).", {'tamanho_mb': Path(destino).stat().st_size / 1e6}
+
+def etapa_processar_nova_base(arquivo, db_path):
+    from backend_tasks import processar_nova_base
+    db_path = Path(db_path)
+    sucesso, mensagem = processar_nova_base(arquivo, db_path, NOME_TABELA)
+    return sucesso, mensagem, {'banco_mb': db_path.stat().st_size / 1e6 if db_path.exists() else None}
+
+def etapa_treinar_novo_modelo(db_path, model_path, orcamento_selecao, motor):
+    from backend_tasks import treinar_novo_modelo
+    sucesso, mensagem = treinar_novo_modelo(Path(db_path), NOME_TABELA, Path(model_path),
+                                            orcamento_selecao=orcamento_selecao, motor=motor)
+    metricas = {}
+    caminho_relatorio = Path(model_path).with_name('relatorio_selecao.json')
+    if sucesso and caminho_relatorio.exists():
+        escolhido = json.loads(caminho_relatorio.read_text(encoding='utf-8'))['escolhido']
+        metricas = {chave: escolhido[chave] for chave in ('nome', 'acuracia_teste', 'latencia_ms', 'tamanho_mb')}
+    return sucesso, mensagem, metricas
+
+def etapa_agregacoes_dashboard(db_path):
+    from backend_tasks import carregar_snapshot
+    from consultas import AGREGACOES, consultar_agregado
+    metricas = {}
+    inicio = time.perf_counter()
+    df = carregar_snapshot(Path(db_path), NOME_TABELA)
+    metricas['snapshot_s'] = round(time.perf_counter() - inicio, 4)
+    for agregacao in AGREGACOES:
+        inicio = time.perf_counter()
+        consultar_agregado(Path(db_path), NOME_TABELA, 'Attack Type', 'Financial Loss (in Million $)', agregacao)
+        metricas[f'{agregacao}_s'] = round(time.perf_counter() - inicio, 4)
+    return df is not None, "Snapshot e agregações do Gerador de Gráfico Dinâmico.", metricas
+
+def etapa_predicao_unitaria(db_path, model_path):
+    import sqlite3
+    from artefato_modelo import carregar_artefato
+    from avaliador_floresta import compilar_floresta, prever_com_probabilidades
+    from backend_tasks import codificar_linha
+    inicio = time.perf_counter()
+    modelo, codificador, _ = carregar_artefato(Path(model_path))
+    floresta = compilar_floresta(modelo)
+    carga_s = time.perf_counter() - inicio
+
+    conn = sqlite3.connect(db_path)
+    try:
+        registros = pd.read_sql_query(f'SELECT * FROM "{NOME_TABELA}" LIMIT ?', conn,
+                                      params=(AMOSTRAS_UNITARIAS,)).to_dict('records')
+    finally:
+        conn.close()
+    tempos = {'simulador': [], 'sklearn': []}
+    for registro in registros:
+        inicio = time.perf_counter()
+        prever_com_probabilidades(modelo, codificar_linha(registro, codificador), floresta)
+        tempos['simulador'].append((time.perf_counter() - inicio) * 1000)
+        inicio = time.perf_counter()
+        entrada = codificar_linha(registro, codificador)
+        modelo.predict(entrada), modelo.predict_proba(entrada)
+        tempos['sklearn'].append((time.perf_counter() - inicio) * 1000)
+    metricas = {'carga_modelo_s': round(carga_s, 4), 'floresta_compilada': floresta is not None}
+    for nome, valores in tempos.items():
+        metricas[f'{nome}_p50_ms'] = round(float(np.percentile(valores, 50)), 3)
+        metricas[f'{nome}_p95_ms'] = round(float(np.percentile(valores, 95)), 3)
+    return True, f"{len(registros)} incidentes previstos um a um.", metricas
+
+def etapa_pontuacao_em_lote(arquivo, model_path, saida, linhas):
+    from backend_tasks import pontuar_lote
+    inicio = time.perf_counter()
+    sucesso, mensagem = pontuar_lote(arquivo, Path(model_path), saida)
+    return sucesso, mensagem, {'linhas_por_s': round(linhas / (time.perf_counter() - inicio))}
+
+ETAPAS = {
+    'gerar_dados': etapa_gerar_dados,
+    'processar_nova_base': etapa_processar_nova_base,
+    'treinar_novo_modelo': etapa_treinar_novo_modelo,
+    'agregacoes_dashboard': etapa_agregacoes_dashboard,
+    'predicao_unitaria': etapa_predicao_unitaria,
+    'pontuacao_em_lote': etapa_pontuacao_em_lote,
+}
+
+# ==============================================================================
+# EXECUÇÃO E RESULTADOS
+# ==============================================================================
+def descrever_ambiente():
+    import sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PASTA_PROJETO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'scikit-learn': sklearn.__version__,
+    }
+
+def executar_benchmark(tamanhos, arquivos=4, semente=42, orcamento_selecao=0, motor='floresta',
+                       saida=ARQUIVO_RESULTADOS, pasta=None):
+    """
+    Roda todas as etapas para cada tamanho e acrescenta os resultados em
+    'saida' (JSONL). Retorna o identificador da execução.
+    """
+    execucao = datetime.now().strftime('%Y%m%d-%H%M%S')
+    ambiente = descrever_ambiente()
+    with tempfile.TemporaryDirectory(dir=pasta) as temporaria:
+        for linhas in tamanhos:
+            pasta_tamanho = Path(temporaria) / str(linhas)
+            pasta_tamanho.mkdir()
+            arquivo = pasta_tamanho / f'incidentes_{linhas}.zip'
+            db_path = pasta_tamanho / 'CyberSec.db'
+            model_path = pasta_tamanho / 'modelo_classificador.pkl'
+            lote = pasta_tamanho / 'lote.csv'
+            from geração_CSV import gerar_arquivos
+            # CSV da pontuação em lote: outra semente, fora da base de treino
+            linhas_lote = min(linhas, LINHAS_LOTE_MAX)
+            gerar_arquivos(lote, linhas_lote, semente=semente + 1)
+
+            plano = [
+                ('gerar_dados', dict(destino=str(arquivo), linhas=linhas, arquivos=arquivos, semente=semente)),
+                ('processar_nova_base', dict(arquivo=str(arquivo), db_path=str(db_path))),
+                ('treinar_novo_modelo', dict(db_path=str(db_path), model_path=str(model_path),
+                                             orcamento_selecao=orcamento_selecao, motor=motor)),
+                ('agregacoes_dashboard', dict(db_path=str(db_path))),
+                ('predicao_unitaria', dict(db_path=str(db_path), model_path=str(model_path))),
+                ('pontuacao_em_lote', dict(arquivo=str(lote), model_path=str(model_path),
+                                           saida=str(pasta_tamanho / 'lote_pontuado.csv'), linhas=linhas_lote)),
+            ]
+            for nome_etapa, parametros in plano:
+                print(f"[{linhas:,} linhas] {nome_etapa}...")
+                try:
+                    resultado = medir_etapa(nome_etapa, **parametros)
+                except Exception as e:
+                    resultado = {'tempo_s': None, 'pico_mb': None, 'sucesso': False, 'mensagem': repr(e), 'metricas': {}}
+                registro = {'execucao': execucao, 'data': datetime.now().isoformat(timespec='seconds'),
+                            'linhas': linhas, 'etapa': nome_etapa, **resultado, 'ambiente': ambiente}
+                with open(saida, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+                pico = f", pico de {resultado['pico_mb']:,.0f} MB" if resultado.get('pico_mb') else ""
+                tempo = f"{resultado['tempo_s']:.2f}s" if resultado['tempo_s'] is not None else "falhou"
+                print(f"    {tempo}{pico} - {resultado['mensagem']}")
+                if not resultado['sucesso'] and nome_etapa in ('gerar_dados', 'processar_nova_base', 'treinar_novo_modelo'):
+                    print("    As etapas seguintes dependem desta: pulando o restante deste tamanho.")
+                    break
+    return execucao
+
+def ler_resultados(saida=ARQUIVO_RESULTADOS):
+    if not Path(saida).exists():
+        return pd.DataFrame()
+    with open(saida, encoding='utf-8') as f:
+        return pd.DataFrame([json.loads(linha) for linha in f if linha.strip()])
+
+def comparar_execucoes(resultados, atual=None, base=None, tolerancia=TOLERANCIA):
+    """
+    Compara duas execuções etapa a etapa (mesmo tamanho e etapa). Por
+    padrão, a última execução contra a anterior. Retorna um DataFrame com a
+    variação de tempo e de pico de memória e a coluna 'Regressão' (tempo
+    acima da tolerância e da MARGEM_TEMPO_S, ou memória acima da tolerância).
+    """
+    execucoes = sorted(resultados['execucao'].unique())
+    atual = atual or execucoes[-1]
+    anteriores = [execucao for execucao in execucoes if execucao < atual]
+    base = base or (anteriores[-1] if anteriores else None)
+    if base is None:
+        return None
+    colunas = ['linhas', 'etapa', 'tempo_s', 'pico_mb']
+    tabela = resultados.loc[resultados['execucao'] == base, colunas].merge(
+        resultados.loc[resultados['execucao'] == atual, colunas], on=['linhas', 'etapa'], suffixes=('_base', '_atual')
+    )
+    for medida in ('tempo_s', 'pico_mb'):
+        tabela[f'{medida}_variacao'] = tabela[f'{medida}_atual'] / tabela[f'{medida}_base'] - 1
+    mais_lenta = (tabela['tempo_s_variacao'] > tolerancia) & \
+        (tabela['tempo_s_atual'] - tabela['tempo_s_base'] > MARGEM_TEMPO_S)
+    tabela['Regressão'] = mais_lenta | (tabela['pico_mb_variacao'] > tolerancia)
+    tabela.attrs.update(base=base, atual=atual)
+    return tabela
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta com dados sintéticos.")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS_PADRAO, help="Linhas de cada base")
+    parser.add_argument('--arquivos', type=int, default=4, help="CSVs dentro do .zip gerado")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--orcamento', type=float, default=0,
+                        help="Orçamento da seleção de modelo (s); 0 treina o candidato padrão")
+    parser.add_argument('--motor', default='floresta')
+    parser.add_argument('--saida', default=str(ARQUIVO_RESULTADOS), help="Arquivo JSONL dos resultados")
+    parser.add_argument('--pasta', default=None, help="Onde criar os arquivos temporários")
+    parser.add_argument('--comparar', nargs='?', const='', default=None, metavar='EXECUCAO_BASE',
+                        help="Só compara a última execução com a anterior (ou com EXECUCAO_BASE)")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = parser.parse_args()
+
+    if args.comparar is None:
+        executar_benchmark(args.tamanhos, args.arquivos, args.semente, args.orcamento, args.motor,
+                           args.saida, args.pasta)
+
+    resultados = ler_resultados(args.saida)
+    tabela = comparar_execucoes(resultados, base=args.comparar or None, tolerancia=args.tolerancia) \
+        if not resultados.empty else None
+    if tabela is None:
+        print("Nenhuma execução anterior para comparar.")
+        return
+    print(f"\nExecução {tabela.attrs['atual']} comparada com {tabela.attrs['base']}:")
+    print(tabela.round(3).to_string(index=False))
+    if tabela['Regressão'].any():
+        print(f"\n{int(tabela['Regressão'].sum())} etapa(s) com regressão acima de {args.tolerancia:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
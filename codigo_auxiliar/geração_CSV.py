@@ -1,19 +1,33 @@
-import pandas as pd
-import numpy as np
-import random
-import os  # Importar a biblioteca 'os'
+"""
+Gerador de incidentes sintéticos para testes de carga.
+
+Gera qualquer número de linhas em blocos (o uso de memória depende só do
+tamanho do bloco), divididas em um ou mais CSVs e, opcionalmente, dentro de
+um .zip (escrito direto no .zip, sem arquivos intermediários). A mesma
+semente gera sempre os mesmos dados, então duas medições do benchmark
+comparam exatamente a mesma base.
+
+Uso:
+    python geração_CSV.py                                   # 4.000 linhas, como antes
+    python geração_CSV.py --linhas 20000000 --arquivos 8 --zip --saida carga_20M.zip
+"""
+import argparse
+import io
+import os
+import time
+import zipfile
 
-# Altere este 'N' para quantas linhas você quiser!
-N = 4000 
+import numpy as np
+import pandas as pd
 
 # =========================================================================
 # 1. Definir os "universos" de possibilidades BASEADOS NO SEU ARQUIVO
 # =========================================================================
 
-countries = ['USA', 'Brazil', 'Germany', 'China', 'India', 'UK', 'Russia', 'Japan', 'Canada', 'France', 'Australia', 'South Korea', 'Mexico', 'Nigeria', 'South Africa', 'Israel', 'Iran', 'Spain', 'Italy'] 
+countries = ['USA', 'Brazil', 'Germany', 'China', 'India', 'UK', 'Russia', 'Japan', 'Canada', 'France', 'Australia', 'South Korea', 'Mexico', 'Nigeria', 'South Africa', 'Israel', 'Iran', 'Spain', 'Italy']
 
 # Anos (baseado no nome do seu arquivo, 2015-2024)
-years = list(range(2015, 2025)) 
+years = list(range(2015, 2025))
 
 # Categorias que eu li do seu arquivo
 attack_types = ['Ransomware', 'DDoS', 'Phishing', 'Malware', 'Man-in-the-Middle', 'SQL Injection']
@@ -22,64 +36,133 @@ sources = ['Hacker Group', 'Nation-state', 'Unknown', 'Insider']
 vulnerabilities = ['Weak Passwords', 'Social Engineering', 'Zero-day', 'Unpatched Software']
 defenses = ['Antivirus', 'VPN', 'Encryption', 'AI-based Detection', 'Firewall']
 
-# =========================================================================
-# 2. Criar o dicionário de dados (geração aleatória)
-# =========================================================================
-data = {
-    'Country': np.random.choice(countries, N),
-    'Year': np.random.choice(years, N),
-    'Attack Type': np.random.choice(attack_types, N),
-    'Target Industry': np.random.choice(industries, N),
-    
-    # Gerando valores numéricos aleatórios que parecem com os seus
-    'Financial Loss (in Million $)': np.round(np.random.uniform(1.0, 100.0, size=N), 2),
-    'Number of Affected Users': np.random.randint(10000, 1000000, size=N),
-    
-    'Attack Source': np.random.choice(sources, N),
-    'Security Vulnerability Type': np.random.choice(vulnerabilities, N),
-    'Defense Mechanism Used': np.random.choice(defenses, N),
-    
-    'Incident Resolution Time (in Hours)': np.random.randint(24, 121, size=N)
-}
-
-# 3. Criar o DataFrame
-df = pd.DataFrame(data)
+# Padrões antigos do script (uma base pequena em um CSV com ';')
+N = 4000
+NOME_ARQUIVO_PADRAO = "global_cyber_threats_gr.csv"
+TAMANHO_BLOCO = 500000
+SEMENTE = 42
 
 # =========================================================================
-# 4. Adicionar "lógica" para os dados sintéticos ficarem melhores
+# 2. Gerar um bloco de incidentes (geração aleatória + "lógica")
 # =========================================================================
-# Se o Ataque é Phishing, a Vulnerabilidade é Engenharia Social
-phishing_indices = df[df['Attack Type'] == 'Phishing'].index
-df.loc[phishing_indices, 'Security Vulnerability Type'] = 'Social Engineering'
-df.loc[phishing_indices, 'Defense Mechanism Used'] = np.random.choice(['Antivirus', 'VPN'], len(phishing_indices))
-
-# Se o Ataque é SQL Injection, a Vulnerabilidade é Zero-day (no seu padrão)
-sql_indices = df[df['Attack Type'] == 'SQL Injection'].index
-df.loc[sql_indices, 'Security Vulnerability Type'] = 'Zero-day'
-df.loc[sql_indices, 'Defense Mechanism Used'] = 'Firewall'
-
-# Se o Ataque é Ransomware, a Vulnerabilidade são Senhas Fracas
-ransom_indices = df[df['Attack Type'] == 'Ransomware'].index
-df.loc[ransom_indices, 'Security Vulnerability Type'] = 'Weak Passwords'
+def _categoria(rng, valores, n):
+    """Sorteia 'n' valores como Categorical (o to_csv escreve os rótulos sem criar n strings)."""
+    return pd.Categorical.from_codes(rng.integers(0, len(valores), size=n), categories=valores)
+
+def gerar_bloco(rng, n):
+    """
+    Gera 'n' incidentes com as mesmas regras do script original:
+    Phishing -> Social Engineering (defesa Antivirus ou VPN),
+    SQL Injection -> Zero-day (defesa Firewall) e Ransomware -> Weak Passwords.
+    """
+    tipo_ataque = rng.integers(0, len(attack_types), size=n)
+    vulnerabilidade = rng.integers(0, len(vulnerabilities), size=n)
+    defesa = rng.integers(0, len(defenses), size=n)
+
+    # Se o Ataque é Phishing, a Vulnerabilidade é Engenharia Social
+    phishing = tipo_ataque == attack_types.index('Phishing')
+    vulnerabilidade[phishing] = vulnerabilities.index('Social Engineering')
+    defesa[phishing] = np.array([defenses.index('Antivirus'), defenses.index('VPN')])[rng.integers(0, 2, size=phishing.sum())]
+
+    # Se o Ataque é SQL Injection, a Vulnerabilidade é Zero-day (no seu padrão)
+    sql = tipo_ataque == attack_types.index('SQL Injection')
+    vulnerabilidade[sql] = vulnerabilities.index('Zero-day')
+    defesa[sql] = defenses.index('Firewall')
+
+    # Se o Ataque é Ransomware, a Vulnerabilidade são Senhas Fracas
+    vulnerabilidade[tipo_ataque == attack_types.index('Ransomware')] = vulnerabilities.index('Weak Passwords')
+
+    return pd.DataFrame({
+        'Country': _categoria(rng, countries, n),
+        'Year': rng.choice(years, n),
+        'Attack Type': pd.Categorical.from_codes(tipo_ataque, categories=attack_types),
+        'Target Industry': _categoria(rng, industries, n),
+
+        # Gerando valores numéricos aleatórios que parecem com os seus
+        'Financial Loss (in Million $)': np.round(rng.uniform(1.0, 100.0, size=n), 2),
+        'Number of Affected Users': rng.integers(10000, 1000000, size=n),
+
+        'Attack Source': _categoria(rng, sources, n),
+        'Security Vulnerability Type': pd.Categorical.from_codes(vulnerabilidade, categories=vulnerabilities),
+        'Defense Mechanism Used': pd.Categorical.from_codes(defesa, categories=defenses),
+
+        'Incident Resolution Time (in Hours)': rng.integers(24, 121, size=n),
+    })
+
+def gerar_blocos(n_linhas, semente=SEMENTE, tamanho_bloco=TAMANHO_BLOCO, indice_arquivo=0):
+    """
+    Gera os blocos de um arquivo. Cada bloco tem o seu próprio gerador,
+    derivado de (semente, arquivo, bloco): o resultado não depende da ordem
+    em que os arquivos são escritos.
+    """
+    for indice_bloco, inicio in enumerate(range(0, n_linhas, tamanho_bloco)):
+        rng = np.random.default_rng([semente, indice_arquivo, indice_bloco])
+        yield gerar_bloco(rng, min(tamanho_bloco, n_linhas - inicio))
 
 # =========================================================================
-# 5. Salvar em CSV (na pasta correta e com o delimitador correto)
+# 3. Salvar em CSV (um ou vários arquivos, opcionalmente em um .zip)
 # =========================================================================
-
-# Pega o caminho absoluto do diretório onde o script está
-script_dir = os.path.dirname(os.path.abspath(__file__)) 
-
-# Define o nome do arquivo que queremos criar
-file_name = "global_cyber_threats_gr.csv" # Você pode mudar esse nome se quiser
-
-# Cria o caminho completo (Ex: ...\codigo_auxiliar\global_cyber_threats_4k.csv)
-destination_path = os.path.join(script_dir, file_name)
-
-# Salva o DataFrame no caminho de destino completo
-# MUITO IMPORTANTE: Adicionado 'delimiter=';' para seguir o padrão do seu arquivo
-df.to_csv(destination_path, index=False, sep=';') 
-
-print(f"Arquivo '{file_name}' salvo com sucesso em: {destination_path}")
-print(f"O arquivo foi salvo usando ';' como delimitador, igual ao seu original.")
-print("\nAmostra dos dados gerados:")
-print(df.head())
\ No newline at end of file
+def _escrever_csv(arquivo_texto, blocos, separador):
+    for indice, bloco in enumerate(blocos):
+        bloco.to_csv(arquivo_texto, index=False, sep=separador, header=indice == 0, lineterminator='\n')
+
+def gerar_arquivos(destino, n_linhas, n_arquivos=1, semente=SEMENTE, tamanho_bloco=TAMANHO_BLOCO, separador=';',
+                   compactar=False):
+    """
+    Divide 'n_linhas' em 'n_arquivos' CSVs. Com 'compactar', 'destino' é o
+    .zip e os CSVs são escritos direto dentro dele; senão, 'destino' é o CSV
+    (um arquivo) ou a pasta onde os CSVs são criados (vários arquivos).
+    Retorna a lista de caminhos criados.
+    """
+    destino = os.fspath(destino)
+    linhas_por_arquivo = [n_linhas // n_arquivos + (i < n_linhas % n_arquivos) for i in range(n_arquivos)]
+    nome_base = os.path.splitext(os.path.basename(destino))[0]
+    nomes = ([f"{nome_base}.csv"] if n_arquivos == 1
+             else [f"{nome_base}_{i + 1:03d}.csv" for i in range(n_arquivos)])
+
+    if compactar:
+        with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zip_saida:
+            for indice, (nome, linhas) in enumerate(zip(nomes, linhas_por_arquivo)):
+                info = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                # force_zip64: o tamanho final não é conhecido antes de escrever
+                with zip_saida.open(info, 'w', force_zip64=True) as membro, \
+                        io.TextIOWrapper(membro, encoding='utf-8', newline='') as texto:
+                    _escrever_csv(texto, gerar_blocos(linhas, semente, tamanho_bloco, indice), separador)
+        return [destino]
+
+    if n_arquivos == 1:
+        caminhos = [destino]
+    else:
+        os.makedirs(destino, exist_ok=True)
+        caminhos = [os.path.join(destino, nome) for nome in nomes]
+    for indice, (caminho, linhas) in enumerate(zip(caminhos, linhas_por_arquivo)):
+        with open(caminho, 'w', encoding='utf-8', newline='') as texto:
+            _escrever_csv(texto, gerar_blocos(linhas, semente, tamanho_bloco, indice), separador)
+    return caminhos
+
+
+def main():
+    # Pega o caminho absoluto do diretório onde o script está
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description="Gera incidentes sintéticos de cibersegurança.")
+    parser.add_argument('--linhas', type=int, default=N)
+    parser.add_argument('--arquivos', type=int, default=1, help="Número de CSVs (divididos igualmente)")
+    parser.add_argument('--saida', default=os.path.join(script_dir, NOME_ARQUIVO_PADRAO),
+                        help="CSV de saída, pasta (vários arquivos) ou .zip (com --zip)")
+    parser.add_argument('--zip', action='store_true', help="Escreve os CSVs dentro de um .zip")
+    parser.add_argument('--semente', type=int, default=SEMENTE)
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO, help="Linhas geradas por vez")
+    parser.add_argument('--separador', default=';')
+    args = parser.parse_args()
+
+    caminhos = gerar_arquivos(args.saida, args.linhas, args.arquivos, args.semente, args.bloco, args.separador, args.zip)
+    print(f"{args.linhas:,} linhas geradas em: {', '.join(caminhos)}")
+    print(f"O arquivo foi salvo usando '{args.separador}' como delimitador.")
+    print("\nAmostra dos dados gerados:")
+    print(next(gerar_blocos(min(args.linhas, 5), args.semente)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Camada de consultas agregadas do dashboard.
+
+Transforma a escolha do "Gerador de Gráfico Dinâmico" (categoria, medida e
+agregação) em uma consulta SQL sobre o 'CyberSec.db'. Só o resultado agregado
+(uma linha por categoria) sai do SQLite; a tabela inteira nunca é carregada.
+
+Soma, Média e Contagem saem direto da tabela de resumos ('<tabela>_rollups');
+numa base publicada antes dos resumos, o mesmo resultado sai de um GROUP BY
+na tabela (a base publicada só é lida, nunca completada pelo app).
+Mediana e percentis são calculados no próprio SQLite com funções de janela,
+com a mesma interpolação linear do pandas (Series.quantile).
+
+O gráfico de dispersão também é resumido antes de ir para o navegador: uma
+grade 2D de densidade ou uma amostra estratificada, com as retas de regressão
+calculadas a partir de somas e produtos cruzados de todas as linhas.
+"""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from backend_tasks import ler_esquema_tabela, tabela_existe, MEDIDA_CONTAGEM
+
+# ==============================================================================
+# AGREGAÇÕES NO SQLITE (Gerador de Gráfico Dinâmico)
+# ==============================================================================
+# Agregações oferecidas: nome exibido -> função dos rollups ou quantil (0 a 1)
+AGREGACOES = {
+    'Soma': 'soma',
+    'Média': 'media',
+    'Contagem': 'contagem',
+    'Mediana': 0.5,
+    'Percentil 25': 0.25,
+    'Percentil 75': 0.75,
+    'Percentil 90': 0.9,
+}
+
+
+def _conectar_leitura(db_path):
+    return sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+
+
+def montar_consulta_rollup(table_name, dim_a, dim_b, medida, rollups=True):
+    """
+    SQL (e parâmetros) dos resumos de uma coluna (ou par de colunas) e medida,
+    com as colunas val_a, val_b, contagem, soma, minimo e maximo. Sem a
+    tabela de resumos, agrega a própria tabela com as mesmas regras (grupos
+    com a categoria vazia ficam de fora; dim_a = '' é o total da base).
+    """
+    if rollups:
+        sql = (f'SELECT val_a, val_b, contagem, soma, minimo, maximo FROM "{table_name}_rollups" '
+               'WHERE dim_a = ? AND dim_b = ? AND medida = ? ORDER BY val_a, val_b')
+        return sql, (dim_a, dim_b, medida)
+    dimensoes = [dim for dim in (dim_a, dim_b) if dim]
+    valores = [f'"{dim}"' for dim in dimensoes] + ["''"] * (2 - len(dimensoes))
+    if medida == MEDIDA_CONTAGEM:
+        estatisticas = 'COUNT(*) AS contagem, NULL AS soma, NULL AS minimo, NULL AS maximo'
+    else:
+        estatisticas = (f'COUNT("{medida}") AS contagem, SUM("{medida}") AS soma, '
+                        f'MIN("{medida}") AS minimo, MAX("{medida}") AS maximo')
+    sql = f'SELECT {valores[0]} AS val_a, {valores[1]} AS val_b, {estatisticas} FROM "{table_name}"'
+    if dimensoes:
+        colunas = ', '.join(f'"{dim}"' for dim in dimensoes)
+        sql += (' WHERE ' + ' AND '.join(f'"{dim}" IS NOT NULL' for dim in dimensoes)
+                + f' GROUP BY {colunas} ORDER BY {colunas}')
+    return sql, ()
+
+
+def montar_consulta(table_name, col_x, col_y, agregacao, rollups=True):
+    """
+    Monta o SQL (e os parâmetros) que agrega 'col_y' por 'col_x'. O resultado
+    tem duas colunas, 'categoria' e 'valor', ordenadas pela categoria.
+    """
+    if agregacao not in AGREGACOES:
+        raise ValueError(f"Agregação inválida: '{agregacao}'. Use {list(AGREGACOES)}.")
+    funcao = AGREGACOES[agregacao]
+
+    if isinstance(funcao, str) and not rollups:
+        expressao = {
+            'soma': f'COALESCE(SUM("{col_y}"), 0)',
+            'media': f'AVG("{col_y}")',
+            'contagem': f'COUNT("{col_y}")',
+        }[funcao]
+        sql = (f'SELECT "{col_x}" AS categoria, {expressao} AS valor FROM "{table_name}" '
+               f'WHERE "{col_x}" IS NOT NULL GROUP BY "{col_x}" ORDER BY "{col_x}"')
+        return sql, ()
+
+    if isinstance(funcao, str):
+        # Soma, média e contagem já estão pré-agregadas na ingestão
+        expressao = {
+            'soma': 'COALESCE(soma, 0)',
+            'media': 'soma / NULLIF(contagem, 0)',
+            'contagem': 'contagem',
+        }[funcao]
+        sql = (f'SELECT val_a AS categoria, {expressao} AS valor FROM "{table_name}_rollups" '
+               'WHERE dim_a = ? AND dim_b = ? AND medida = ? ORDER BY val_a')
+        return sql, (col_x, '', col_y)
+
+    # Quantil: numera as linhas de cada categoria em ordem crescente da medida e
+    # interpola entre as duas posições vizinhas de (n - 1) * q, como o pandas
+    sql = f'''
+        WITH ordenado AS (
+            SELECT "{col_x}" AS categoria, "{col_y}" AS valor,
+                   ROW_NUMBER() OVER janela - 1 AS posicao,
+                   (COUNT(*) OVER janela - 1) * :q AS alvo
+            FROM "{table_name}"
+            WHERE "{col_x}" IS NOT NULL AND "{col_y}" IS NOT NULL
+            -- Uma única janela: a tabela é ordenada uma vez só
+            WINDOW janela AS (PARTITION BY "{col_x}" ORDER BY "{col_y}"
+                              ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        )
+        SELECT categoria,
+               MIN(valor) + (MAX(valor) - MIN(valor)) * (MAX(alvo) - CAST(MAX(alvo) AS INTEGER)) AS valor
+        FROM ordenado
+        WHERE posicao = CAST(alvo AS INTEGER)
+           OR posicao = CAST(alvo AS INTEGER) + (alvo > CAST(alvo AS INTEGER))
+        GROUP BY categoria
+        ORDER BY categoria
+    '''
+    return sql, {'q': funcao}
+
+
+def consultar_agregado(db_path, table_name, col_x, col_y, agregacao):
+    """
+    Executa a agregação no SQLite e devolve um DataFrame pequeno com as
+    colunas [col_x, col_y] (uma linha por categoria).
+    """
+    conn = _conectar_leitura(db_path)
+    try:
+        # Os nomes de coluna entram no SQL: só colunas que existem na tabela são aceitas
+        esquema = ler_esquema_tabela(conn, table_name)
+        for col in (col_x, col_y):
+            if col not in esquema:
+                raise ValueError(f"Coluna '{col}' não existe na tabela '{table_name}'.")
+        sql, params = montar_consulta(table_name, col_x, col_y, agregacao,
+                                      rollups=tabela_existe(conn, f"{table_name}_rollups"))
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    df.columns = [col_x, col_y]
+    return df
+
+
+# ==============================================================================
+# DISPERSÃO EM ESCALA (Grade de densidade, amostra e retas de regressão)
+# ==============================================================================
+def grade_densidade(df, col_x, col_y, n_faixas=60):
+    """
+    Conta as linhas em uma grade de n_faixas x n_faixas sobre (col_x, col_y).
+    Devolve só as células ocupadas, com o centro de cada uma e a contagem.
+    """
+    validos = df[[col_x, col_y]].dropna()
+    x = validos[col_x].to_numpy(dtype=np.float64)
+    y = validos[col_y].to_numpy(dtype=np.float64)
+    if len(x) == 0:
+        return pd.DataFrame(columns=[col_x, col_y, 'Incidentes'])
+    contagens, bordas_x, bordas_y = np.histogram2d(x, y, bins=n_faixas)
+    centros_x = (bordas_x[:-1] + bordas_x[1:]) / 2
+    centros_y = (bordas_y[:-1] + bordas_y[1:]) / 2
+    i, j = np.nonzero(contagens)
+    return pd.DataFrame({col_x: centros_x[i], col_y: centros_y[j], 'Incidentes': contagens[i, j].astype(np.int64)})
+
+
+def amostra_estratificada(df, col_grupo, max_pontos=20000, semente=42):
+    """
+    Sorteia no máximo ~max_pontos linhas mantendo a proporção de cada grupo
+    (cada tipo de ataque continua representado como na base inteira).
+    """
+    if len(df) <= max_pontos:
+        return df
+    return (df.groupby(col_grupo, observed=True, group_keys=False)
+              .sample(frac=max_pontos / len(df), random_state=semente))
+
+
+def retas_de_regressao(df, col_x, col_y, col_grupo):
+    """
+    Ajusta uma reta de mínimos quadrados (y = a + b*x) por grupo usando só as
+    estatísticas suficientes (n, Σx, Σy, Σx², Σxy), calculadas de uma vez com
+    np.bincount sobre todas as linhas, sem modelo por grupo. Os valores são
+    centralizados na média geral antes das somas, para evitar perda de precisão.
+    """
+    validos = df[[col_x, col_y, col_grupo]].dropna()
+    codigos, grupos = pd.factorize(validos[col_grupo], sort=True)
+    x = validos[col_x].to_numpy(dtype=np.float64)
+    y = validos[col_y].to_numpy(dtype=np.float64)
+    if len(x) == 0:
+        return pd.DataFrame(columns=[col_grupo, 'n', 'inclinacao', 'intercepto', 'x_min', 'x_max'])
+    centro_x, centro_y = x.mean(), y.mean()
+    xc, yc = x - centro_x, y - centro_y
+
+    k = len(grupos)
+    n = np.bincount(codigos, minlength=k).astype(np.float64)
+    soma_x = np.bincount(codigos, weights=xc, minlength=k)
+    soma_y = np.bincount(codigos, weights=yc, minlength=k)
+    soma_xx = np.bincount(codigos, weights=xc * xc, minlength=k)
+    soma_xy = np.bincount(codigos, weights=xc * yc, minlength=k)
+
+    denominador = n * soma_xx - soma_x ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inclinacao = np.where(denominador > 0, (n * soma_xy - soma_x * soma_y) / denominador, np.nan)
+        intercepto_centralizado = (soma_y - inclinacao * soma_x) / n
+    intercepto = intercepto_centralizado + centro_y - inclinacao * centro_x
+
+    x_min = np.full(k, np.inf)
+    x_max = np.full(k, -np.inf)
+    np.minimum.at(x_min, codigos, x)
+    np.maximum.at(x_max, codigos, x)
+    return pd.DataFrame({
+        col_grupo: grupos, 'n': n.astype(np.int64), 'inclinacao': inclinacao,
+        'intercepto': intercepto, 'x_min': x_min, 'x_max': x_max,
+    })
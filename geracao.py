@@ -0,0 +1,187 @@
+"""
+Gerações da base e do modelo (troca azul/verde).
+
+Cada carga e cada treino são montados numa pasta nova, ainda não publicada:
+
+    CyberSec/geracoes/<id>/CyberSec.db (+ CyberSec_colunar/)      -> geração da base
+    CyberSec/geracoes/<id>/modelo_classificador.pkl (+ codificador, manifesto, relatório) -> geração do modelo
+
+Depois de validada, a geração é publicada trocando o ponteiro 'geracao.json'
+de uma vez (gravação atômica). Até lá, o app e o serviço de predição seguem
+usando a base e o modelo anteriores, completos; na próxima consulta eles leem
+o ponteiro e passam para a geração nova. O id da geração também entra na
+chave dos caches do app, então só as entradas da geração substituída são
+descartadas. Uma geração publicada nunca mais é alterada. As gerações antigas
+são apagadas depois de cada publicação (ficam a publicada e a anterior de
+cada tipo); uma pasta ainda em montagem tem a marca '.montando' com o seu
+dono e só é apagada se o dono tiver morrido.
+
+    {"base": "20261017-101500-3f2a9c1e", "modelo": "20261017-101731-b70d44aa",
+     "historico": {"base": [...], "modelo": [...]}}
+
+Bases e modelos gravados antes das gerações continuam direto em 'CyberSec/'
+e são usados enquanto nenhuma geração for publicada.
+"""
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from artefato_modelo import gravar_atomico
+
+ARQUIVO_GERACAO = 'geracao.json'
+PASTA_GERACOES = 'geracoes'
+# Tipo de geração -> arquivo principal dentro da pasta da geração
+ARQUIVOS_PUBLICADOS = {'base': 'CyberSec.db', 'modelo': 'modelo_classificador.pkl'}
+TIPOS_GERACAO = tuple(ARQUIVOS_PUBLICADOS)
+MANTER_GERACOES = 2      # Publicada + anterior de cada tipo (quem ainda está lendo a anterior não é afetado)
+TAMANHO_HISTORICO = 20
+MARCA_MONTAGEM = '.montando'
+# Pastas nunca publicadas sem dono conhecido (outra máquina ou sem marca) são apagadas depois disso
+IDADE_MAXIMA_MONTAGEM_S = 24 * 60 * 60
+
+
+def caminho_da_geracao(pasta):
+    return Path(pasta) / ARQUIVO_GERACAO
+
+
+def pasta_da_geracao(pasta, geracao):
+    return Path(pasta) / PASTA_GERACOES / geracao
+
+
+def nova_geracao():
+    """Identificador novo: ordenável pela data e único mesmo para duas gravações no mesmo segundo."""
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def ler_geracao(pasta):
+    """
+    Geração publicada da base e do modelo ({'base': ..., 'modelo': ...,
+    'historico': ...}). Sem nenhuma publicação, os ids ficam None.
+    """
+    geracao = {**dict.fromkeys(TIPOS_GERACAO), 'historico': {tipo: [] for tipo in TIPOS_GERACAO}}
+    try:
+        geracao.update(json.loads(caminho_da_geracao(pasta).read_text(encoding='utf-8')))
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return geracao
+
+
+def caminho_publicado(pasta, tipo, geracao=None):
+    """
+    Arquivo principal publicado de 'tipo' ('base' ou 'modelo'). 'geracao' é o
+    ponteiro já lido (para a base e o modelo virem da mesma leitura); sem ele,
+    o ponteiro é lido agora. Sem geração publicada, é o arquivo direto em 'pasta'.
+    """
+    geracao = ler_geracao(pasta) if geracao is None else geracao
+    nome = ARQUIVOS_PUBLICADOS[tipo]
+    if geracao.get(tipo) and pasta_da_geracao(pasta, geracao[tipo]).is_dir():
+        return pasta_da_geracao(pasta, geracao[tipo]) / nome
+    return Path(pasta) / nome
+
+# ==============================================================================
+# MONTAGEM, PUBLICAÇÃO E LIMPEZA
+# ==============================================================================
+def identificar_processo():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def processo_vivo(dono):
+    """
+    O processo 'maquina:pid' ainda existe? None quando não dá para saber
+    daqui: outra máquina, ou Windows (lá os.kill encerraria o processo).
+    """
+    maquina, _, pid = dono.rpartition(':')
+    if maquina != socket.gethostname() or os.name == 'nt':
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except ValueError:
+        return None
+    except PermissionError:
+        pass
+    return True
+
+
+def preparar_geracao(pasta, tipo):
+    """
+    Cria a pasta de uma geração nova (ainda não publicada), com a marca de
+    montagem do processo atual. Retorna (id, caminho do arquivo principal).
+    """
+    geracao = nova_geracao()
+    destino = pasta_da_geracao(pasta, geracao)
+    destino.mkdir(parents=True)
+    (destino / MARCA_MONTAGEM).write_text(identificar_processo(), encoding='utf-8')
+    return geracao, destino / ARQUIVOS_PUBLICADOS[tipo]
+
+
+def descartar_geracao(pasta, geracao):
+    """Apaga uma geração que não chegou a ser publicada (falha na montagem ou na validação)."""
+    shutil.rmtree(pasta_da_geracao(pasta, geracao), ignore_errors=True)
+
+
+def publicar_geracao(pasta, tipo, geracao, manter=MANTER_GERACOES):
+    """
+    Publica a geração de 'tipo' trocando o ponteiro (gravação atômica; o
+    outro tipo é mantido) e apaga as gerações que saíram do histórico.
+    Chamado só pelo processo das tarefas (um de cada vez).
+    """
+    if tipo not in TIPOS_GERACAO:
+        raise ValueError(f"Tipo de geração inválido: '{tipo}'. Use {TIPOS_GERACAO}.")
+    (pasta_da_geracao(pasta, geracao) / MARCA_MONTAGEM).unlink(missing_ok=True)
+    atual = ler_geracao(pasta)
+    atual[tipo] = geracao
+    atual['historico'][tipo] = (atual['historico'].get(tipo, []) + [geracao])[-TAMANHO_HISTORICO:]
+    gravar_atomico(caminho_da_geracao(pasta), lambda f: Path(f).write_text(
+        json.dumps(atual, ensure_ascii=False, indent=2), encoding='utf-8'))
+    print(f"Geração '{geracao}' publicada ({tipo}).")
+    coletar_geracoes(pasta, manter)
+
+
+def _em_montagem(pasta_geracao, publicadas):
+    """
+    A pasta pode estar sendo montada agora? Tem a marca de um processo vivo
+    ou, sem dono verificável (outra máquina, Windows, ou sem marca e nunca
+    publicada), é mais nova que IDADE_MAXIMA_MONTAGEM_S.
+    """
+    try:
+        vivo = processo_vivo((pasta_geracao / MARCA_MONTAGEM).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        if pasta_geracao.name in publicadas:
+            return False
+        vivo = None
+    if vivo is not None:
+        return vivo
+    return time.time() - pasta_geracao.stat().st_mtime < IDADE_MAXIMA_MONTAGEM_S
+
+
+def coletar_geracoes(pasta, manter=MANTER_GERACOES):
+    """
+    Apaga as pastas de geração que não estão entre as 'manter' últimas
+    publicadas de cada tipo, inclusive sobras de montagens interrompidas
+    (mas não as que ainda estão sendo montadas). Retorna os ids apagados.
+    Pastas ainda abertas em outro processo (Windows) ficam para a próxima coleta.
+    """
+    raiz = Path(pasta) / PASTA_GERACOES
+    if not raiz.is_dir():
+        return []
+    atual = ler_geracao(pasta)
+    manter_ids = {geracao for tipo in TIPOS_GERACAO for geracao in atual['historico'].get(tipo, [])[-manter:]}
+    manter_ids.update(atual[tipo] for tipo in TIPOS_GERACAO if atual[tipo])
+    publicadas = {geracao for tipo in TIPOS_GERACAO for geracao in atual['historico'].get(tipo, [])}
+    apagadas = []
+    for pasta_geracao in sorted(raiz.iterdir()):
+        if (pasta_geracao.is_dir() and pasta_geracao.name not in manter_ids
+                and not _em_montagem(pasta_geracao, publicadas)):
+            shutil.rmtree(pasta_geracao, ignore_errors=True)
+            if not pasta_geracao.exists():
+                apagadas.append(pasta_geracao.name)
+    if apagadas:
+        print(f"Gerações antigas apagadas: {', '.join(apagadas)}")
+    return apagadas
@@ -0,0 +1,276 @@
+"""
+Perfil de execução da carga da base e do treino do modelo.
+
+Os 'print' do processamento só aparecem no console do servidor e não dizem
+quanto tempo cada parte levou. O Perfilador registra, para cada etapa (e
+para cada pedaço carregado), o tempo de relógio, o tempo de CPU (do processo
+e dos processos filhos já encerrados), o pico de memória (RSS) e o número de
+linhas. As etapas são marcadas em sequência, como o 'progresso': abrir uma
+etapa fecha a anterior.
+
+Cada execução de tarefa grava o seu perfil na tabela 'perfis_execucao' do
+controle.db, que a página "Atualizar Base de Dados" mostra como histórico.
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource  # Só existe em Linux/macOS: no Windows o pico de memória fica vazio
+except ImportError:
+    resource = None
+
+# ==============================================================================
+# MEDIÇÕES DO PROCESSO
+# ==============================================================================
+def _pico_rss_mb(quem=None):
+    """Maior RSS já atingido pelo processo (ou pelos filhos já encerrados)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF if quem is None else quem).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / 1e6 if sys.platform == 'darwin' else pico / 1024
+
+
+def _rss_atual_mb():
+    """RSS atual (só no Linux, pelo /proc; nos outros sistemas fica vazio)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _tempo_cpu_s():
+    # Inclui os filhos já encerrados (ex.: o pool que lê os CSVs em paralelo)
+    tempos = os.times()
+    return tempos.user + tempos.system + tempos.children_user + tempos.children_system
+
+
+def _arredondar(valor, casas=3):
+    return round(valor, casas) if valor is not None else None
+
+# ==============================================================================
+# PERFILADOR
+# ==============================================================================
+class Perfilador:
+    """
+    Coleta as etapas de uma execução. Uso:
+
+        perfil = Perfilador()
+        perfil.iniciar_fase("Carga da base")
+        perfil.etapa("Análise dos arquivos", arquivos=3)
+        ...
+        perfil.etapa("Carga dos pedaços")
+        for pedaco in pedacos:
+            ...
+            perfil.pedaco(len(pedaco), insercao_s=...)
+        perfil.concluir()
+    """
+
+    def __init__(self):
+        self.iniciado_em = datetime.now().isoformat(timespec='seconds')
+        self.etapas = []
+        self.fase = None
+        self._atual = None
+        self._inicio = time.perf_counter()
+        self._inicio_cpu = _tempo_cpu_s()
+        self._ultimo_pedaco = None
+        self._linhas_acompanhadas = 0
+
+    def iniciar_fase(self, fase):
+        """Fecha a etapa aberta; as próximas etapas ficam agrupadas em 'fase'."""
+        self._fechar()
+        self.fase = fase
+
+    def etapa(self, nome, **dados):
+        """Fecha a etapa aberta e começa a medir 'nome'. 'dados' fica registrado junto."""
+        self._fechar()
+        agora = time.perf_counter()
+        self._atual = {
+            'fase': self.fase,
+            'etapa': nome,
+            'inicio_s': agora - self._inicio,
+            '_inicio': agora,
+            '_inicio_cpu': _tempo_cpu_s(),
+            '_pico_anterior': _pico_rss_mb(),
+            'linhas': None,
+            'pedacos': [],
+            'dados': dict(dados),
+        }
+        self._ultimo_pedaco = agora
+        self._linhas_acompanhadas = 0
+
+    def anotar(self, linhas=None, **dados):
+        """Acrescenta o número de linhas e outros dados à etapa aberta."""
+        if self._atual is None:
+            return
+        if linhas is not None:
+            self._atual['linhas'] = int(linhas)
+        self._atual['dados'].update(dados)
+
+    def pedaco(self, linhas, **dados):
+        """Registra um pedaço da etapa aberta: tempo desde o pedaço anterior e linhas."""
+        if self._atual is None:
+            return
+        agora = time.perf_counter()
+        self._atual['pedacos'].append({'linhas': int(linhas), 'tempo_s': _arredondar(agora - self._ultimo_pedaco, 4),
+                                       **dados})
+        self._atual['linhas'] = (self._atual['linhas'] or 0) + int(linhas)
+        self._ultimo_pedaco = agora
+
+    def acompanhar(self, progresso=None):
+        """
+        Callback de progresso que também registra pedaços: cada aviso com
+        'linhas_lidas' (total acumulado) vira um pedaço da etapa aberta. O
+        aviso é repassado a 'progresso', se informado.
+        """
+        def callback(etapa, **dados):
+            if 'linhas_lidas' in dados:
+                self.pedaco(dados['linhas_lidas'] - self._linhas_acompanhadas)
+                self._linhas_acompanhadas = dados['linhas_lidas']
+            if progresso:
+                progresso(etapa, **dados)
+        return callback
+
+    def _fechar(self):
+        if self._atual is None:
+            return
+        etapa, self._atual = self._atual, None
+        pico = _pico_rss_mb()
+        pico_anterior = etapa.pop('_pico_anterior')
+        etapa.update({
+            'inicio_s': _arredondar(etapa['inicio_s']),
+            'tempo_s': _arredondar(time.perf_counter() - etapa.pop('_inicio')),
+            'cpu_s': _arredondar(_tempo_cpu_s() - etapa.pop('_inicio_cpu')),
+            'pico_rss_mb': _arredondar(pico, 1),
+            # Quanto o pico do processo subiu nesta etapa (0 se ela não passou do pico anterior)
+            'aumento_pico_mb': _arredondar(pico - pico_anterior, 1) if pico is not None else None,
+            'rss_final_mb': _arredondar(_rss_atual_mb(), 1),
+        })
+        self.etapas.append(etapa)
+
+    def concluir(self):
+        """Fecha a etapa aberta. Pode ser chamado mais de uma vez."""
+        self._fechar()
+        return self
+
+    def em_dicionario(self):
+        """Resumo da execução e lista de etapas (serializável em JSON)."""
+        linhas = [etapa['linhas'] for etapa in self.etapas if etapa['linhas'] is not None]
+        return {
+            'iniciado_em': self.iniciado_em,
+            'duracao_s': _arredondar(time.perf_counter() - self._inicio),
+            'cpu_s': _arredondar(_tempo_cpu_s() - self._inicio_cpu),
+            'pico_rss_mb': _arredondar(_pico_rss_mb(), 1),
+            'pico_filhos_mb': _arredondar(_pico_rss_mb(resource.RUSAGE_CHILDREN) if resource else None, 1),
+            'linhas': max(linhas) if linhas else None,
+            'etapas': self.etapas,
+        }
+
+    def imprimir(self):
+        """Tabela das etapas no console."""
+        if not self.etapas:
+            return
+        print("\nPerfil da execução:")
+        print(tabela_de_etapas(self.etapas).to_string(index=False))
+
+# ==============================================================================
+# HISTÓRICO (Tabela 'perfis_execucao' do controle.db)
+# ==============================================================================
+def conectar_perfis(caminho_controle):
+    """Abre o controle.db (criando a tabela de perfis se preciso)."""
+    conn = sqlite3.connect(caminho_controle, timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS perfis_execucao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tarefa_id INTEGER,
+            tipo TEXT NOT NULL,
+            sucesso INTEGER NOT NULL,
+            iniciado_em TEXT NOT NULL,
+            duracao_s REAL,
+            cpu_s REAL,
+            pico_rss_mb REAL,
+            linhas INTEGER,
+            etapas TEXT NOT NULL
+        )
+    ''')
+    return conn
+
+
+def gravar_perfil(caminho_controle, perfil, tipo, sucesso, tarefa_id=None):
+    """Grava o perfil (já concluído) de uma execução. Retorna o id do registro."""
+    resumo = perfil.em_dicionario()
+    conn = conectar_perfis(caminho_controle)
+    try:
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO perfis_execucao (tarefa_id, tipo, sucesso, iniciado_em, duracao_s, cpu_s, pico_rss_mb, '
+                'linhas, etapas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (tarefa_id, tipo, int(bool(sucesso)), resumo['iniciado_em'], resumo['duracao_s'], resumo['cpu_s'],
+                 resumo['pico_rss_mb'], resumo['linhas'], json.dumps(resumo['etapas'], ensure_ascii=False))
+            )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def listar_perfis(caminho_controle, limite=20):
+    """Os 'limite' perfis mais recentes (o mais novo primeiro), com as etapas já decodificadas."""
+    if not Path(caminho_controle).exists():
+        return []
+    conn = conectar_perfis(caminho_controle)
+    conn.row_factory = sqlite3.Row
+    try:
+        linhas = conn.execute("SELECT * FROM perfis_execucao ORDER BY id DESC LIMIT ?", (limite,)).fetchall()
+    finally:
+        conn.close()
+    perfis = []
+    for linha in linhas:
+        perfil = dict(linha)
+        perfil['etapas'] = json.loads(perfil['etapas'])
+        perfis.append(perfil)
+    return perfis
+
+
+def tabela_de_perfis(perfis):
+    """Resumo das execuções para exibição (uma linha por execução)."""
+    return pd.DataFrame([{
+        'Execução': perfil['id'],
+        'Tarefa': perfil['tarefa_id'],
+        'Tipo': perfil['tipo'],
+        'Sucesso': bool(perfil['sucesso']),
+        'Início': perfil['iniciado_em'],
+        'Duração (s)': perfil['duracao_s'],
+        'CPU (s)': perfil['cpu_s'],
+        'Pico de memória (MB)': perfil['pico_rss_mb'],
+        'Linhas': perfil['linhas'],
+        # Etapa mais demorada: onde olhar primeiro quando a execução ficou lenta
+        'Etapa mais lenta': max(perfil['etapas'], key=lambda etapa: etapa['tempo_s'])['etapa'] if perfil['etapas'] else '',
+    } for perfil in perfis])
+
+
+def tabela_de_etapas(etapas):
+    """Uma linha por etapa, com a fração do tempo total e a vazão."""
+    tabela = pd.DataFrame([{
+        'Fase': etapa['fase'] or '',
+        'Etapa': etapa['etapa'],
+        'Tempo (s)': etapa['tempo_s'],
+        'CPU (s)': etapa['cpu_s'],
+        'Pico de memória (MB)': etapa['pico_rss_mb'],
+        'Aumento do pico (MB)': etapa['aumento_pico_mb'],
+        'Linhas': etapa['linhas'],
+        'Pedaços': len(etapa['pedacos']) or None,
+    } for etapa in etapas])
+    if tabela.empty:
+        return tabela
+    total = tabela['Tempo (s)'].sum()
+    tabela.insert(3, '% do tempo', (tabela['Tempo (s)'] / total * 100).round(1) if total else None)
+    tabela['Linhas/s'] = (pd.to_numeric(tabela['Linhas']) / tabela['Tempo (s)'].where(tabela['Tempo (s)'] > 0)).round(0)
+    return tabela
@@ -0,0 +1,372 @@
+"""
+Serviço HTTP local de predição (sem Streamlit).
+
+Carrega o modelo salvo pelo 'treinar_novo_modelo' uma única vez, agrupa as
+requisições que chegam ao mesmo tempo em pequenos lotes (uma única chamada de
+'predict_proba' por lote) e recarrega o modelo automaticamente quando uma nova
+geração do modelo é publicada (geracao.py) ou, com '--modelo', quando o
+arquivo indicado é regravado.
+
+Uso:
+    python servico_predicao.py --porta 8600
+    python servico_predicao.py --modelo caminho/modelo_classificador.pkl
+
+Endpoints:
+    POST /prever    -> {"incidentes": [{"Country": "USA", "Year": 2020, ...}, ...]}
+                       (ou um único objeto de incidente)
+    GET  /metricas  -> contadores de latência e vazão
+    GET  /saude     -> estado do modelo carregado
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from artefato_modelo import caminho_do_manifesto, carregar_artefato
+from backend_tasks import caminho_do_codificador, codificar_dataframe
+from geracao import caminho_publicado
+
+PASTA_DADOS_PADRAO = Path("CyberSec")
+
+
+# ==============================================================================
+# MODELO COM RECARGA AUTOMÁTICA
+# ==============================================================================
+class ModeloRecarregavel:
+    """
+    Mantém o modelo e o codificador em memória e os troca quando os arquivos
+    em disco mudam (verificação por data de modificação). Com 'pasta', o
+    arquivo é o da geração publicada, relido do ponteiro a cada verificação;
+    com 'model_path', é sempre o mesmo arquivo. A carga confere o SHA-256 do
+    manifesto, então um modelo ainda sendo gravado nunca é aceito.
+    """
+
+    def __init__(self, model_path=None, pasta=None):
+        if (model_path is None) == (pasta is None):
+            raise ValueError("Informe 'model_path' ou 'pasta'.")
+        self.pasta = Path(pasta) if pasta is not None else None
+        self.model_path = Path(model_path) if model_path is not None else caminho_publicado(self.pasta, 'modelo')
+        self.lock = threading.Lock()
+        self.modelo = None
+        self.codificador = None
+        self.manifesto = None
+        self.assinatura = None
+        self.recargas = 0
+        self.carregado_em = None
+
+    def _caminho_atual(self):
+        return caminho_publicado(self.pasta, 'modelo') if self.pasta is not None else self.model_path
+
+    @staticmethod
+    def _assinatura(model_path):
+        manifest_path = caminho_do_manifesto(model_path)
+        try:
+            return (str(model_path), model_path.stat().st_mtime_ns,
+                    caminho_do_codificador(model_path).stat().st_mtime_ns,
+                    manifest_path.stat().st_mtime_ns if manifest_path.exists() else None)
+        except FileNotFoundError:
+            return None
+
+    def verificar_atualizacao(self):
+        """Recarrega o modelo se a geração publicada ou os arquivos mudaram. Retorna True se recarregou."""
+        model_path = self._caminho_atual()
+        assinatura = self._assinatura(model_path)
+        if assinatura is None or assinatura == self.assinatura:
+            return False
+        try:
+            modelo, codificador, manifesto = carregar_artefato(model_path)
+        except Exception as e:
+            # Arquivo ainda sendo gravado pelo treino: tenta de novo na próxima verificação
+            print(f"Não foi possível recarregar o modelo ainda: {e}")
+            return False
+        # Só troca se os arquivos não mudaram durante a leitura
+        if self._assinatura(model_path) != assinatura:
+            return False
+        with self.lock:
+            self.model_path = model_path
+            self.modelo = modelo
+            self.codificador = codificador
+            self.manifesto = manifesto
+            self.assinatura = assinatura
+            self.recargas += 1
+            self.carregado_em = time.time()
+        print(f"Modelo carregado de: {self.model_path}")
+        return True
+
+    def atual(self):
+        with self.lock:
+            return self.modelo, self.codificador
+
+
+# ==============================================================================
+# MÉTRICAS (Latência e Vazão)
+# ==============================================================================
+class Metricas:
+    def __init__(self, janela=1000):
+        self.lock = threading.Lock()
+        self.inicio = time.time()
+        self.requisicoes = 0
+        self.incidentes = 0
+        self.lotes = 0
+        self.erros = 0
+        self.latencias_ms = deque(maxlen=janela)
+        self.tamanhos_lote = deque(maxlen=janela)
+        self.instantes = deque(maxlen=janela * 10)  # (instante, nº de incidentes)
+
+    def registrar_requisicao(self, n_incidentes, latencia_ms):
+        with self.lock:
+            self.requisicoes += 1
+            self.incidentes += n_incidentes
+            self.latencias_ms.append(latencia_ms)
+            self.instantes.append((time.time(), n_incidentes))
+
+    def registrar_lote(self, n_incidentes):
+        with self.lock:
+            self.lotes += 1
+            self.tamanhos_lote.append(n_incidentes)
+
+    def registrar_erro(self):
+        with self.lock:
+            self.erros += 1
+
+    def resumo(self):
+        with self.lock:
+            agora = time.time()
+            latencias = np.array(self.latencias_ms) if self.latencias_ms else np.array([0.0])
+            ultimo_minuto = sum(n for t, n in self.instantes if agora - t <= 60)
+            tempo_ativo = agora - self.inicio
+            return {
+                'tempo_ativo_s': round(tempo_ativo, 1),
+                'requisicoes': self.requisicoes,
+                'incidentes': self.incidentes,
+                'lotes': self.lotes,
+                'erros': self.erros,
+                'incidentes_por_lote_medio': round(float(np.mean(self.tamanhos_lote)), 2) if self.tamanhos_lote else 0.0,
+                'latencia_ms': {
+                    'p50': round(float(np.percentile(latencias, 50)), 3),
+                    'p95': round(float(np.percentile(latencias, 95)), 3),
+                    'p99': round(float(np.percentile(latencias, 99)), 3),
+                    'max': round(float(latencias.max()), 3),
+                },
+                'vazao_incidentes_por_s': {
+                    'desde_inicio': round(self.incidentes / tempo_ativo, 2) if tempo_ativo > 0 else 0.0,
+                    'ultimo_minuto': round(ultimo_minuto / 60, 2),
+                },
+            }
+
+
+# ==============================================================================
+# MICRO-LOTES (Agrupa requisições concorrentes)
+# ==============================================================================
+class Pedido:
+    def __init__(self, registros):
+        self.registros = registros
+        self.resultado = None
+        self.erro = None
+        self.pronto = threading.Event()
+
+
+class AgrupadorDeLotes:
+    """
+    Uma thread consome a fila de pedidos: pega o primeiro, espera até
+    'espera_max_ms' por outros pedidos (até 'max_lote' incidentes) e faz uma
+    única chamada de 'predict_proba' para o lote inteiro.
+    """
+
+    def __init__(self, modelo_recarregavel, metricas, max_lote=256, espera_max_ms=5):
+        self.modelo_recarregavel = modelo_recarregavel
+        self.metricas = metricas
+        self.max_lote = max_lote
+        self.espera_max = espera_max_ms / 1000
+        self.fila = queue.Queue()
+        threading.Thread(target=self._laco, daemon=True).start()
+
+    def prever(self, registros):
+        pedido = Pedido(registros)
+        self.fila.put(pedido)
+        pedido.pronto.wait()
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def _laco(self):
+        while True:
+            pedidos = [self.fila.get()]
+            total = len(pedidos[0].registros)
+            prazo = time.monotonic() + self.espera_max
+            while total < self.max_lote:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self.fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                pedidos.append(pedido)
+                total += len(pedido.registros)
+            self._processar(pedidos, total)
+
+    def _processar(self, pedidos, total):
+        modelo, codificador = self.modelo_recarregavel.atual()
+        try:
+            if modelo is None:
+                raise RuntimeError("Nenhum modelo carregado. Treine um modelo pelo app primeiro.")
+            try:
+                registros = [registro for pedido in pedidos for registro in pedido.registros]
+                resultados = self._prever(modelo, codificador, registros)
+                self.metricas.registrar_lote(total)
+                inicio = 0
+                for pedido in pedidos:
+                    fim = inicio + len(pedido.registros)
+                    pedido.resultado = resultados[inicio:fim]
+                    inicio = fim
+            except Exception:
+                if len(pedidos) == 1:
+                    raise
+                # Um pedido inválido não pode derrubar os outros do lote: cada um é refeito
+                # sozinho e o erro só chega a quem o causou
+                for pedido in pedidos:
+                    try:
+                        pedido.resultado = self._prever(modelo, codificador, pedido.registros)
+                        self.metricas.registrar_lote(len(pedido.registros))
+                    except Exception as e:
+                        pedido.erro = e
+        except Exception as e:
+            for pedido in pedidos:
+                pedido.erro = e
+        finally:
+            for pedido in pedidos:
+                pedido.pronto.set()
+
+    @staticmethod
+    def _prever(modelo, codificador, registros):
+        """Classe prevista e probabilidades de cada registro, numa única chamada de 'predict_proba'."""
+        X_lote = codificar_dataframe(pd.DataFrame(registros), codificador)
+        probabilidades = modelo.predict_proba(X_lote)
+        classes = [str(classe) for classe in modelo.classes_]
+        return [
+            {
+                'tipo_previsto': classes[int(linha.argmax())],
+                'probabilidades': dict(zip(classes, (float(p) for p in linha))),
+            }
+            for linha in probabilidades
+        ]
+
+
+# ==============================================================================
+# SERVIDOR HTTP
+# ==============================================================================
+class ServidorHTTP(ThreadingHTTPServer):
+    # A fila padrão do socketserver (5 conexões) recusa clientes concorrentes
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def criar_servidor(host, porta, modelo_recarregavel, agrupador, metricas):
+    class Manipulador(BaseHTTPRequestHandler):
+        def _responder(self, status, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path == '/metricas':
+                self._responder(200, metricas.resumo())
+            elif self.path == '/saude':
+                modelo, _ = modelo_recarregavel.atual()
+                self._responder(200, {
+                    'modelo_carregado': modelo is not None,
+                    'caminho_modelo': str(modelo_recarregavel.model_path),
+                    'recargas': modelo_recarregavel.recargas,
+                    'carregado_em': modelo_recarregavel.carregado_em,
+                    'manifesto': {chave: (modelo_recarregavel.manifesto or {}).get(chave)
+                                  for chave in ('versao_formato', 'criado_em', 'treino')},
+                })
+            else:
+                self._responder(404, {'erro': 'Rota não encontrada.'})
+
+        def do_POST(self):
+            if self.path != '/prever':
+                self._responder(404, {'erro': 'Rota não encontrada.'})
+                return
+            inicio = time.perf_counter()
+            try:
+                tamanho = int(self.headers.get('Content-Length', 0))
+                corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+                registros = corpo.get('incidentes', [corpo]) if isinstance(corpo, dict) else corpo
+                if not registros:
+                    raise ValueError("Nenhum incidente enviado.")
+                # Valida antes de entrar na fila, para um pedido inválido não derrubar o lote todo
+                if not isinstance(registros, list) or not all(isinstance(r, dict) for r in registros):
+                    raise ValueError("Cada incidente deve ser um objeto JSON (coluna -> valor).")
+                for registro in registros:
+                    compostos = [col for col, valor in registro.items() if isinstance(valor, (list, dict))]
+                    if compostos:
+                        raise ValueError(f"Os valores devem ser texto, número ou null (colunas {compostos}).")
+                resultado = agrupador.prever(registros)
+            except (ValueError, TypeError, AttributeError) as e:
+                metricas.registrar_erro()
+                self._responder(400, {'erro': str(e)})
+                return
+            except Exception as e:
+                metricas.registrar_erro()
+                self._responder(503, {'erro': str(e)})
+                return
+            metricas.registrar_requisicao(len(registros), (time.perf_counter() - inicio) * 1000)
+            self._responder(200, {'resultados': resultado})
+
+        def log_message(self, format, *args):
+            pass  # Evita um print por requisição no console
+
+    return ServidorHTTP((host, porta), Manipulador)
+
+
+def vigiar_modelo(modelo_recarregavel, intervalo):
+    """Thread que verifica periodicamente se um novo modelo foi salvo."""
+    while True:
+        time.sleep(intervalo)
+        modelo_recarregavel.verificar_atualizacao()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço local de predição do Tipo de Ataque.")
+    parser.add_argument('--pasta', default=str(PASTA_DADOS_PADRAO),
+                        help="Pasta dos dados do app (usa o modelo publicado nela)")
+    parser.add_argument('--modelo', help="Caminho fixo de um modelo_classificador.pkl (ignora as gerações)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8600)
+    parser.add_argument('--max-lote', type=int, default=256, help="Máximo de incidentes por chamada ao modelo")
+    parser.add_argument('--espera-ms', type=float, default=5.0, help="Tempo máximo de espera para montar um lote")
+    parser.add_argument('--intervalo-recarga', type=float, default=2.0, help="Segundos entre verificações de novo modelo")
+    args = parser.parse_args()
+
+    modelo_recarregavel = ModeloRecarregavel(args.modelo, None if args.modelo else args.pasta)
+    if not modelo_recarregavel.verificar_atualizacao():
+        print("Aviso: modelo ainda não encontrado. O serviço vai carregá-lo assim que for salvo.")
+
+    metricas = Metricas()
+    agrupador = AgrupadorDeLotes(modelo_recarregavel, metricas, args.max_lote, args.espera_ms)
+    threading.Thread(target=vigiar_modelo, args=(modelo_recarregavel, args.intervalo_recarga), daemon=True).start()
+
+    servidor = criar_servidor(args.host, args.porta, modelo_recarregavel, agrupador, metricas)
+    print(f"Serviço de predição ouvindo em http://{args.host}:{args.porta}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("Encerrando o serviço...")
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,507 @@
+"""
+Fila de tarefas em segundo plano (processamento da base e treino do modelo).
+
+O botão "Processar e Treinar Nova Base" só grava o arquivo enviado em disco e
+registra uma tarefa na tabela 'tarefas' do 'controle.db'. Um pool com um único
+processo executa as tarefas em ordem (uma carga por vez), e cada etapa grava o
+seu progresso estruturado (linhas carregadas, árvores ajustadas) na mesma
+tabela, que a página consulta periodicamente. Ao final, o perfil da execução
+(tempo, CPU e memória de cada etapa) vai para a tabela 'perfis_execucao'
+(instrumentacao.py).
+
+A base e o modelo novos são montados em gerações ainda não publicadas
+(geracao.py): enquanto a tarefa roda, o app continua usando os anteriores,
+e só depois de validados eles são publicados, trocando o ponteiro de uma vez.
+
+A sessão do Streamlit nunca fica bloqueada, e fechar ou recarregar o navegador
+não interrompe o trabalho. Cada tarefa é assumida por um único processo (uma
+atualização condicional no controle.db), que grava nela o seu dono
+(máquina:pid) e um batimento periódico. Se o app for reiniciado, só as
+tarefas cujo dono morreu (ou parou de bater) são marcadas como interrompidas
+(a geração que estava sendo montada nunca foi publicada), e as que ainda
+estavam na fila são enviadas de novo ao pool: mesmo com mais de um servidor
+usando o mesmo controle.db, cada tarefa roda uma vez só.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from backend_tasks import (processar_nova_base, treinar_novo_modelo, atualizar_modelo_incremental,
+                           copiar_base, completar_base, validar_base, vincular_modelo, validar_modelo, ultima_ingestao,
+                           ORCAMENTO_SELECAO_S, MOTOR_PADRAO, COMPRESSAO_PADRAO)
+from geracao import (caminho_publicado, preparar_geracao, descartar_geracao, publicar_geracao,
+                     identificar_processo, processo_vivo)
+from instrumentacao import Perfilador, gravar_perfil
+
+# ==============================================================================
+# TABELA DE TAREFAS (controle.db)
+# ==============================================================================
+ESTADOS_ATIVOS = ('na_fila', 'executando')
+ESTADOS_FINAIS = ('concluida', 'falhou', 'interrompida')
+INTERVALO_BATIMENTO_S = 10
+# Sem batimento por mais que isso, a tarefa é dada como abandonada (dono em outra máquina ou travado)
+LIMITE_BATIMENTO_S = 6 * INTERVALO_BATIMENTO_S
+
+
+def conectar_controle(caminho_controle, criar=True):
+    """
+    Abre o controle.db, criando a tabela de tarefas se preciso. Com
+    criar=False só abre (o esquema e o WAL já foram conferidos por quem
+    abriu antes, ex.: a própria tarefa).
+    """
+    conn = sqlite3.connect(caminho_controle, timeout=30)
+    if not criar:
+        return conn
+    # WAL: a página lê o progresso enquanto o processo da tarefa escreve
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            parametros TEXT NOT NULL,
+            etapa TEXT,
+            progresso TEXT,
+            mensagem TEXT,
+            resultado TEXT,
+            criada_em TEXT NOT NULL,
+            iniciada_em TEXT,
+            atualizada_em TEXT,
+            concluida_em TEXT,
+            dono TEXT,
+            batimento REAL
+        )
+    ''')
+    # Controles criados antes do dono e do batimento
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(tarefas)")}
+    for col, tipo in [('dono', 'TEXT'), ('batimento', 'REAL')]:
+        if col not in colunas:
+            conn.execute(f"ALTER TABLE tarefas ADD COLUMN {col} {tipo}")
+    return conn
+
+
+def _agora():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _atualizar(conn, tarefa_id, estados=None, **campos):
+    """
+    Atualiza os campos da tarefa pela conexão 'conn' (aberta uma vez por
+    quem chama). Com 'estados', só se ela ainda estiver num deles (um único
+    UPDATE: dois processos não mudam a mesma tarefa ao mesmo tempo).
+    Retorna True se a tarefa foi atualizada.
+    """
+    campos['atualizada_em'] = _agora()
+    atribuicoes = ', '.join(f"{campo} = ?" for campo in campos)
+    condicao = f" AND estado IN ({', '.join('?' * len(estados))})" if estados else ""
+    with conn:
+        cursor = conn.execute(f"UPDATE tarefas SET {atribuicoes} WHERE id = ?{condicao}",
+                              (*campos.values(), tarefa_id, *(estados or ())))
+    return cursor.rowcount > 0
+
+
+def dono_ativo(tarefa):
+    """
+    O processo que assumiu a tarefa ainda está trabalhando nela? Quando dá
+    para conferir (mesma máquina), o pid tem de existir; em qualquer caso,
+    o batimento tem de ser recente.
+    """
+    if not tarefa.get('dono') or tarefa.get('batimento') is None:
+        return False
+    if time.time() - tarefa['batimento'] > LIMITE_BATIMENTO_S:
+        return False
+    return processo_vivo(tarefa['dono']) is not False
+
+
+def criar_tarefa(caminho_controle, tipo, parametros):
+    """Registra uma tarefa na fila e retorna o seu id."""
+    conn = conectar_controle(caminho_controle)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO tarefas (tipo, estado, parametros, etapa, criada_em) VALUES (?, 'na_fila', ?, 'Na fila', ?)",
+                (tipo, json.dumps(parametros, ensure_ascii=False), _agora())
+            )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def _linha_para_dict(linha):
+    tarefa = dict(linha)
+    for campo in ('parametros', 'progresso', 'resultado'):
+        tarefa[campo] = json.loads(tarefa[campo]) if tarefa[campo] else None
+    return tarefa
+
+
+def ler_tarefa(caminho_controle, tarefa_id):
+    conn = conectar_controle(caminho_controle)
+    conn.row_factory = sqlite3.Row
+    try:
+        linha = conn.execute("SELECT * FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()
+    finally:
+        conn.close()
+    return _linha_para_dict(linha) if linha else None
+
+
+def listar_tarefas(caminho_controle, limite=10):
+    """As 'limite' tarefas mais recentes (a mais nova primeiro)."""
+    conn = conectar_controle(caminho_controle)
+    conn.row_factory = sqlite3.Row
+    try:
+        linhas = conn.execute("SELECT * FROM tarefas ORDER BY id DESC LIMIT ?", (limite,)).fetchall()
+    finally:
+        conn.close()
+    return [_linha_para_dict(linha) for linha in linhas]
+
+
+# ==============================================================================
+# ARQUIVOS ENVIADOS (Gravados em disco para o processo da tarefa)
+# ==============================================================================
+def salvar_envio(pasta_envios, uploaded_file):
+    """
+    Grava o arquivo enviado em uma subpasta própria de 'pasta_envios' (o nome
+    original é mantido, pois vai para o manifesto da base). Retorna os
+    parâmetros 'arquivo', 'nome_arquivo' e 'pasta_envio' da tarefa.
+    """
+    Path(pasta_envios).mkdir(parents=True, exist_ok=True)
+    pasta_envio = Path(tempfile.mkdtemp(dir=pasta_envios))
+    arquivo = pasta_envio / uploaded_file.name
+    with open(arquivo, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+    return {'arquivo': str(arquivo), 'nome_arquivo': uploaded_file.name, 'pasta_envio': str(pasta_envio)}
+
+
+def descartar_envio(parametros):
+    """O arquivo enviado só serve para a sua tarefa: removido quando ela termina."""
+    if parametros.get('pasta_envio'):
+        shutil.rmtree(parametros['pasta_envio'], ignore_errors=True)
+
+
+# ==============================================================================
+# EXECUÇÃO (Processo separado do Streamlit)
+# ==============================================================================
+def _montar_base(parametros, pasta, progresso, perfil):
+    """
+    Monta a base numa geração nova (no modo anexar, a partir de uma cópia da
+    publicada), valida e publica. Retorna (sucesso, mensagem, caminho da base
+    publicada ao final).
+    """
+    atual = caminho_publicado(pasta, 'base')
+    geracao, db_path = preparar_geracao(pasta, 'base')
+    try:
+        if parametros['modo'] == 'anexar' and atual.exists():
+            progresso("Copiando a base atual")
+            perfil.iniciar_fase("Carga da base")
+            perfil.etapa("Cópia da base atual")
+            copiar_base(atual, db_path)
+        sucesso, msg = processar_nova_base(
+            uploaded_file=parametros['arquivo'],
+            db_path=db_path,
+            table_name=parametros['table_name'],
+            modo=parametros['modo'],
+            chave_dedupe=parametros.get('chave_dedupe'),
+            progresso=progresso,
+            perfil=perfil,
+        )
+        if sucesso:
+            # Resumos, estatísticas e snapshot ficam prontos antes de publicar
+            progresso("Completando a base nova")
+            perfil.etapa("Complementos da base")
+            completar_base(db_path, parametros['table_name'])
+            progresso("Validando a base nova")
+            perfil.etapa("Validação da base")
+            sucesso_validacao, msg_validacao = validar_base(db_path, parametros['table_name'])
+            if not sucesso_validacao:
+                sucesso, msg = False, msg_validacao
+    except Exception:
+        descartar_geracao(pasta, geracao)
+        raise
+    if not sucesso:
+        descartar_geracao(pasta, geracao)
+        return False, msg, atual
+    if parametros['modo'] == 'anexar' and atual.exists() and _mesma_ingestao(atual, db_path, parametros['table_name']):
+        # Anexar só linhas já existentes: nada mudou, a geração publicada continua
+        descartar_geracao(pasta, geracao)
+        return True, msg, atual
+    publicar_geracao(pasta, 'base', geracao)
+    return True, msg, db_path
+
+
+def _mesma_ingestao(db_atual, db_novo, table_name):
+    ingestoes = []
+    for db in (db_atual, db_novo):
+        conn = sqlite3.connect(db)
+        try:
+            ingestoes.append(ultima_ingestao(conn, table_name))
+        finally:
+            conn.close()
+    return ingestoes[0] == ingestoes[1]
+
+
+def _montar_modelo(parametros, pasta, db_path, progresso, perfil):
+    """
+    Treina o modelo numa geração nova (o incremental parte de uma cópia do
+    publicado), confere se ele carrega e prevê, e publica.
+    Retorna (sucesso, mensagem, métricas).
+    """
+    atual = caminho_publicado(pasta, 'modelo')
+    geracao, model_path = preparar_geracao(pasta, 'modelo')
+    metricas = None
+    try:
+        if parametros.get('modo_treino') == 'incremental':
+            if atual.exists():
+                vincular_modelo(atual, model_path)
+            sucesso, msg, metricas = atualizar_modelo_incremental(
+                db_path, parametros['table_name'], model_path, progresso=progresso, perfil=perfil
+            )
+        else:
+            sucesso, msg = treinar_novo_modelo(
+                db_path, parametros['table_name'], model_path, progresso=progresso,
+                orcamento_selecao=parametros.get('orcamento_selecao', ORCAMENTO_SELECAO_S),
+                motor=parametros.get('motor', MOTOR_PADRAO),
+                compressao=parametros.get('compressao', COMPRESSAO_PADRAO),
+                max_profundidade=parametros.get('max_profundidade'),
+                max_folhas=parametros.get('max_folhas'),
+                perfil=perfil
+            )
+        if sucesso:
+            progresso("Validando o modelo novo")
+            perfil.etapa("Validação do modelo")
+            sucesso_validacao, msg_validacao = validar_modelo(model_path, db_path, parametros['table_name'])
+            if not sucesso_validacao:
+                sucesso, msg = False, msg_validacao
+    except Exception:
+        descartar_geracao(pasta, geracao)
+        raise
+    if not sucesso:
+        descartar_geracao(pasta, geracao)
+        return False, msg, metricas
+    if atual.exists() and os.path.samefile(atual, model_path):
+        # O incremental manteve o modelo (nenhuma linha nova): o publicado continua
+        descartar_geracao(pasta, geracao)
+        return True, msg, metricas
+    publicar_geracao(pasta, 'modelo', geracao)
+    return True, msg, metricas
+
+
+def _carga_e_treino(parametros, progresso, perfil):
+    """
+    Etapa 1: montar e publicar a base. Etapa 2: re-treino completo ou
+    incremental, publicado como modelo novo. Se uma etapa falhar, a geração
+    dela é descartada e o app segue com a base e o modelo publicados antes.
+    """
+    pasta = Path(parametros['pasta_dados'])
+    sucesso_db, msg_db, db_path = _montar_base(
+        parametros, pasta, lambda etapa, **dados: progresso(f"Etapa 1/2: {etapa}", **dados), perfil
+    )
+    if not sucesso_db:
+        return False, f"Falha ao processar a base: {msg_db}", None
+
+    progresso_treino = lambda etapa, **dados: progresso(f"Etapa 2/2: {etapa}", **dados)
+    progresso_treino("Treinando o modelo")
+    sucesso_ml, msg_ml, metricas = _montar_modelo(parametros, pasta, db_path, progresso_treino, perfil)
+    if not sucesso_ml:
+        return False, f"{msg_db} Falha ao treinar o modelo: {msg_ml}", metricas
+    return True, f"{msg_db} {msg_ml}", metricas
+
+
+# Tipo da tarefa -> função executada no processo do pool (recebe parametros, progresso e perfil)
+TIPOS_TAREFA = {
+    'carga_e_treino': _carga_e_treino,
+}
+
+
+def executar_tarefa(caminho_controle, tarefa_id):
+    """
+    Roda dentro do processo do pool: assume a tarefa (se outro processo não
+    a assumiu antes), executa e grava no controle.db o início, o progresso de
+    cada etapa, o resultado (ou o erro) e o perfil da execução (mesmo quando
+    ela falha, para mostrar onde parou).
+    """
+    # Uma conexão para a tarefa inteira: o esquema é conferido só aqui, não a cada pedaço
+    conn = conectar_controle(caminho_controle)
+    try:
+        _executar_assumida(conn, caminho_controle, tarefa_id)
+    finally:
+        conn.close()
+
+
+def _executar_assumida(conn, caminho_controle, tarefa_id):
+    assumida = _atualizar(conn, tarefa_id, estados=('na_fila',), estado='executando',
+                          iniciada_em=_agora(), etapa='Iniciando', dono=identificar_processo(),
+                          batimento=time.time())
+    if not assumida:
+        return
+    tarefa = ler_tarefa(caminho_controle, tarefa_id)
+
+    def progresso(etapa, **dados):
+        # Como o batimento, o progresso é só informativo: uma falha ao gravá-lo
+        # (ex.: o controle.db travado além do timeout) não derruba a tarefa
+        try:
+            _atualizar(conn, tarefa_id, etapa=etapa,
+                       progresso=json.dumps(dados) if dados else None, batimento=time.time())
+        except sqlite3.Error as e:
+            print(f"Aviso: progresso da tarefa #{tarefa_id} não gravado ({e}).")
+
+    # Batimento em paralelo: etapas longas (ex.: o ajuste final) não avisam progresso
+    parar_batimento = threading.Event()
+
+    def bater():
+        # Conexões do sqlite3 não são compartilhadas entre threads: o batimento tem a sua
+        conn_batimento = conectar_controle(caminho_controle, criar=False)
+        try:
+            while not parar_batimento.wait(INTERVALO_BATIMENTO_S):
+                try:
+                    _atualizar(conn_batimento, tarefa_id, batimento=time.time())
+                except sqlite3.Error as e:
+                    print(f"Aviso: batimento da tarefa #{tarefa_id} não gravado ({e}).")
+        finally:
+            conn_batimento.close()
+
+    threading.Thread(target=bater, daemon=True).start()
+    parametros = tarefa['parametros']
+    perfil = Perfilador()
+    try:
+        sucesso, mensagem, resultado = TIPOS_TAREFA[tarefa['tipo']](parametros, progresso, perfil)
+        estado = 'concluida' if sucesso else 'falhou'
+    except Exception as e:
+        traceback.print_exc()
+        estado, mensagem, resultado = 'falhou', f"Um erro inesperado ocorreu: {e}", None
+    finally:
+        parar_batimento.set()
+        descartar_envio(parametros)
+    perfil.concluir().imprimir()
+    try:
+        gravar_perfil(caminho_controle, perfil, tarefa['tipo'], estado == 'concluida', tarefa_id)
+    except sqlite3.Error as e:
+        # O perfil é só diagnóstico: não muda o resultado da tarefa
+        print(f"Aviso: não foi possível gravar o perfil da tarefa #{tarefa_id} ({e}).")
+    _atualizar(conn, tarefa_id, estado=estado, etapa='Concluída' if estado == 'concluida' else 'Falhou',
+               progresso=None, mensagem=mensagem, resultado=json.dumps(resultado) if resultado else None,
+               concluida_em=_agora())
+
+
+# ==============================================================================
+# POOL DE PROCESSOS (Um por servidor do Streamlit)
+# ==============================================================================
+# Fica no módulo (e não no st.cache_resource) para sobreviver ao
+# st.cache_resource.clear() feito depois de cada carga
+_pool = None
+_trava_pool = threading.Lock()
+
+
+def recuperar_tarefas(caminho_controle):
+    """
+    Chamada uma vez por servidor, antes do pool existir: tarefas 'executando'
+    cujo dono morreu ou parou de bater são marcadas como interrompidas (as de
+    outro servidor ainda vivo ficam como estão); as que estavam 'na_fila' são
+    devolvidas para serem enviadas de novo (se outro servidor já as enviou,
+    só um processo consegue assumi-las).
+    """
+    conn = conectar_controle(caminho_controle)
+    conn.row_factory = sqlite3.Row
+    try:
+        interrompidas = conn.execute("SELECT * FROM tarefas WHERE estado = 'executando'").fetchall()
+        na_fila = [linha[0] for linha in conn.execute("SELECT id FROM tarefas WHERE estado = 'na_fila' ORDER BY id")]
+        for linha in interrompidas:
+            tarefa = _linha_para_dict(linha)
+            if dono_ativo(tarefa):
+                continue
+            marcada = _atualizar(conn, tarefa['id'], estados=('executando',), estado='interrompida',
+                                 etapa='Interrompida', concluida_em=_agora(),
+                                 mensagem=f"O processo da tarefa parou durante a etapa '{tarefa['etapa']}'. "
+                                          "Nenhuma carga parcial foi publicada; envie o arquivo novamente.")
+            if marcada:
+                print(f"Tarefa #{tarefa['id']} estava em execução num processo que parou: marcada como interrompida.")
+                descartar_envio(tarefa['parametros'])
+    finally:
+        conn.close()
+    return na_fila
+
+
+def obter_pool(caminho_controle):
+    """Pool com um único processo (as tarefas escrevem no mesmo banco, uma por vez)."""
+    global _pool
+    with _trava_pool:
+        if _pool is None:
+            na_fila = recuperar_tarefas(caminho_controle)
+            _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            for tarefa_id in na_fila:
+                print(f"Retomando a tarefa #{tarefa_id} que estava na fila.")
+                _submeter(_pool, caminho_controle, tarefa_id)
+        return _pool
+
+
+def _submeter(pool, caminho_controle, tarefa_id):
+    futuro = pool.submit(executar_tarefa, str(caminho_controle), tarefa_id)
+
+    def ao_terminar(futuro):
+        # executar_tarefa já grava os próprios erros; aqui só chega o que
+        # derrubou o processo do pool (ex.: falta de memória)
+        erro = futuro.exception()
+        if erro is None:
+            return
+        print(f"Tarefa #{tarefa_id}: o processo do pool falhou ({erro!r}).")
+        tarefa = ler_tarefa(caminho_controle, tarefa_id)
+        # Uma tarefa que outro processo (vivo) assumiu não é deste pool
+        if tarefa is not None and tarefa['estado'] in ESTADOS_ATIVOS and not dono_ativo(tarefa):
+            conn = conectar_controle(caminho_controle)
+            try:
+                marcada = _atualizar(conn, tarefa_id, estados=(tarefa['estado'],), estado='falhou',
+                                     etapa='Falhou', concluida_em=_agora(),
+                                     mensagem=f"O processo da tarefa foi encerrado inesperadamente: {erro!r}")
+            finally:
+                conn.close()
+            if marcada:
+                descartar_envio(tarefa['parametros'])
+        if isinstance(erro, BrokenProcessPool):
+            # Um pool quebrado não aceita novas tarefas: o próximo envio cria outro
+            global _pool
+            with _trava_pool:
+                if _pool is pool:
+                    _pool = None
+
+    futuro.add_done_callback(ao_terminar)
+
+
+def enfileirar_tarefa(caminho_controle, tipo, parametros):
+    """Registra a tarefa e a envia ao pool. Retorna o id da tarefa."""
+    if tipo not in TIPOS_TAREFA:
+        raise ValueError(f"Tipo de tarefa inválido: '{tipo}'. Use {list(TIPOS_TAREFA)}.")
+    pool = obter_pool(caminho_controle)
+    tarefa_id = criar_tarefa(caminho_controle, tipo, parametros)
+    _submeter(pool, caminho_controle, tarefa_id)
+    return tarefa_id
+
+
+def tabela_de_tarefas(tarefas):
+    """Resumo das tarefas para exibição (uma linha por tarefa)."""
+    rotulos = {'na_fila': 'Na fila', 'executando': 'Executando', 'concluida': 'Concluída',
+               'falhou': 'Falhou', 'interrompida': 'Interrompida'}
+    linhas = []
+    for tarefa in tarefas:
+        inicio = datetime.fromisoformat(tarefa['iniciada_em']) if tarefa['iniciada_em'] else None
+        fim = datetime.fromisoformat(tarefa['concluida_em']) if tarefa['concluida_em'] else datetime.now()
+        linhas.append({
+            'Tarefa': tarefa['id'],
+            'Arquivo': tarefa['parametros'].get('nome_arquivo', ''),
+            'Estado': rotulos.get(tarefa['estado'], tarefa['estado']),
+            'Etapa': tarefa['etapa'],
+            'Criada em': tarefa['criada_em'],
+            'Duração (s)': round((fim - inicio).total_seconds()) if inicio else None,
+            'Mensagem': tarefa['mensagem'] or '',
+        })
+    return pd.DataFrame(linhas)